@@ -1,5 +1,20 @@
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+
+from .config import ACTIVITY_BUFFERED, ACTIVITY_FLUSH_INTERVAL, ACTIVITY_FLUSH_SIZE
+from .database import SessionLocal, on_commit
+from .feed_groups import add_to_group
+from .feed_stream import ActivityEvent, publish_local, stash
 from .models import Activity
+from .timeline import fan_out
+from .write_versions import ACTIVITIES, bump_version
+from .writer import write_turn
+
+logger = logging.getLogger(__name__)
 
 
 def log_activity(
@@ -13,17 +28,144 @@ def log_activity(
     """
     A reusable function to record actions in the Activity table.
     Makes the feed consistent and clean.
+    Also pushes the activity into followers' home timelines and its feed
+    group, bumps the feed's write version, and reaches /feed/stream
+    subscribers once the caller commits.
+
+    The activity joins the caller's transaction: it is written when the
+    caller commits, so each request costs a single commit. With
+    ACTIVITY_BUFFERED on it is queued for the background writer instead,
+    once the caller commits (never for a rolled-back action), and None is
+    returned.
     """
 
+    if ACTIVITY_BUFFERED:
+        on_commit(db, activity_writer.enqueue, {
+            "actor_id": actor_id,
+            "verb": verb,
+            "object_type": object_type,
+            "object_id": object_id,
+            "target_user_id": target_user_id,
+            "created_at": datetime.utcnow(),
+        })
+        return None
+
+    # Set here rather than by the server default, which flush() would have to
+    # read back with an extra SELECT; seconds only, as SQLite stores it
     activity = Activity(
         actor_id=actor_id,
         verb=verb,
         object_type=object_type,
         object_id=object_id,
-        target_user_id=target_user_id
+        target_user_id=target_user_id,
+        created_at=datetime.utcnow().replace(microsecond=0),
     )
     db.add(activity)
-    db.commit()
-    db.refresh(activity)
+    db.flush()
+
+    fan_out(db, activity)
+    add_to_group(db, activity.id, actor_id, verb, object_id, target_user_id, activity.created_at)
+    bump_version(db, ACTIVITIES)
+    stash(db, ActivityEvent(
+        id=activity.id,
+        actor_id=actor_id,
+        verb=verb,
+        object_type=object_type,
+        object_id=object_id,
+        target_user_id=target_user_id,
+        created_at=activity.created_at,
+    ))
 
     return activity
+
+
+class ActivityWriter:
+    """
+    Buffers activities in memory and writes them in batches from a background
+    thread: one multi-row INSERT and one commit per batch. A batch is written
+    once ACTIVITY_FLUSH_SIZE rows are waiting or ACTIVITY_FLUSH_INTERVAL
+    seconds have passed, and whatever is left is written on shutdown.
+    """
+
+    def __init__(self, flush_size: int, flush_interval: float):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def enqueue(self, row: dict):
+        with self._cond:
+            self._pending.append(row)
+            if len(self._pending) >= self.flush_size:
+                self._cond.notify()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run, name="activity-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the flusher thread and writes anything still buffered.
+        """
+        if self._thread is not None:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def flush(self):
+        with self._cond:
+            rows, self._pending = self._pending, []
+
+        if not rows:
+            return
+
+        db = SessionLocal()
+        try:
+            with write_turn():
+                inserted = self._write(db, rows)
+            publish_local([ActivityEvent(id=row.id, **fields) for row, fields in zip(inserted, rows)])
+        except Exception:
+            db.rollback()
+            logger.exception("Failed to write %d buffered activities; will retry", len(rows))
+            with self._cond:
+                self._pending[:0] = rows
+        finally:
+            db.close()
+
+    def _write(self, db: Session, rows):
+        inserted = db.execute(
+            insert(Activity)
+            .returning(Activity.id, Activity.actor_id, sort_by_parameter_order=True),
+            rows,
+        ).all()
+
+        for activity, fields in zip(inserted, rows):
+            fan_out(db, activity)
+            add_to_group(db, activity.id, fields["actor_id"], fields["verb"], fields["object_id"],
+                         fields["target_user_id"], fields["created_at"])
+        bump_version(db, ACTIVITIES)
+
+        db.commit()
+        return inserted
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._pending) < self.flush_size:
+                    self._cond.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            self.flush()
+
+
+activity_writer = ActivityWriter(ACTIVITY_FLUSH_SIZE, ACTIVITY_FLUSH_INTERVAL)
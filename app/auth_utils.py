@@ -3,25 +3,24 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from jose import jwt, JWTError
 
-from .database import SessionLocal
+from .dependencies import DbSession, get_db, run_db
 from .models import User
+from .principal_cache import Principal, principal_cache
 from .security import SECRET_KEY, ALGORITHM
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def _load_principal(db: Session, user_id: int):
+    row = db.query(User.id, User.name, User.role, User.is_active).filter(User.id == user_id).first()
+    return Principal(*row) if row else None
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: DbSession = Depends(get_db)):
     """
-    Extracts user info from the JWT token and returns the user object.
+    Extracts user info from the JWT token and returns the caller's Principal.
+    Served from the principal cache when possible, so no query is issued.
     """
     if not token:
         raise HTTPException(status_code=401, detail="Authentication required")
@@ -36,15 +35,25 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    user = db.query(User).filter(User.id == int(user_id)).first()
+    user_id = int(user_id)
+    principal = principal_cache.get(user_id)
+
+    if principal is None:
+        generation = principal_cache.generation
+        principal = await run_db(db, _load_principal, user_id)
+
+        if not principal:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        principal_cache.put(principal, generation)
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    if not principal.is_active:
+        raise HTTPException(status_code=403, detail="Account is deactivated")
 
-    return user
+    return principal
 
 
-def require_admin(current_user: User = Depends(get_current_user)):
+async def require_admin(current_user: Principal = Depends(get_current_user)):
     """
     Allows only admins or owner.
     """
@@ -53,7 +62,7 @@ def require_admin(current_user: User = Depends(get_current_user)):
     return current_user
 
 
-def require_owner(current_user: User = Depends(get_current_user)):
+async def require_owner(current_user: Principal = Depends(get_current_user)):
     """
     Allows only owner user role.
     """
@@ -0,0 +1,152 @@
+import os
+
+# -------------------------------
+# Runtime Settings
+# -------------------------------
+
+# Everything here is read from environment variables so deployments can be
+# tuned (and benchmarked) without code changes.
+
+# "async": routers run database work on aiosqlite without leaving the event loop.
+# "sync":  routers hand database work to Starlette's threadpool (pysqlite).
+DB_MODE = os.getenv("DB_MODE", "async").lower()
+
+if DB_MODE not in ("async", "sync"):
+    raise RuntimeError(f"DB_MODE must be 'async' or 'sync', got {DB_MODE!r}")
+
+
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+# When on, log_activity queues activities in memory and a background thread
+# writes them in batches instead of inside each request's transaction.
+ACTIVITY_BUFFERED = _env_flag("ACTIVITY_BUFFERED")
+ACTIVITY_FLUSH_SIZE = int(os.getenv("ACTIVITY_FLUSH_SIZE", "500"))          # rows
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "1.0"))  # seconds
+
+# Authenticated principals (id, name, role, is_active) are cached in-process.
+# The TTL bounds how stale a cached role can be; 0 disables the cache.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))       # seconds
+# With several worker processes, how often each checks whether another one
+# changed a user's role or status (and clears its cache if so).
+PRINCIPAL_CACHE_SYNC_INTERVAL = float(os.getenv("PRINCIPAL_CACHE_SYNC_INTERVAL", "1"))   # seconds
+
+# Argon2 cost parameters. Stored hashes made with other values are upgraded
+# on the user's next successful login.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))   # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+
+# Password hashing runs in a dedicated process pool. Once HASH_QUEUE_LIMIT
+# hashes are in flight, signup/login fail fast with 503.
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", str(max(1, (os.cpu_count() or 2) // 2))))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", str(HASH_POOL_SIZE * 8)))
+
+# User deletion runs as a background job: each chunk deletes at most this
+# many rows in its own transaction, then pauses so other writers get the lock.
+DELETION_CHUNK_SIZE = int(os.getenv("DELETION_CHUNK_SIZE", "500"))
+DELETION_PAUSE = float(os.getenv("DELETION_PAUSE", "0.05"))   # seconds
+
+# GET /feed/stream: events queued per connection before the oldest are
+# dropped, keep-alive interval, and how many missed activities a
+# reconnecting client (Last-Event-ID) is sent from the database.
+FEED_STREAM_QUEUE_SIZE = int(os.getenv("FEED_STREAM_QUEUE_SIZE", "256"))
+FEED_STREAM_HEARTBEAT = float(os.getenv("FEED_STREAM_HEARTBEAT", "15"))   # seconds
+FEED_STREAM_REPLAY_LIMIT = int(os.getenv("FEED_STREAM_REPLAY_LIMIT", "500"))
+# With several worker processes, each one reads new activities from the table
+# this often (and this many per query) to push other workers' writes too.
+FEED_STREAM_POLL_INTERVAL = float(os.getenv("FEED_STREAM_POLL_INTERVAL", "1"))   # seconds
+FEED_STREAM_POLL_BATCH = int(os.getenv("FEED_STREAM_POLL_BATCH", "500"))
+
+# GET /feed/grouped: activities of the same kind by one actor (or aimed at one
+# user) within this many seconds of the first are shown as one entry, with
+# up to FEED_GROUP_SAMPLE_SIZE example ids.
+FEED_GROUP_WINDOW = float(os.getenv("FEED_GROUP_WINDOW", "3600"))   # seconds
+FEED_GROUP_SAMPLE_SIZE = int(os.getenv("FEED_GROUP_SAMPLE_SIZE", "5"))
+
+# GET /feed/ keeps rendered pages in memory, shared by every caller with the
+# same blockers, up to this many bytes of JSON per process. 0 disables it.
+FEED_CACHE_BYTES = int(os.getenv("FEED_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+# Activity retention, run by a background maintenance thread every
+# RETENTION_INTERVAL seconds. Activities older than ACTIVITY_RETENTION_DAYS
+# are appended to NDJSON.gz files in ACTIVITY_ARCHIVE_DIR, then deleted
+# (0 keeps everything). With RETENTION_COMPACT_PAIRS on, like/unlike,
+# follow/unfollow and block/unblock pairs that cancel out are dropped.
+# Every pass also trims home-timeline inboxes over their size cap and
+# deletes expired refresh tokens and revoked token families.
+# Rows are removed RETENTION_BATCH_SIZE at a time with RETENTION_PAUSE
+# between batches, then freed pages are returned by an incremental vacuum.
+ACTIVITY_RETENTION_DAYS = int(os.getenv("ACTIVITY_RETENTION_DAYS", "0"))
+ACTIVITY_ARCHIVE_DIR = os.getenv("ACTIVITY_ARCHIVE_DIR", "./archive")
+RETENTION_COMPACT_PAIRS = _env_flag("RETENTION_COMPACT_PAIRS")
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))   # seconds
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+RETENTION_PAUSE = float(os.getenv("RETENTION_PAUSE", "0.05"))          # seconds
+
+# GET /posts/trending: a like's weight halves every TRENDING_HALF_LIFE
+# seconds. The in-memory ranking is checkpointed to posts.trending_score every
+# TRENDING_CHECKPOINT_INTERVAL seconds and forgets posts whose hotness (in
+# fresh likes) falls below TRENDING_MIN_HOTNESS.
+TRENDING_HALF_LIFE = float(os.getenv("TRENDING_HALF_LIFE", str(6 * 3600)))
+TRENDING_CHECKPOINT_INTERVAL = float(os.getenv("TRENDING_CHECKPOINT_INTERVAL", "30"))
+TRENDING_MIN_HOTNESS = float(os.getenv("TRENDING_MIN_HOTNESS", "0.01"))
+
+# Admin exports read and serialise this many rows per batch
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Request metrics: a request that runs the same SQL statement this many
+# times is logged and counted as a likely N+1. Set METRICS_TOKEN to require
+# "Authorization: Bearer <token>" on /metrics.
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# -------------------------------
+# Storage Profile
+# -------------------------------
+
+# A SQLite or PostgreSQL SQLAlchemy URL. The async engine uses the matching
+# async driver (aiosqlite / asyncpg) unless ASYNC_DATABASE_URL is given.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.db")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# Connection pool (per engine, per process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+# PRAGMAs applied to every new SQLite connection. WAL lets readers run
+# alongside the writer; with synchronous=NORMAL a commit no longer waits for
+# an fsync (durability is only at risk on power loss, never corruption).
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))   # bytes
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))   # pages, or KiB if negative
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # ms
+
+if SQLITE_JOURNAL_MODE not in ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"):
+    raise RuntimeError(f"Unsupported SQLITE_JOURNAL_MODE {SQLITE_JOURNAL_MODE!r}")
+
+if SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise RuntimeError(f"Unsupported SQLITE_SYNCHRONOUS {SQLITE_SYNCHRONOUS!r}")
+
+# -------------------------------
+# Worker Processes
+# -------------------------------
+
+# Number of server processes (uvicorn and gunicorn both read it). Above 1,
+# in-memory indexes that must see every write (social graph, trending
+# ranking) give way to their SQL paths, and background maintenance runs in
+# one process only.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+MULTI_PROCESS = WEB_CONCURRENCY > 1
+
+# Single-writer mode (on by default with several processes): router writes
+# are queued to one writer thread per process, and the writer threads take
+# turns through an exclusive lock on WRITE_LOCK_PATH (default: next to the
+# SQLite file). Writes already queued when a thread gets the lock, up to
+# WRITE_BATCH_SIZE, run in the same turn.
+SINGLE_WRITER = _env_flag("SINGLE_WRITER", "1" if MULTI_PROCESS else "0")
+WRITE_LOCK_PATH = os.getenv("WRITE_LOCK_PATH")
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "32"))
@@ -0,0 +1,81 @@
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from .models import Follow, Like, Post, User
+from .write_versions import POSTS, bump_version
+
+
+# -------------------------------
+# Denormalised counters
+# -------------------------------
+# Post.like_count, User.follower_count and User.following_count are updated
+# in the same transaction as the like/follow rows they count, so listings
+# can return them without COUNT(*) per row. `reconcile_counters` repairs
+# any drift in bulk.
+
+COUNTER_COLUMNS = {"posts.like_count", "users.follower_count", "users.following_count"}
+
+
+def adjust_like_count(db: Session, post_id: int, delta: int):
+    """
+    Returns the post's author id (None if the post is gone).
+    """
+    return db.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(like_count=Post.like_count + delta)
+        .returning(Post.user_id)
+    ).scalar()
+
+
+def adjust_follow_counts(db: Session, follower_id: int, following_id: int, delta: int):
+    db.execute(
+        update(User).where(User.id == follower_id).values(following_count=User.following_count + delta)
+    )
+    db.execute(
+        update(User).where(User.id == following_id).values(follower_count=User.follower_count + delta)
+    )
+
+
+def reconcile_counters(db: Session) -> dict:
+    """
+    Recomputes every counter from the source tables in three set-based
+    UPDATEs, touching only rows that drifted. Returns rows repaired per counter.
+    """
+    repaired = {}
+
+    likes = (
+        select(func.count()).select_from(Like).where(Like.post_id == Post.id).scalar_subquery()
+    )
+    repaired["posts.like_count"] = db.execute(
+        update(Post).where(Post.like_count != likes).values(like_count=likes)
+    ).rowcount
+
+    followers = (
+        select(func.count()).select_from(Follow).where(Follow.following_id == User.id).scalar_subquery()
+    )
+    repaired["users.follower_count"] = db.execute(
+        update(User).where(User.follower_count != followers).values(follower_count=followers)
+    ).rowcount
+
+    following = (
+        select(func.count()).select_from(Follow).where(Follow.follower_id == User.id).scalar_subquery()
+    )
+    repaired["users.following_count"] = db.execute(
+        update(User).where(User.following_count != following).values(following_count=following)
+    ).rowcount
+
+    if repaired["posts.like_count"]:
+        bump_version(db, POSTS)
+    db.commit()
+    return repaired
+
+
+if __name__ == "__main__":
+    # python -m app.counters  ->  repair drifted counters in place
+    from .database import SessionLocal, init_db
+
+    init_db()
+    with SessionLocal() as session:
+        for counter, rows in reconcile_counters(session).items():
+            print(f"{counter}: {rows} row(s) repaired")
@@ -1,12 +1,245 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import logging
+import time
 
-DATABASE_URL = "sqlite:///./database.db"
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
+from .metrics import record_query
+from .config import (
+    ASYNC_DATABASE_URL as _ASYNC_DATABASE_URL,
+    DATABASE_URL as _DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_SYNCHRONOUS,
 )
 
+# Backends the write paths support (ON CONFLICT upserts and RETURNING), and
+# the async driver used for DB_MODE=async on each
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def _normalise_url(url: str):
+    # Hosting providers often hand out postgres://, which SQLAlchemy rejects
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return make_url(url)
+
+
+def _async_url(url):
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No async driver known for {backend}; set ASYNC_DATABASE_URL")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+DATABASE_URL = _normalise_url(_DATABASE_URL)
+ASYNC_DATABASE_URL = (
+    _normalise_url(_ASYNC_DATABASE_URL) if _ASYNC_DATABASE_URL else _async_url(DATABASE_URL)
+)
+
+IS_SQLITE = DATABASE_URL.get_backend_name() == "sqlite"
+
+
+def _engine_options(url) -> dict:
+    options = {}
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            return options    # single shared connection, no pool to size
+    options["pool_size"] = DB_POOL_SIZE
+    options["max_overflow"] = DB_MAX_OVERFLOW
+    return options
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # Before journal_mode: switching to WAL writes the header of a new file.
+    # Existing databases need one VACUUM (python -m app.retention --convert)
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# Used when DB_MODE=async. Objects stay readable after commit because they
+# may be touched outside of `run_sync`, where lazy refreshes cannot happen.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
+
+# ---- per-request query accounting (see app/metrics.py) ----
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_query(statement, time.perf_counter() - conn.info["query_started"].pop())
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
 Base = declarative_base()
+
+logger = logging.getLogger(__name__)
+
+
+# ---- post-commit callbacks ----
+
+def on_commit(db, fn, *args):
+    """
+    Runs `fn(*args)` once the session's current transaction commits; dropped
+    on rollback. Use it for in-memory state that must mirror committed rows.
+    Callbacks run before /feed/stream publishes the same transaction's events.
+    """
+    db.info.setdefault("on_commit", []).append((fn, args))
+
+
+@event.listens_for(Session, "after_commit", insert=True)   # ahead of other listeners
+def _run_on_commit(session):
+    for fn, args in session.info.pop("on_commit", ()):
+        fn(*args)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_on_commit(session):
+    session.info.pop("on_commit", None)
+
+
+def dialect_insert(db, model):
+    """
+    Returns the backend-specific `insert(model)` construct, which supports
+    `.on_conflict_do_nothing()` (SQLite and PostgreSQL).
+    """
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise NotImplementedError(f"ON CONFLICT inserts are not supported on {dialect}")
+
+    return insert(model)
+
+
+def init_db():
+    """
+    Creates missing tables, then brings existing tables up to date with the
+    models: adds new columns and creates indexes added after the table
+    existed (`create_all` only handles tables it creates). Duplicates
+    removed for a new unique index may have been counted, so counters are
+    then reconciled.
+    Models must be imported before this is called.
+    Returns the "table.column" names that were added.
+    """
+    # Fail at startup, not on the first write
+    if engine.dialect.name not in ASYNC_DRIVERS:
+        raise RuntimeError(
+            f"Unsupported database backend {engine.dialect.name}: use SQLite or PostgreSQL"
+        )
+
+    Base.metadata.create_all(bind=engine)
+
+    added = []
+    removed = 0
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+
+        for table in Base.metadata.sorted_tables:
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                    added.append(f"{table.name}.{column.name}")
+
+            existing_indexes = {ix["name"] for ix in inspector.get_indexes(table.name)}
+
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                if index.unique:
+                    removed += _drop_duplicates(conn, table, index)
+                index.create(bind=conn)
+
+    if removed:
+        from .counters import reconcile_counters
+
+        with SessionLocal() as session:
+            repaired = reconcile_counters(session)
+        logger.warning(
+            "Reconciled counters after removing %d duplicate row(s): %s",
+            removed, ", ".join(f"{counter}={rows}" for counter, rows in repaired.items()),
+        )
+
+    return added
+
+
+def _drop_duplicates(conn, table, index) -> int:
+    """
+    Keeps the oldest row of each duplicate group so a new unique index can be
+    built. Returns the number of rows removed.
+    """
+    keys = ", ".join(col.name for col in index.columns)
+    removed = conn.exec_driver_sql(
+        f"DELETE FROM {table.name} WHERE id NOT IN "
+        f"(SELECT MIN(id) FROM {table.name} GROUP BY {keys})"
+    ).rowcount
+
+    if removed:
+        logger.warning("Removed %d duplicate row(s) from %s before creating %s", removed, table.name, index.name)
+    return removed
+
+
+SYNCHRONOUS_LEVELS = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}
+AUTO_VACUUM_MODES = {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}
+
+
+def storage_profile() -> dict:
+    """
+    The settings actually in effect, read back from a live connection
+    (SQLite may refuse a journal mode, e.g. WAL on some network filesystems).
+    """
+    profile = {
+        "url": DATABASE_URL.render_as_string(hide_password=True),
+        "async_url": ASYNC_DATABASE_URL.render_as_string(hide_password=True),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+    }
+
+    if IS_SQLITE:
+        with engine.connect() as conn:
+            for pragma in ("journal_mode", "synchronous", "mmap_size", "cache_size", "busy_timeout", "auto_vacuum"):
+                profile[pragma] = conn.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+        profile["synchronous"] = SYNCHRONOUS_LEVELS.get(profile["synchronous"], profile["synchronous"])
+        profile["auto_vacuum"] = AUTO_VACUUM_MODES.get(profile["auto_vacuum"], profile["auto_vacuum"])
+
+    return profile
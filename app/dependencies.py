@@ -1,8 +1,49 @@
-from .database import SessionLocal
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from typing import Union
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .config import DB_MODE, SINGLE_WRITER
+from .database import AsyncSessionLocal, SessionLocal
+from .writer import writer
+
+# What `get_db` yields depends on DB_MODE; routers only touch it via `run_db`.
+DbSession = Union[AsyncSession, Session]
+
+
+async def get_db():
+    if DB_MODE == "async":
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+async def run_db(db: DbSession, fn, *args, **kwargs):
+    """
+    Runs `fn(session, *args, **kwargs)` - plain synchronous ORM code - against
+    the request's session.
+
+    In async mode it runs through `AsyncSession.run_sync`, so the queries are
+    awaited on aiosqlite inside the event loop. In sync mode it is sent to
+    the threadpool exactly like a sync `def` endpoint would be.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+async def run_write(db: DbSession, fn, *args, **kwargs):
+    """
+    `run_db` for helpers that write. With SINGLE_WRITER on, `fn` is queued
+    to this process's writer thread and runs in its own session there
+    (see app/writer.py); the request's session is left untouched.
+    """
+    if SINGLE_WRITER:
+        return await writer.run(fn, *args, **kwargs)
+    return await run_db(db, fn, *args, **kwargs)
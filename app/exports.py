@@ -0,0 +1,135 @@
+"""
+Streaming table exports for analytics.
+
+Rows are read in id order with server-side batching (`yield_per`) and
+serialised batch by batch, so memory stays flat whatever the table size.
+
+    python -m app.exports activities --format csv --since 2024-01-01 -o activities.csv
+    python -m app.exports likes --after-id 120000 --gzip -o likes.ndjson.gz
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import select
+
+from .config import EXPORT_BATCH_SIZE
+from .database import SessionLocal
+from .models import Activity, Follow, Like, Post
+
+EXPORTABLE = {
+    "activities": Activity,
+    "posts": Post,
+    "follows": Follow,
+    "likes": Like,
+}
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # created_at is stored as naive UTC; a bound with an offset means that instant
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def iter_batches(table: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 after_id: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Yields (column names, list of row tuples) per batch, in id order.
+    `after_id` is the watermark of a previous export: only newer rows are read.
+    `since` / `until` without a UTC offset are taken as UTC.
+    Opens its own session so it can outlive the request's.
+    """
+    model = EXPORTABLE[table]
+    columns = list(model.__table__.columns)
+    names = [col.name for col in columns]
+
+    query = select(*columns).order_by(model.id)
+    if after_id is not None:
+        query = query.where(model.id > after_id)
+    if since is not None:
+        query = query.where(model.created_at >= _naive_utc(since))
+    if until is not None:
+        query = query.where(model.created_at < _naive_utc(until))
+
+    with SessionLocal() as db:
+        result = db.execute(query.execution_options(yield_per=batch_size))
+        for batch in result.partitions():
+            yield names, batch
+
+
+def ndjson_chunks(batches):
+    for names, rows in batches:
+        yield "".join(
+            json.dumps({name: _value(v) for name, v in zip(names, row)}, ensure_ascii=False) + "\n"
+            for row in rows
+        ).encode()
+
+
+def csv_chunks(batches):
+    header_written = False
+    for names, rows in batches:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not header_written:
+            writer.writerow(names)
+            header_written = True
+        writer.writerows([_value(v) for v in row] for row in rows)
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks):
+    """
+    Compresses a byte stream on the fly (gzip container, one member).
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(table: str, fmt: str = "ndjson", compress: bool = False, **filters):
+    batches = iter_batches(table, **filters)
+    chunks = ndjson_chunks(batches) if fmt == "ndjson" else csv_chunks(batches)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("table", choices=EXPORTABLE)
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="created_at >= (ISO date/time)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="created_at < (ISO date/time)")
+    parser.add_argument("--after-id", type=int, help="only rows with a larger id (watermark)")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_stream(args.table, args.format, args.gzip,
+                                   since=args.since, until=args.until, after_id=args.after_id):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
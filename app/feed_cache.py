@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from .config import FEED_CACHE_BYTES
+
+
+class RenderedPageCache:
+    """
+    In-process LRU cache of rendered GET /feed/ pages (JSON bytes), keyed by
+    (sorted blocker ids, cursor, limit) at one activities write version. The feed
+    is the same global stream for everyone apart from blocked actors, so all
+    callers without blockers share one entry per page.
+
+    Every new activity (or deletion) bumps the write version; the first
+    lookup at a newer version drops every cached page. Entries are evicted
+    oldest-first once their total size passes `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.version = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._pages = OrderedDict()   # (blockers, cursor, limit) -> bytes
+        self._lock = threading.Lock()
+
+    def _advance(self, version: int):
+        # Caller holds the lock
+        if self.version is None or version > self.version:
+            if self._pages:
+                self.invalidations += 1
+            self._pages.clear()
+            self.size = 0
+            self.version = version
+
+    def get(self, version: int, key) -> Optional[bytes]:
+        with self._lock:
+            self._advance(version)
+            page = self._pages.get(key) if version == self.version else None
+            if page is None:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, version: int, key, page: bytes):
+        if len(page) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._advance(version)
+            if version != self.version:
+                return    # rendered from an older snapshot than what is cached now
+
+            previous = self._pages.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._pages[key] = page
+            self.size += len(page)
+
+            while self.size > self.max_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.size = 0
+            self.version = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "pages": len(self._pages),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+feed_page_cache = RenderedPageCache(FEED_CACHE_BYTES)
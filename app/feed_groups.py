@@ -0,0 +1,223 @@
+import argparse
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, or_, select
+from sqlalchemy.orm import Session
+
+from .config import FEED_GROUP_SAMPLE_SIZE, FEED_GROUP_WINDOW
+from .models import Activity, ActivityGroup
+
+
+# -------------------------------
+# Grouped activity feed
+# -------------------------------
+# Every activity joins exactly one group when it is written: the newest open
+# group with the same verb and either the same actor or the same target user,
+# or a new group of its own. A one-activity group matches on both keys; the
+# second activity decides which one the group keeps (the other becomes NULL).
+# GET /feed/grouped then pages the groups themselves, so reading never
+# revisits the activities behind them.
+
+def _sample(value, sample):
+    if value is None:
+        return sample
+    return ([value] + [v for v in sample if v != value])[:FEED_GROUP_SAMPLE_SIZE]
+
+
+def _new_group(activity_id, actor_id, verb, object_id, target_user_id, created_at) -> ActivityGroup:
+    return ActivityGroup(
+        verb=verb,
+        actor_id=actor_id,
+        target_user_id=target_user_id,
+        count=1,
+        first_activity_id=activity_id,
+        last_activity_id=activity_id,
+        sample_actor_ids=[actor_id],
+        sample_object_ids=_sample(object_id, []),
+        started_at=created_at,
+        updated_at=created_at,
+    )
+
+
+def _extend(group: ActivityGroup, activity_id, actor_id, object_id, target_user_id, created_at):
+    if group.actor_id != actor_id:
+        group.actor_id = None
+    if group.target_user_id != target_user_id:
+        group.target_user_id = None
+    group.count += 1
+    group.last_activity_id = activity_id
+    group.sample_actor_ids = _sample(actor_id, group.sample_actor_ids)
+    group.sample_object_ids = _sample(object_id, group.sample_object_ids)
+    group.updated_at = created_at
+
+
+def add_to_group(db: Session, activity_id: int, actor_id: int, verb: str,
+                 object_id: int = None, target_user_id: int = None, created_at: datetime = None):
+    """
+    Records one freshly inserted activity in its group, in the caller's transaction.
+    """
+    created_at = created_at or datetime.utcnow()
+
+    # One indexed lookup per key: with OR, SQLite walks the whole ORDER BY index instead
+    same_key = [ActivityGroup.actor_id == actor_id]
+    if target_user_id is not None:
+        same_key.append(ActivityGroup.target_user_id == target_user_id)
+
+    candidates = [
+        db.scalars(
+            select(ActivityGroup)
+            .where(
+                condition,
+                ActivityGroup.verb == verb,
+                ActivityGroup.started_at >= created_at - timedelta(seconds=FEED_GROUP_WINDOW),
+            )
+            .order_by(ActivityGroup.last_activity_id.desc())
+            .limit(1)
+        ).first()
+        for condition in same_key
+    ]
+    group = max(filter(None, candidates), key=lambda g: g.last_activity_id, default=None)
+
+    if group is None:
+        db.add(_new_group(activity_id, actor_id, verb, object_id, target_user_id, created_at))
+    else:
+        _extend(group, activity_id, actor_id, object_id, target_user_id, created_at)
+
+    # The session does not autoflush: make the group visible to the next activity
+    db.flush()
+
+
+def grouped_feed_query(blockers, limit: int, before_id: int = None):
+    """
+    One page of groups, most recently extended first. Groups whose single
+    actor blocked the reader are left out; multi-actor groups are filtered
+    by the caller (see visible_members).
+    """
+    query = (
+        select(ActivityGroup)
+        .where(or_(ActivityGroup.actor_id.is_(None), ActivityGroup.actor_id.not_in(blockers)))
+        .order_by(ActivityGroup.last_activity_id.desc())
+        .limit(limit)
+    )
+    if before_id is not None:
+        query = query.where(ActivityGroup.last_activity_id < before_id)
+    return query
+
+
+def visible_members(db: Session, group: ActivityGroup, blockers):
+    """
+    For a multi-actor group read by someone with `blockers`: None when no
+    blocker took part, otherwise (actor ids, object ids) sampled from the
+    other participants' activities, newest first. Activities are matched by
+    verb, target and the group's id range, so a blocker's activity that
+    went to their own group can still mark this one as filtered; that only
+    costs the reader the total.
+    """
+    in_group = [
+        Activity.verb == group.verb,
+        Activity.target_user_id == group.target_user_id,
+        Activity.id.between(group.first_activity_id, group.last_activity_id),
+    ]
+    blocked = db.scalar(
+        select(Activity.id).where(Activity.actor_id.in_(blockers), *in_group).limit(1)
+    )
+    if blocked is None:
+        return None
+
+    actor_ids, object_ids = [], []
+    rows = db.execute(
+        select(Activity.actor_id, Activity.object_id)
+        .where(Activity.actor_id.not_in(blockers), *in_group)
+        .order_by(Activity.id.desc())
+        .limit(group.count)
+    )
+    for actor_id, object_id in rows:
+        if actor_id not in actor_ids and len(actor_ids) < FEED_GROUP_SAMPLE_SIZE:
+            actor_ids.append(actor_id)
+        if object_id is not None and object_id not in object_ids and len(object_ids) < FEED_GROUP_SAMPLE_SIZE:
+            object_ids.append(object_id)
+    return actor_ids, object_ids
+
+
+GROUP_COLUMNS = [column.name for column in ActivityGroup.__table__.columns if column.name != "id"]
+
+
+def rebuild_groups(db: Session, batch_size: int = 5000) -> int:
+    """
+    Regroups every activity from scratch (for activities written before
+    grouping existed). Same rules as add_to_group, applied in one pass over
+    the activities in id order with the open groups kept in memory; groups
+    are bulk-inserted once their window has passed. Returns the number of groups.
+    """
+    db.execute(delete(ActivityGroup))
+
+    window = timedelta(seconds=FEED_GROUP_WINDOW)
+    open_groups = deque()          # in creation order, i.e. by started_at
+    by_key = defaultdict(list)     # ("actor" | "target", verb, user id) -> groups created with that key
+    total = 0
+
+    def holds(group, kind, user_id):
+        return (group.actor_id if kind == "actor" else group.target_user_id) == user_id
+
+    def write(groups):
+        db.execute(insert(ActivityGroup), [{name: getattr(g, name) for name in GROUP_COLUMNS} for g in groups])
+
+    activities = db.execute(
+        select(Activity.id, Activity.actor_id, Activity.verb, Activity.object_id,
+               Activity.target_user_id, Activity.created_at)
+        .order_by(Activity.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for batch in activities.partitions():
+        for activity_id, actor_id, verb, object_id, target_user_id, created_at in batch:
+            keys = [("actor", verb, actor_id)]
+            if target_user_id is not None:
+                keys.append(("target", verb, target_user_id))
+
+            opened_after = created_at - window
+            candidates = [
+                group for key in keys for group in by_key[key]
+                if holds(group, key[0], key[2]) and group.started_at >= opened_after
+            ]
+            if candidates:
+                group = max(candidates, key=lambda g: g.last_activity_id)
+                _extend(group, activity_id, actor_id, object_id, target_user_id, created_at)
+            else:
+                group = _new_group(activity_id, actor_id, verb, object_id, target_user_id, created_at)
+                open_groups.append(group)
+                for key in keys:
+                    by_key[key].append(group)
+
+        # Groups whose window has passed can no longer grow
+        horizon = batch[-1].created_at - window
+        closed = []
+        while open_groups and open_groups[0].started_at < horizon:
+            closed.append(open_groups.popleft())
+        if closed:
+            write(closed)
+            total += len(closed)
+            by_key = defaultdict(list, {
+                key: live for key, groups in by_key.items()
+                if (live := [g for g in groups if g.started_at >= horizon])
+            })
+
+    if open_groups:
+        write(open_groups)
+        total += len(open_groups)
+    db.commit()
+    return total
+
+
+if __name__ == "__main__":
+    # python -m app.feed_groups  ->  regroup all existing activities
+    from .database import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Rebuild the grouped activity feed from the activities table.")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    init_db()
+    with SessionLocal() as session:
+        groups = rebuild_groups(session, args.batch_size)
+    print(f"Activity groups rebuilt: {groups}")
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from .config import FEED_STREAM_POLL_BATCH, FEED_STREAM_POLL_INTERVAL, FEED_STREAM_QUEUE_SIZE, MULTI_PROCESS
+from .database import SessionLocal
+from .models import Activity
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# In-process activity pub/sub
+# -------------------------------
+# Activities are published once their transaction commits. Each subscriber
+# (one open /feed/stream connection) has a bounded queue; when a slow client
+# falls behind, the oldest events are dropped and the client is told how many
+# it missed, so it can re-read them from GET /feed/.
+#
+# With one worker, activities are published as this process commits them.
+# With several, each worker's ActivityPoller reads new activities by id from
+# the table instead, so a client sees every worker's writes. Writes to SQLite
+# are serialised, so ids become visible in order and none are skipped.
+
+@dataclass(frozen=True)
+class ActivityEvent:
+    """
+    The fields the feed needs, detached from any session.
+    """
+    id: int
+    actor_id: int
+    verb: str
+    object_type: str
+    object_id: Optional[int]
+    target_user_id: Optional[int]
+    created_at: Optional[datetime]
+
+
+class Subscription:
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, max_size: int):
+        self.user_id = user_id
+        self.dropped = 0
+        self._loop = loop
+        self._events = deque(maxlen=max_size)
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+
+    def push(self, events):
+        with self._lock:
+            overflow = len(self._events) + len(events) - self._events.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+            self._events.extend(events)    # deque(maxlen) drops the oldest
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass    # event loop already closed; the connection is gone
+
+    def drain(self):
+        """
+        Returns (queued events, number dropped since the last drain).
+        """
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            dropped, self.dropped = self.dropped, 0
+            self._ready.clear()
+        return events, dropped
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class ActivityBroker:
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, events):
+        """
+        Safe to call from any thread. Block filtering happens per subscriber
+        when events are sent, so every subscriber gets the same list here.
+        """
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(events)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "queue_size": self.queue_size}
+
+
+broker = ActivityBroker(FEED_STREAM_QUEUE_SIZE)
+
+
+# ---- publish on commit ----
+# log_activity stashes events on the session; they go out only if it commits.
+
+def publish_local(events):
+    """
+    Publishes activities this process just committed. With several workers
+    the poller publishes every activity instead, so these are left to it.
+    """
+    if not MULTI_PROCESS:
+        broker.publish(events)
+
+
+PENDING_KEY = "pending_activity_events"
+
+
+def stash(db: Session, activity_event: ActivityEvent):
+    db.info.setdefault(PENDING_KEY, []).append(activity_event)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    publish_local(session.info.pop(PENDING_KEY, None))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+# ---- publish from the table (several workers) ----
+
+def _event(row) -> ActivityEvent:
+    return ActivityEvent(
+        id=row.id,
+        actor_id=row.actor_id,
+        verb=row.verb,
+        object_type=row.object_type,
+        object_id=row.object_id,
+        target_user_id=row.target_user_id,
+        created_at=row.created_at,
+    )
+
+
+class ActivityPoller:
+    """
+    Publishes activities committed by any process, read by id every
+    `interval` seconds, starting from the newest one at start().
+    """
+
+    def __init__(self, interval: float = FEED_STREAM_POLL_INTERVAL, batch_size: int = FEED_STREAM_POLL_BATCH):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.watermark = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def poll(self, session_factory=SessionLocal) -> int:
+        """
+        Publishes everything newer than the watermark; returns how many.
+        """
+        published = 0
+        with session_factory() as db:
+            if self.watermark is None:
+                self.watermark = db.scalar(select(func.max(Activity.id))) or 0
+
+            while True:
+                rows = db.execute(
+                    select(
+                        Activity.id, Activity.actor_id, Activity.verb, Activity.object_type,
+                        Activity.object_id, Activity.target_user_id, Activity.created_at,
+                    )
+                    .where(Activity.id > self.watermark)
+                    .order_by(Activity.id)
+                    .limit(self.batch_size)
+                ).all()
+                if not rows:
+                    return published
+
+                broker.publish([_event(row) for row in rows])
+                self.watermark = rows[-1].id
+                published += len(rows)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.poll()     # sets the watermark: only activities from now on
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="activity-poller", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Activity stream poll failed")
+
+
+activity_poller = ActivityPoller()
@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from typing import Optional
+
+from .config import N_PLUS_ONE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Request metrics (Prometheus text format)
+# -------------------------------
+# Per process: with several workers, scrape each one (or aggregate upstream).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    """
+    What the database did for the current request; filled by the engine hooks.
+    """
+    __slots__ = ("queries", "db_time", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def record_query(statement: str, elapsed: float):
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+        stats.statements[statement] += 1
+
+
+class Histogram:
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)   # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(Histogram)      # (method, route) -> seconds
+        self.db_time = defaultdict(Histogram)      # (method, route) -> seconds
+        self.responses = Counter()                 # (method, route, status)
+        self.queries = Counter()                   # (method, route)
+        self.n_plus_one = Counter()                # (method, route)
+        self.in_flight = Counter()                 # method
+
+    def start(self, method: str):
+        with self._lock:
+            self.in_flight[method] += 1
+
+    def finish(self, method: str, route: str, status: int, elapsed: float, stats: RequestStats):
+        key = (method, route)
+        repeated = stats.statements.most_common(1)
+        n_plus_one = bool(repeated) and repeated[0][1] >= N_PLUS_ONE_THRESHOLD
+
+        with self._lock:
+            self.in_flight[method] -= 1
+            self.latency[key].observe(elapsed)
+            self.db_time[key].observe(stats.db_time)
+            self.responses[(method, route, status)] += 1
+            self.queries[key] += stats.queries
+            if n_plus_one:
+                self.n_plus_one[key] += 1
+
+        if n_plus_one:
+            statement, times = repeated[0]
+            logger.warning(
+                "Possible N+1 on %s %s: same statement ran %d times: %s",
+                method, route, times, " ".join(statement.split())[:200],
+            )
+
+    def render(self) -> str:
+        lines = []
+
+        def histogram(name, help_text, data):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), h in sorted(data.items()):
+                labels = f'method="{method}",route="{route}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), h.buckets):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {h.sum:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {h.count}")
+
+        def counter(name, help_text, kind, data, label_names):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(data.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                labels = ",".join(f'{label}="{v}"' for label, v in zip(label_names, key))
+                lines.append(f"{name}{{{labels}}} {value}")
+
+        with self._lock:
+            histogram("http_request_duration_seconds", "Request latency by route.", self.latency)
+            histogram("http_request_db_seconds", "Database time per request by route.", self.db_time)
+            counter("http_responses_total", "Responses by route and status code.", "counter",
+                    self.responses, ("method", "route", "status"))
+            counter("http_requests_in_flight", "Requests being served.", "gauge",
+                    self.in_flight, ("method",))
+            counter("db_queries_total", "SQL statements issued by route.", "counter",
+                    self.queries, ("method", "route"))
+            counter("db_n_plus_one_total", "Requests that repeated one statement "
+                    f"{N_PLUS_ONE_THRESHOLD}+ times.", "counter", self.n_plus_one, ("method", "route"))
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware, so streaming responses (SSE, exports) pass through
+    untouched. Adds a Server-Timing header with total and database time up to
+    the start of the response; the histograms cover the full response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status = 500
+        registry.start(method)
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = (time.perf_counter() - start) * 1000
+                timing = (
+                    f'app;dur={elapsed:.1f}, '
+                    f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"'
+                )
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            registry.finish(
+                method,
+                route.path if route is not None else "unmatched",
+                status,
+                time.perf_counter() - start,
+                stats,
+            )
+            current_request.reset(token)
@@ -1,9 +1,17 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Text, Index, JSON
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .database import Base
 
 
+# SQLite's CURRENT_TIMESTAMP has second precision. Storing Python-side values in
+# the same format keeps bound cursor values comparable with server defaults.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(truncate_microseconds=True), "sqlite"
+)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -13,7 +21,11 @@ class User(Base):
     password_hash = Column(String, nullable=False)
     role = Column(String, default="user")  # user | admin | owner
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+
+    # Denormalised counters, kept in step by the follow routers (see app/counters.py)
+    follower_count = Column(Integer, nullable=False, default=0, server_default="0")
+    following_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     posts = relationship("Post", back_populates="author")
 
@@ -24,8 +36,18 @@ class Post(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
     deleted_by = Column(String, nullable=True)  # None, 'admin', or 'owner'
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
+    trending_score = Column(Float, nullable=True)   # log-space decayed likes, see app/trending.py
+
+    __table_args__ = (
+        # keyset pagination of GET /posts/, globally and per author
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_user_id_created_at_id", "user_id", "created_at", "id"),
+        # GET /posts/trending before the in-memory ranking is loaded, and loading it
+        Index("ix_posts_trending_score", "trending_score"),
+    )
 
     author = relationship("User", back_populates="posts")
 
@@ -36,7 +58,14 @@ class Follow(Base):
     id = Column(Integer, primary_key=True, index=True)
     follower_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     following_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+
+    __table_args__ = (
+        # one row per pair; also the target of ON CONFLICT DO NOTHING
+        Index("uq_follows_follower_id_following_id", "follower_id", "following_id", unique=True),
+        # follower lookups for timeline fan-out
+        Index("ix_follows_following_id_follower_id", "following_id", "follower_id"),
+    )
 
 
 class Like(Base):
@@ -45,9 +74,15 @@ class Like(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     post_id = Column(Integer, ForeignKey("posts.id"), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
     deleted_by = Column(String, nullable=True)
 
+    __table_args__ = (
+        Index("uq_likes_user_id_post_id", "user_id", "post_id", unique=True),
+        # likes per post, for counter reconciliation
+        Index("ix_likes_post_id_user_id", "post_id", "user_id"),
+    )
+
 
 class Block(Base):
     __tablename__ = "blocks"
@@ -55,7 +90,30 @@ class Block(Base):
     id = Column(Integer, primary_key=True, index=True)
     blocker_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     blocked_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+
+    __table_args__ = (
+        Index("uq_blocks_blocker_id_blocked_user_id", "blocker_id", "blocked_user_id", unique=True),
+        # "who blocked me?" lookups used to filter feeds
+        Index("ix_blocks_blocked_user_id_blocker_id", "blocked_user_id", "blocker_id"),
+    )
+
+
+class RefreshToken(Base):
+    """
+    Rotating refresh tokens. Only a SHA-256 of the token is stored; rows with
+    `revoked_at` set form the revocation list. Tokens rotated from the same
+    login share a `family_id`, so reuse of an old token revokes the family.
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token_hash = Column(String, unique=True, index=True, nullable=False)
+    family_id = Column(String, nullable=False, index=True)
+    expires_at = Column(Timestamp, nullable=False)
+    revoked_at = Column(Timestamp, nullable=True)
+    created_at = Column(Timestamp, server_default=func.now())
 
 
 class Activity(Base):
@@ -67,4 +125,99 @@ class Activity(Base):
     object_type = Column(String, nullable=False)   # 'post', 'user', 'like'
     object_id = Column(Integer, nullable=True)
     target_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+
+    __table_args__ = (
+        # keyset pagination of the feed: ORDER BY created_at DESC, id DESC
+        Index("ix_activities_created_at_id", "created_at", "id"),
+        # pull-mode home timelines read high-fanout authors by actor
+        Index("ix_activities_actor_id_id", "actor_id", "id"),
+        # retention: finding unlike / unfollow / unblock rows to pair up
+        Index("ix_activities_verb_id", "verb", "id"),
+        # user deletion: activities aimed at the deleted user (follows, likes of their posts)
+        Index("ix_activities_target_user_id", "target_user_id"),
+    )
+
+
+class TimelineEntry(Base):
+    """
+    One row per (follower, activity): the fan-out-on-write home timeline inbox.
+    """
+    __tablename__ = "timeline_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)        # inbox owner
+    activity_id = Column(Integer, ForeignKey("activities.id"), nullable=False)
+    actor_id = Column(Integer, ForeignKey("users.id"), nullable=False)       # copied for block filtering
+
+    __table_args__ = (
+        Index("ix_timeline_entries_user_id_activity_id", "user_id", "activity_id", unique=True),
+        # removing a deleted user's activities from everyone's inbox
+        Index("ix_timeline_entries_actor_id", "actor_id"),
+        # retention: dropping archived activities from every inbox
+        Index("ix_timeline_entries_activity_id", "activity_id"),
+    )
+
+
+class ActivityGroup(Base):
+    """
+    A run of similar activities shown as one entry in the grouped feed:
+    the same actor doing the same thing (actor_id set), or several actors
+    doing it to the same user (target_user_id set). Maintained as each
+    activity is written; a group accepts activities for FEED_GROUP_WINDOW
+    seconds after its first one.
+    """
+    __tablename__ = "activity_groups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    verb = Column(String, nullable=False)
+    actor_id = Column(Integer, ForeignKey("users.id"), nullable=True)          # None once actors differ
+    target_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)    # None once targets differ
+    count = Column(Integer, nullable=False, default=1)
+    first_activity_id = Column(Integer, nullable=False)
+    last_activity_id = Column(Integer, nullable=False)
+    sample_actor_ids = Column(JSON, nullable=False, default=list)     # newest first
+    sample_object_ids = Column(JSON, nullable=False, default=list)    # newest first
+    started_at = Column(Timestamp, nullable=False)
+    updated_at = Column(Timestamp, nullable=False)
+
+    __table_args__ = (
+        # grouped feed: ORDER BY last_activity_id DESC
+        Index("ix_activity_groups_last_activity_id", "last_activity_id"),
+        # finding the open group for a new activity (and a deleted user's groups)
+        Index("ix_activity_groups_actor_id_verb", "actor_id", "verb", "started_at"),
+        Index("ix_activity_groups_target_user_id_verb", "target_user_id", "verb", "started_at"),
+    )
+
+
+class DeletionJob(Base):
+    """
+    A user deletion carried out in the background, chunk by chunk.
+    `step` and `rows_deleted` are committed with each chunk, so an interrupted
+    job resumes where it stopped.
+    """
+    __tablename__ = "deletion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)    # no FK: the user row goes away
+    requested_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    status = Column(String, nullable=False, default="pending")   # pending | running | done | failed
+    step = Column(String, nullable=True)
+    rows_deleted = Column(Integer, nullable=False, default=0, server_default="0")
+    error = Column(Text, nullable=True)
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
+    finished_at = Column(Timestamp, nullable=True)
+
+
+class WriteVersion(Base):
+    """
+    A counter per resource ("posts", "activities"), bumped in the same
+    transaction as every write that changes what its listing returns.
+    GET /posts/ and GET /feed/ derive their ETags from it. The
+    "trending_checkpoint" row holds the newest like id in posts.trending_score.
+    """
+    __tablename__ = "write_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
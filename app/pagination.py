@@ -0,0 +1,62 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+
+# -------------------------------
+# Keyset (cursor) pagination helpers
+# -------------------------------
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(*values) -> str:
+    """
+    Packs the sort key of the last row on a page into an opaque, URL-safe token.
+    Datetimes are stored as ISO strings so the cursor survives a JSON round-trip.
+    """
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """
+    Reverses `encode_cursor`. Raises 400 if the token is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("wrong cursor size")
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    return values
+
+
+def decode_timestamp_cursor(cursor: str):
+    """
+    Decodes a `(created_at, id)` cursor into a datetime and an int.
+    """
+    created_at, row_id = decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def before_keyset(created_at_col, id_col, created_at, row_id):
+    """
+    Filter for rows strictly after the cursor in `(created_at DESC, id DESC)` order.
+    Written as OR/AND instead of a row-value comparison so it can use the
+    composite index on every backend.
+    """
+    return or_(
+        created_at_col < created_at,
+        and_(created_at_col == created_at, id_col < row_id),
+    )
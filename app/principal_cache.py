@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from .config import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_SYNC_INTERVAL, PRINCIPAL_CACHE_TTL
+from .database import SessionLocal, on_commit
+from .write_versions import PRINCIPALS, bump_version, current_version
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    The authenticated caller, as seen by the routers.
+    Carries only what authorisation needs, so it can be cached safely.
+    """
+    id: int
+    name: str
+    role: str
+    is_active: bool
+
+
+class PrincipalCache:
+    """
+    In-process LRU cache of principals keyed by user id, with a TTL.
+    Entries are also dropped explicitly when a user's role or existence changes.
+    With several workers, changes made by the others are picked up by sync().
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0             # bumped whenever another process's change clears the cache
+        self._entries = OrderedDict()   # user_id -> (expires_at, Principal)
+        self._lock = threading.Lock()
+        self._version = None            # PRINCIPALS write version seen by the last sync
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, principal: Principal, generation: int = None):
+        """
+        Caches `principal`. Pass the `generation` read before loading it: if a
+        sync cleared the cache meanwhile, the principal may predate the change
+        and is not kept.
+        """
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.id)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # ---- cross-process invalidation ----
+
+    def sync(self, db: Session) -> bool:
+        """
+        Clears the cache if any process changed a user's role or status since
+        the last sync (the PRINCIPALS write version moved). Returns whether it did.
+        """
+        version = current_version(db, PRINCIPALS)
+        with self._lock:
+            changed = self._version is not None and version != self._version
+            self._version = version
+            if changed:
+                self._entries.clear()
+                self.generation += 1
+        return changed
+
+    def start(self, interval: float = PRINCIPAL_CACHE_SYNC_INTERVAL):
+        if self._thread is not None or self.ttl <= 0:
+            return
+        with SessionLocal() as db:
+            self.sync(db)
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="principal-cache-sync", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self, interval: float):
+        while not self._stopping.wait(interval):
+            try:
+                with SessionLocal() as db:
+                    self.sync(db)
+            except Exception:
+                logger.exception("Principal cache sync failed")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# invalidate() only reaches this process. With several workers, every change
+# also bumps the PRINCIPALS write version (see mark_principal_changed), and each
+# worker's sync thread clears its cache when that moves: a demoted or deleted
+# user keeps their old role elsewhere for at most PRINCIPAL_CACHE_SYNC_INTERVAL.
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+
+def mark_principal_changed(db: Session, user_id: int):
+    """
+    Call in the transaction that changes a user's role or status (or removes
+    them): this process's entry goes once it commits, the others' at their next sync.
+    """
+    bump_version(db, PRINCIPALS)
+    on_commit(db, principal_cache.invalidate, user_id)
@@ -0,0 +1,468 @@
+"""
+Retention for the activities, timeline_entries and refresh_tokens tables.
+
+  - activities older than ACTIVITY_RETENTION_DAYS are appended to a gzipped
+    NDJSON archive in ACTIVITY_ARCHIVE_DIR (one file per day the pass runs),
+    then deleted together with their inbox entries and feed groups
+  - with RETENTION_COMPACT_PAIRS, like/unlike, follow/unfollow and
+    block/unblock pairs that cancel each other out are dropped, unarchived
+  - home-timeline inboxes over TIMELINE_MAX_ENTRIES are trimmed back to it
+  - refresh tokens past their expiry, and whole families left with no
+    usable token (logged out, or revoked on reuse), are deleted
+  - rows go RETENTION_BATCH_SIZE at a time, one transaction per batch, and
+    the freed pages are returned to the filesystem by an incremental vacuum
+
+    python -m app.retention                       # one pass with the configured policy
+    python -m app.retention --days 90 --compact-pairs
+    python -m app.retention --convert             # enable incremental vacuum on an existing database
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.orm import Session, aliased
+
+from .config import (
+    ACTIVITY_ARCHIVE_DIR,
+    ACTIVITY_RETENTION_DAYS,
+    RETENTION_BATCH_SIZE,
+    RETENTION_COMPACT_PAIRS,
+    RETENTION_INTERVAL,
+    RETENTION_PAUSE,
+)
+from .database import IS_SQLITE, SessionLocal, engine, init_db
+from .exports import gzip_chunks, ndjson_chunks
+from .models import Activity, ActivityGroup, RefreshToken, TimelineEntry, User
+from .timeline import inbox_overflow
+from .write_versions import ACTIVITIES, bump_version
+from .writer import write_turn
+
+logger = logging.getLogger(__name__)
+
+# undo verb -> the verb it cancels
+CANCELLING = {"UNLIKED": "LIKED", "UNFOLLOWED": "FOLLOWED", "UNBLOCKED": "BLOCKED"}
+
+# Pages handed back per incremental_vacuum step (each step holds the write lock)
+VACUUM_STEP_PAGES = 2000
+
+
+def _delete_activities(db: Session, ids):
+    db.execute(delete(TimelineEntry).where(TimelineEntry.activity_id.in_(ids)))
+    db.execute(delete(Activity).where(Activity.id.in_(ids)))
+    bump_version(db, ACTIVITIES)
+
+
+# -------------------------------
+# Pair compaction
+# -------------------------------
+
+def compact_pairs(db: Session, batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_PAUSE,
+                  stopping: threading.Event = None) -> int:
+    """
+    Drops every undo activity together with the activity it undoes: the
+    closest earlier do/undo by the same actor on the same object, if that
+    one is the do (so like, unlike, like keeps the last like). Single-activity
+    groups of dropped rows go too; larger groups keep their counts.
+    Returns the number of activities dropped.
+    """
+    stopping = stopping or threading.Event()
+    dropped = 0
+
+    for undo, do in CANCELLING.items():
+        earlier = aliased(Activity)
+        preceding = (
+            select(earlier.id)
+            .where(
+                earlier.actor_id == Activity.actor_id,
+                earlier.object_id == Activity.object_id,
+                earlier.verb.in_([do, undo]),
+                earlier.id < Activity.id,
+            )
+            .order_by(earlier.id.desc())
+            .limit(1)
+            .correlate(Activity)
+            .scalar_subquery()
+        )
+
+        after = 0
+        while not stopping.is_set():
+            rows = db.execute(
+                select(Activity.id, preceding)
+                .where(Activity.verb == undo, Activity.id > after)
+                .order_by(Activity.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            after = rows[-1][0]
+
+            verbs = dict(db.execute(
+                select(Activity.id, Activity.verb)
+                .where(Activity.id.in_([previous for _, previous in rows if previous is not None]))
+            ).all())
+            ids = [activity_id for pair in rows if verbs.get(pair[1]) == do for activity_id in pair]
+
+            if ids:
+                with write_turn():
+                    _delete_activities(db, ids)
+                    db.execute(
+                        delete(ActivityGroup)
+                        .where(ActivityGroup.last_activity_id.in_(ids), ActivityGroup.count == 1)
+                    )
+                    db.commit()
+                dropped += len(ids)
+
+            if len(rows) < batch_size or stopping.wait(pause):
+                break
+
+    return dropped
+
+
+# -------------------------------
+# Archival
+# -------------------------------
+
+def archive_path(archive_dir: str, day: datetime) -> str:
+    return os.path.join(archive_dir, f"activities-{day:%Y%m%d}.ndjson.gz")
+
+
+def archive_activities(db: Session, days: int, archive_dir: str = ACTIVITY_ARCHIVE_DIR,
+                       batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_PAUSE,
+                       stopping: threading.Event = None) -> int:
+    """
+    Moves activities created more than `days` days ago to the archive,
+    oldest first. Each batch is appended as its own gzip member and synced
+    to disk before the rows are deleted, so a crash in between archives a
+    batch twice rather than losing it. Returns the number of activities archived.
+    """
+    stopping = stopping or threading.Event()
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    columns = list(Activity.__table__.columns)
+    names = [column.name for column in columns]
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = archive_path(archive_dir, datetime.utcnow())
+    archived = 0
+
+    while not stopping.is_set():
+        rows = db.execute(
+            select(*columns)
+            .where(Activity.created_at < cutoff)
+            .order_by(Activity.created_at, Activity.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        with open(path, "ab") as archive:
+            for chunk in gzip_chunks(ndjson_chunks([(names, rows)])):
+                archive.write(chunk)
+            archive.flush()
+            os.fsync(archive.fileno())
+
+        ids = [row.id for row in rows]
+        with write_turn():
+            _delete_activities(db, ids)
+            # Activities join groups in id order: a group goes with its newest activity
+            db.execute(
+                delete(ActivityGroup)
+                .where(ActivityGroup.last_activity_id.between(min(ids), max(ids)),   # keeps it on the index
+                       ActivityGroup.last_activity_id.in_(ids))
+            )
+            db.commit()
+        archived += len(rows)
+
+        if len(rows) < batch_size or stopping.wait(pause):
+            break
+
+    return archived
+
+
+# -------------------------------
+# Home-timeline inboxes
+# -------------------------------
+
+def trim_oversized_inboxes(db: Session, batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_PAUSE,
+                 stopping: threading.Event = None) -> int:
+    """
+    Trims every inbox over TIMELINE_MAX_ENTRIES back to its newest entries.
+    Fan-out only trims the recipients of every TIMELINE_TRIM_INTERVAL-th
+    activity, which some inboxes never receive. Walks users in id order.
+    Returns the number of entries deleted.
+    """
+    stopping = stopping or threading.Event()
+    trimmed = 0
+
+    after = 0
+    while not stopping.is_set():
+        rows = db.execute(
+            select(User.id, inbox_overflow(User.id))
+            .where(User.id > after)
+            .order_by(User.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        after = rows[-1][0]
+
+        over = [(user_id, overflow) for user_id, overflow in rows if overflow is not None]
+        if over:
+            with write_turn():
+                for user_id, overflow in over:
+                    trimmed += db.execute(
+                        delete(TimelineEntry)
+                        .where(TimelineEntry.user_id == user_id, TimelineEntry.activity_id <= overflow)
+                    ).rowcount
+                db.commit()
+
+        if len(rows) < batch_size or stopping.wait(pause):
+            break
+
+    return trimmed
+
+
+# -------------------------------
+# Refresh tokens
+# -------------------------------
+
+def prune_refresh_tokens(db: Session, batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_PAUSE,
+                         stopping: threading.Event = None) -> int:
+    """
+    Deletes refresh tokens past their expiry, and every token of a family
+    with no unrevoked, unexpired token left. Rotated tokens of a live family
+    stay until they expire: presenting one must still revoke the family.
+    Walks the table in id order. Returns the number of tokens deleted.
+    """
+    stopping = stopping or threading.Event()
+    now = datetime.utcnow()
+    live = aliased(RefreshToken)
+    family_alive = (
+        select(live.id)
+        .where(live.family_id == RefreshToken.family_id, live.revoked_at.is_(None), live.expires_at >= now)
+        .exists()
+    )
+    prunable = or_(RefreshToken.expires_at < now, and_(RefreshToken.revoked_at.is_not(None), ~family_alive))
+
+    pruned = 0
+    after = 0
+    while not stopping.is_set():
+        rows = db.execute(
+            select(RefreshToken.id, prunable)
+            .where(RefreshToken.id > after)
+            .order_by(RefreshToken.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        after = rows[-1][0]
+
+        # A dead family cannot come back and an expired token stays expired,
+        # so what was prunable when read still is
+        ids = [token_id for token_id, dead in rows if dead]
+        if ids:
+            with write_turn():
+                db.execute(delete(RefreshToken).where(RefreshToken.id.in_(ids)))
+                db.commit()
+            pruned += len(ids)
+
+        if len(rows) < batch_size or stopping.wait(pause):
+            break
+
+    return pruned
+
+
+# -------------------------------
+# Incremental vacuum
+# -------------------------------
+
+def incremental_vacuum(db: Session, pause: float = RETENTION_PAUSE, stopping: threading.Event = None) -> int:
+    """
+    Returns free pages to the filesystem VACUUM_STEP_PAGES at a time.
+    Only SQLite databases created with (or converted to)
+    auto_vacuum=INCREMENTAL can do this. Returns the number of pages freed.
+    """
+    if not IS_SQLITE:
+        return 0
+    stopping = stopping or threading.Event()
+
+    if db.connection().exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+        return 0
+
+    freed = 0
+    while not stopping.is_set():
+        conn = db.connection()
+        free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        if not free:
+            break
+        step = min(free, VACUUM_STEP_PAGES)
+        with write_turn():
+            # sqlite3's execute() steps this pragma once, freeing a single page;
+            # executescript() runs it to completion
+            conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({step})")
+            db.commit()
+        freed += step
+
+        if stopping.wait(pause):
+            break
+
+    return freed
+
+
+def run_retention(days: int = ACTIVITY_RETENTION_DAYS, compact: bool = RETENTION_COMPACT_PAIRS,
+                  archive_dir: str = ACTIVITY_ARCHIVE_DIR, batch_size: int = RETENTION_BATCH_SIZE,
+                  pause: float = RETENTION_PAUSE, stopping: threading.Event = None,
+                  session_factory=SessionLocal) -> dict:
+    """
+    One full pass: pair compaction, archival, inbox trimming, refresh token
+    pruning, then vacuum (which also picks up pages freed by other
+    deletions). Pairs are compacted first so they are dropped rather than
+    archived.
+    """
+    stopping = stopping or threading.Event()
+    started = time.perf_counter()
+    stats = {"compacted": 0, "archived": 0, "inbox_entries_trimmed": 0, "tokens_pruned": 0, "pages_freed": 0}
+
+    with session_factory() as db:
+        if compact:
+            stats["compacted"] = compact_pairs(db, batch_size, pause, stopping)
+        if days > 0:
+            stats["archived"] = archive_activities(db, days, archive_dir, batch_size, pause, stopping)
+        stats["inbox_entries_trimmed"] = trim_oversized_inboxes(db, batch_size, pause, stopping)
+        stats["tokens_pruned"] = prune_refresh_tokens(db, batch_size, pause, stopping)
+        stats["pages_freed"] = incremental_vacuum(db, pause, stopping)
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def convert_to_incremental():
+    """
+    Switches an existing SQLite database to auto_vacuum=INCREMENTAL. The
+    setting only sticks after a full VACUUM, which rewrites the whole file:
+    run it while the app is stopped.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+
+
+# -------------------------------
+# Background runner
+# -------------------------------
+
+class RetentionWorker:
+    """
+    Background thread that runs a retention pass on start and then every
+    RETENTION_INTERVAL seconds, or sooner when notified. Inboxes and refresh
+    tokens are cleaned on every pass; `enabled` tells whether activities are
+    touched.
+    """
+
+    def __init__(self, interval: float = RETENTION_INTERVAL):
+        self.interval = interval
+        self.running = False
+        self.last_run = None
+        self._cond = threading.Condition()
+        self._wakeup = False
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return ACTIVITY_RETENTION_DAYS > 0 or RETENTION_COMPACT_PAIRS
+
+    @property
+    def started(self) -> bool:
+        return self._thread is not None
+
+    def notify(self):
+        """
+        Runs a pass as soon as the current one (if any) finishes.
+        """
+        with self._cond:
+            self._wakeup = True
+            self._cond.notify()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._wakeup = True
+        self._thread = threading.Thread(
+            target=self._run, name="retention-worker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops after the current batch; the next pass picks up where it left off.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self.notify()
+        self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "started": self.started,
+            "retention_days": ACTIVITY_RETENTION_DAYS,
+            "compact_pairs": RETENTION_COMPACT_PAIRS,
+            "interval": self.interval,
+            "running": self.running,
+            "last_run": self.last_run,
+        }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._wakeup:
+                    self._cond.wait(self.interval)
+                self._wakeup = False
+
+            if self._stopping.is_set():
+                return
+
+            self.running = True
+            try:
+                stats = run_retention(stopping=self._stopping)
+            except Exception as exc:
+                logger.exception("Retention pass failed")
+                stats = {"error": str(exc)}
+            self.running = False
+            self.last_run = {**stats, "finished_at": datetime.utcnow()}
+
+
+retention_worker = RetentionWorker()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=ACTIVITY_RETENTION_DAYS,
+                        help="archive activities older than this (0: keep everything)")
+    parser.add_argument("--compact-pairs", action="store_true", default=RETENTION_COMPACT_PAIRS)
+    parser.add_argument("--archive-dir", default=ACTIVITY_ARCHIVE_DIR)
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--convert", action="store_true",
+                        help="switch the database to auto_vacuum=INCREMENTAL (full VACUUM) and exit")
+    args = parser.parse_args()
+
+    init_db()
+    if args.convert:
+        convert_to_incremental()
+        print("Database converted to auto_vacuum=INCREMENTAL")
+        return
+
+    stats = run_retention(days=args.days, compact=args.compact_pairs,
+                          archive_dir=args.archive_dir, batch_size=args.batch_size)
+    print(", ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
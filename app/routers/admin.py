@@ -1,20 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.models import User, Post, Follow, Like
+from app.models import DeletionJob, User
+from app.principal_cache import Principal, mark_principal_changed, principal_cache
 from app.auth_utils import get_current_user, get_db, require_admin, require_owner
-from app.activity_logger import log_activity
+from app.dependencies import DbSession, run_db, run_write
+from app.counters import reconcile_counters
+from app.exports import EXPORTABLE, FORMATS, export_stream
+from app.feed_cache import feed_page_cache
+from app.retention import retention_worker
+from app.social_graph import social_graph
+from app.trending import trending
+from app.user_deletion import deletion_worker
+from app.writer import writer
 
 router = APIRouter(prefix="/admin", tags=["Admin & Owner Controls"])
 
 
 # -------------------
-# DELETE USER
+# DELETE USER (background job)
 # -------------------
-@router.delete("/user/{user_id}", status_code=status.HTTP_200_OK)
-def delete_user(user_id: int,
-                db: Session = Depends(get_db),
-                current_user: User = Depends(require_admin)):
+@router.delete("/user/{user_id}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_user(user_id: int,
+                      db: DbSession = Depends(get_db),
+                      current_user: Principal = Depends(require_admin)):
+    """
+    Deactivates the user at once and queues the deletion of their data.
+    Poll `GET /admin/jobs/{job_id}` for progress.
+    """
+    job = await run_write(db, _delete_user, user_id, current_user)
+    deletion_worker.notify()
+    return job
+
+
+def _delete_user(db: Session, user_id: int, current_user: Principal):
 
     user = db.query(User).filter(User.id == user_id).first()
 
@@ -24,33 +47,67 @@ def delete_user(user_id: int,
     if user.role == "owner":
         raise HTTPException(status_code=403, detail="Owners cannot be deleted.")
 
-    # Delete user's posts, follows, likes
-    db.query(Post).filter(Post.user_id == user_id).delete()
-    db.query(Follow).filter(Follow.follower_id == user_id).delete()
-    db.query(Follow).filter(Follow.following_id == user_id).delete()
-    db.query(Like).filter(Like.user_id == user_id).delete()
+    # A second request for the same user returns the job already under way
+    job = db.query(DeletionJob).filter(
+        DeletionJob.user_id == user_id,
+        DeletionJob.status.in_(["pending", "running"])
+    ).first()
+
+    if not job:
+        job = DeletionJob(user_id=user_id, requested_by=current_user.id)
+        db.add(job)
 
-    db.delete(user)
+    # Locked out from now on; their data is removed in the background
+    user.is_active = False
+    mark_principal_changed(db, user_id)
     db.commit()
 
-    log_activity(
-        db=db,
-        actor_id=current_user.id,
-        verb="USER_DELETED",
-        object_type="user",
-        object_id=user_id
-    )
+    return _job_status(job)
+
+
+# -------------------
+# ADMIN: Background job status
+# -------------------
+@router.get("/jobs/{job_id}", status_code=status.HTTP_200_OK)
+async def get_job(job_id: int,
+                  db: DbSession = Depends(get_db),
+                  current_user: Principal = Depends(require_admin)):
+    return await run_db(db, _get_job, job_id)
+
+
+def _get_job(db: Session, job_id: int):
+
+    job = db.get(DeletionJob, job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    return _job_status(job)
 
-    return {"message": f"User {user_id} deleted."}
+
+def _job_status(job: DeletionJob) -> dict:
+    return {
+        "job_id": job.id,
+        "user_id": job.user_id,
+        "status": job.status,
+        "step": job.step,
+        "rows_deleted": job.rows_deleted,
+        "error": job.error,
+        "finished_at": job.finished_at,
+    }
 
 
 # -------------------
 # OWNER ONLY: Promote admin
 # -------------------
 @router.post("/promote/{user_id}", status_code=status.HTTP_200_OK)
-def promote_to_admin(user_id: int,
-                     db: Session = Depends(get_db),
-                     current_user: User = Depends(require_owner)):
+async def promote_to_admin(user_id: int,
+                           db: DbSession = Depends(get_db),
+                           current_user: Principal = Depends(require_owner)):
+    return await run_write(db, _promote_to_admin, user_id)
+
+
+def _promote_to_admin(db: Session, user_id: int):
 
     user = db.query(User).filter(User.id == user_id).first()
 
@@ -58,6 +115,106 @@ def promote_to_admin(user_id: int,
         raise HTTPException(status_code=404, detail="User not found.")
 
     user.role = "admin"
+    mark_principal_changed(db, user_id)
     db.commit()
-    
+
     return {"message": f"User {user_id} is now an admin."}
+
+
+# -------------------
+# ADMIN: Principal cache statistics
+# -------------------
+@router.get("/principal-cache", status_code=status.HTTP_200_OK)
+async def principal_cache_stats(current_user: Principal = Depends(require_admin)):
+    return principal_cache.stats()
+
+
+# -------------------
+# ADMIN: Rendered feed page cache statistics
+# -------------------
+@router.get("/feed-cache", status_code=status.HTTP_200_OK)
+async def feed_cache_stats(current_user: Principal = Depends(require_admin)):
+    return feed_page_cache.stats()
+
+
+# -------------------
+# ADMIN: Social graph index statistics
+# -------------------
+@router.get("/social-graph", status_code=status.HTTP_200_OK)
+async def social_graph_stats(current_user: Principal = Depends(require_admin)):
+    return social_graph.stats()
+
+
+# -------------------
+# ADMIN: Trending ranking statistics
+# -------------------
+@router.get("/trending", status_code=status.HTTP_200_OK)
+async def trending_stats(current_user: Principal = Depends(require_admin)):
+    return trending.stats()
+
+
+# -------------------
+# ADMIN: Activity retention (archival, pair compaction, vacuum)
+# -------------------
+@router.get("/retention", status_code=status.HTTP_200_OK)
+async def retention_stats(current_user: Principal = Depends(require_admin)):
+    return retention_worker.stats()
+
+
+@router.post("/retention", status_code=status.HTTP_202_ACCEPTED)
+async def run_retention_now(current_user: Principal = Depends(require_admin)):
+    """
+    Queues a retention pass; `GET /admin/retention` shows its result.
+    With several worker processes only one runs retention: retry until
+    the request lands on it.
+    """
+    if not retention_worker.started:
+        raise HTTPException(status_code=409, detail="Retention runs in another worker process.")
+    retention_worker.notify()
+    return {"message": "Retention pass queued."}
+
+
+# -------------------
+# ADMIN: Single-writer queue statistics (this worker process)
+# -------------------
+@router.get("/writer", status_code=status.HTTP_200_OK)
+async def writer_stats(current_user: Principal = Depends(require_admin)):
+    return writer.stats()
+
+
+# -------------------
+# ADMIN: Repair denormalised counters
+# -------------------
+@router.post("/reconcile-counters", status_code=status.HTTP_200_OK)
+async def reconcile_counter_columns(db: DbSession = Depends(get_db),
+                                    current_user: Principal = Depends(require_admin)):
+    return {"repaired": await run_write(db, reconcile_counters)}
+
+
+# -------------------
+# ADMIN: Streaming exports for analytics
+# -------------------
+@router.get("/export/{table}", status_code=status.HTTP_200_OK)
+async def export_table(table: str,
+                       format: Literal["ndjson", "csv"] = "ndjson",
+                       since: Optional[datetime] = None,
+                       until: Optional[datetime] = None,
+                       after_id: Optional[int] = Query(None, ge=0),
+                       gzip: bool = False,
+                       current_user: Principal = Depends(require_admin)):
+    """
+    Streams a whole table (activities, posts, follows, likes) in id order.
+    - `since` / `until` filter on created_at (UTC unless they carry an offset)
+    - `after_id` resumes after the last id of a previous export
+    - `gzip=true` compresses on the fly
+    """
+    if table not in EXPORTABLE:
+        raise HTTPException(status_code=404, detail=f"Unknown table. Choose from: {', '.join(EXPORTABLE)}")
+
+    filename = f"{table}.{format}" + (".gz" if gzip else "")
+
+    return StreamingResponse(
+        export_stream(table, format, gzip, since=since, until=until, after_id=after_id),
+        media_type="application/gzip" if gzip else FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,27 +1,163 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
-from app.models import User
-from app.schemas import UserCreate, UserOut, LoginRequest, Token
-from app.security import hash_password, verify_password, create_access_token
-from app.dependencies import get_db
+from app.models import RefreshToken, User
+from app.schemas import UserCreate, UserOut, LoginRequest, Token, RefreshRequest
+from app.security import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    HashingOverloaded,
+    create_access_token,
+    create_refresh_token,
+    hash_password,
+    hash_refresh_token,
+    hashing_pool,
+    verify_and_update_password,
+)
+from app.dependencies import DbSession, get_db, run_db, run_write
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 
-@router.post("/signup", response_model=UserOut, status_code=status.HTTP_201_CREATED)
-def signup(payload: UserCreate, db: Session = Depends(get_db)):
+def _get_user_by_email(db: Session, email: str):
+    return db.query(User).filter(User.email == email).first()
+
 
-    if db.query(User).filter(User.email == payload.email).first():
+async def _run_hashing(fn, *args):
+    """
+    Runs an Argon2 call on the hashing pool; answers 503 when it is saturated.
+    """
+    try:
+        return await hashing_pool.run(fn, *args)
+    except HashingOverloaded:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already exists"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service is busy, please retry.",
+            headers={"Retry-After": "1"},
         )
 
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive UTC, timestamptz backends an aware value
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _issue_refresh_token(db: Session, user_id: int, family_id: str = None) -> str:
+    """
+    Stores the hash of a new refresh token (a new family unless rotating) and
+    returns the raw token. The caller commits.
+    """
+    token = create_refresh_token()
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
+def _start_session(db: Session, user_id: int, new_password_hash: str = None) -> str:
+    # Argon2 parameters changed since this hash was made: store an upgraded one
+    if new_password_hash:
+        db.query(User).filter(User.id == user_id).update({User.password_hash: new_password_hash})
+
+    token = _issue_refresh_token(db, user_id)
+    db.commit()
+    return token
+
+
+def _revoke_family(db: Session, family_id: str):
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: datetime.utcnow()})
+
+
+def _rotate_refresh_token(db: Session, token: str):
+    """
+    Exchanges a valid refresh token for a new one in the same family.
+    Presenting an already-rotated token means it leaked: the whole family is revoked.
+    """
+    record = db.query(RefreshToken).filter(
+        RefreshToken.token_hash == hash_refresh_token(token)
+    ).first()
+
+    if not record:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    if record.revoked_at is not None:
+        _revoke_family(db, record.family_id)
+        db.commit()
+        raise HTTPException(status_code=401, detail="Refresh token has been revoked")
+
+    if _as_utc(record.expires_at) < datetime.now(timezone.utc):
+        raise HTTPException(status_code=401, detail="Refresh token has expired")
+
+    # Deactivated, or waiting for deletion: no new tokens
+    if not db.scalar(select(User.is_active).where(User.id == record.user_id)):
+        _revoke_family(db, record.family_id)
+        db.commit()
+        raise HTTPException(status_code=401, detail="Refresh token has been revoked")
+
+    # Revoke only if still unrevoked: of two concurrent refreshes with one
+    # token, the second changes nothing and counts as reuse
+    rotated = db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == record.id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    ).rowcount
+    if not rotated:
+        _revoke_family(db, record.family_id)
+        db.commit()
+        raise HTTPException(status_code=401, detail="Refresh token has been revoked")
+
+    new_token = _issue_refresh_token(db, record.user_id, record.family_id)
+    db.commit()
+
+    return record.user_id, new_token
+
+
+def _logout(db: Session, token: str):
+    record = db.query(RefreshToken).filter(
+        RefreshToken.token_hash == hash_refresh_token(token)
+    ).first()
+
+    if record:
+        _revoke_family(db, record.family_id)
+        db.commit()
+
+
+def _token_pair(user_id: int, refresh_token: str) -> Token:
+    return Token(
+        access_token=create_access_token({"sub": str(user_id)}),
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        refresh_token=refresh_token,
+    )
+
+
+def _email_taken() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Email already exists"
+    )
+
+
+def _create_user(db: Session, payload: UserCreate, password_hash: str):
+
+    if _get_user_by_email(db, payload.email):
+        raise _email_taken()
+
     user = User(
         name=payload.name,
         email=payload.email,
-        password_hash=hash_password(payload.password),
+        password_hash=password_hash,
     )
 
     db.add(user)
@@ -31,21 +167,64 @@ def signup(payload: UserCreate, db: Session = Depends(get_db)):
     return user
 
 
+@router.post("/signup", response_model=UserOut, status_code=status.HTTP_201_CREATED)
+async def signup(payload: UserCreate, db: DbSession = Depends(get_db)):
+
+    # Refuse a taken email before spending a hash on it; _create_user
+    # checks again in case a concurrent signup claims it meanwhile
+    if await run_db(db, _get_user_by_email, payload.email):
+        raise _email_taken()
+
+    # Argon2 is CPU-bound: it runs on the hashing process pool
+    password_hash = await _run_hashing(hash_password, payload.password)
+
+    return await run_write(db, _create_user, payload, password_hash)
+
+
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
 
     email = form_data.username  # Swagger uses "username" instead of "email"
     password = form_data.password
 
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.password_hash):
+    user = await run_db(db, _get_user_by_email, email)
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await _run_hashing(
+            verify_and_update_password, password, user.password_hash
+        )
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
 
-    token = create_access_token({"sub": str(user.id)})
-    return Token(access_token=token)
\ No newline at end of file
+    # Deactivated, or waiting for deletion: no new session
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="Account is deactivated")
+
+    refresh_token = await run_write(db, _start_session, user.id, new_hash)
+    return _token_pair(user.id, refresh_token)
+
+
+@router.post("/refresh", response_model=Token)
+async def refresh(payload: RefreshRequest, db: DbSession = Depends(get_db)):
+    """
+    Issues a new access token (and rotates the refresh token) without
+    re-checking the password, so clients never need to re-post credentials.
+    """
+    user_id, refresh_token = await run_write(db, _rotate_refresh_token, payload.refresh_token)
+    return _token_pair(user_id, refresh_token)
+
+
+@router.post("/logout", status_code=status.HTTP_200_OK)
+async def logout(payload: RefreshRequest, db: DbSession = Depends(get_db)):
+    """
+    Revokes the refresh token and every token rotated from the same login.
+    """
+    await run_write(db, _logout, payload.refresh_token)
+    return {"message": "Logged out"}
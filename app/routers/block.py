@@ -1,45 +1,58 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import delete, literal, select
 from sqlalchemy.orm import Session
 
+from app.database import dialect_insert, on_commit
 from app.models import Block, User, Follow
+from app.principal_cache import Principal
 from app.auth_utils import get_current_user, get_db
+from app.dependencies import DbSession, run_write
 from app.activity_logger import log_activity
+from app.counters import adjust_follow_counts
+from app.social_graph import social_graph
 
 router = APIRouter(prefix="/block", tags=["Block System"])
 
 
 @router.post("/{user_id}", status_code=status.HTTP_201_CREATED)
-def block_user(user_id: int,
-               db: Session = Depends(get_db),
-               current_user: User = Depends(get_current_user)):
-    
+async def block_user(user_id: int,
+                     db: DbSession = Depends(get_db),
+                     current_user: Principal = Depends(get_current_user)):
+    return await run_write(db, _block_user, user_id, current_user)
+
+
+def _block_user(db: Session, user_id: int, current_user: Principal):
+
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="You cannot block yourself.")
 
-    target_user = db.query(User).filter(User.id == user_id).first()
-    if not target_user:
-        raise HTTPException(status_code=404, detail="User not found.")
+    if social_graph.is_blocked(current_user.id, user_id):
+        raise HTTPException(status_code=400, detail="User already blocked.")
 
-    # Check if already blocked
-    existing = db.query(Block).filter(
-        Block.blocker_id == current_user.id,
-        Block.blocked_user_id == user_id
+    # One statement: insert if the target exists, no-op if already blocked
+    inserted = db.execute(
+        dialect_insert(db, Block)
+        .from_select(
+            ["blocker_id", "blocked_user_id"],
+            select(literal(current_user.id), User.id).where(User.id == user_id, User.is_active.is_not(False)),
+        )
+        .on_conflict_do_nothing(index_elements=["blocker_id", "blocked_user_id"])
+        .returning(Block.id)
     ).first()
 
-    if existing:
+    if not inserted:
+        if not db.query(User.id).filter(User.id == user_id, User.is_active.is_not(False)).first():
+            raise HTTPException(status_code=404, detail="User not found.")
         raise HTTPException(status_code=400, detail="User already blocked.")
 
     # Auto remove follow if already following them
-    follow_entry = db.query(Follow).filter(
-        Follow.follower_id == user_id,
-        Follow.following_id == current_user.id
+    unfollowed = db.execute(
+        delete(Follow)
+        .where(Follow.follower_id == user_id, Follow.following_id == current_user.id)
+        .returning(Follow.id)
     ).first()
-    if follow_entry:
-        db.delete(follow_entry)
-
-    block = Block(blocker_id=current_user.id, blocked_user_id=user_id)
-    db.add(block)
-    db.commit()
+    if unfollowed:
+        adjust_follow_counts(db, user_id, current_user.id, -1)
 
     log_activity(
         db=db,
@@ -49,26 +62,31 @@ def block_user(user_id: int,
         object_id=user_id,
         target_user_id=user_id
     )
+    on_commit(db, social_graph.add_block, current_user.id, user_id)
+    on_commit(db, social_graph.remove_follow, user_id, current_user.id)
+    db.commit()
 
     return {"message": f"User {user_id} blocked."}
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_200_OK)
-def unblock_user(user_id: int,
-                 db: Session = Depends(get_db),
-                 current_user: User = Depends(get_current_user)):
+async def unblock_user(user_id: int,
+                       db: DbSession = Depends(get_db),
+                       current_user: Principal = Depends(get_current_user)):
+    return await run_write(db, _unblock_user, user_id, current_user)
+
+
+def _unblock_user(db: Session, user_id: int, current_user: Principal):
 
-    block_record = db.query(Block).filter(
-        Block.blocker_id == current_user.id,
-        Block.blocked_user_id == user_id
+    removed = db.execute(
+        delete(Block)
+        .where(Block.blocker_id == current_user.id, Block.blocked_user_id == user_id)
+        .returning(Block.id)
     ).first()
 
-    if not block_record:
+    if not removed:
         raise HTTPException(status_code=400, detail="User is not blocked.")
 
-    db.delete(block_record)
-    db.commit()
-
     log_activity(
         db=db,
         actor_id=current_user.id,
@@ -77,5 +95,7 @@ def unblock_user(user_id: int,
         object_id=user_id,
         target_user_id=user_id
     )
+    on_commit(db, social_graph.remove_block, current_user.id, user_id)
+    db.commit()
 
     return {"message": f"User {user_id} unblocked."}
@@ -1,57 +1,389 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
+from app.config import FEED_STREAM_HEARTBEAT, FEED_STREAM_REPLAY_LIMIT
+from app.database import SessionLocal
 from app.models import Activity, Block
 from app.auth_utils import get_current_user, get_db
+from app.dependencies import DbSession, run_db
+from app.feed_cache import feed_page_cache
+from app.feed_groups import grouped_feed_query, visible_members
+from app.feed_stream import broker
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    before_keyset,
+    decode_cursor,
+    decode_timestamp_cursor,
+    encode_cursor,
+)
+from app.social_graph import social_graph
+from app.timeline import blockers_of, home_timeline_query
+from app.write_versions import (
+    ACTIVITIES,
+    LISTING_CACHE_CONTROL,
+    etag_matches,
+    format_etag,
+    listing_version,
+    not_modified,
+)
 
 router = APIRouter(prefix="/feed", tags=["Activity Feed"])
 
 
+def activity_message(verb: str, actor_id: int, target_user_id: int = None) -> str:
+    if verb == "POST_CREATED":
+        return f"User {actor_id} made a post"
+    elif verb == "POST_DELETED":
+        return f"User {actor_id} deleted a post"
+    elif verb == "FOLLOWED":
+        return f"User {actor_id} followed User {target_user_id}"
+    elif verb == "UNFOLLOWED":
+        return f"User {actor_id} unfollowed User {target_user_id}"
+    elif verb == "BLOCKED":
+        return f"User {actor_id} blocked User {target_user_id}"
+    elif verb == "UNBLOCKED":
+        return f"User {actor_id} unblocked User {target_user_id}"
+    else:
+        return f"Activity: {verb}"
+
+
+def format_activity(act) -> dict:
+    """
+    Converts an activity row into a readable feed entry.
+    """
+    return {
+        "id": act.id,
+        "timestamp": act.created_at,
+        "message": activity_message(act.verb, act.actor_id, act.target_user_id),
+    }
+
+
+# verb -> (past tense, what the objects are) for grouped entries
+GROUP_WORDING = {
+    "POST_CREATED": ("made", "posts"),
+    "POST_DELETED": ("deleted", "posts"),
+    "LIKED": ("liked", "posts"),
+    "FOLLOWED": ("followed", "users"),
+    "UNFOLLOWED": ("unfollowed", "users"),
+    "BLOCKED": ("blocked", "users"),
+    "UNBLOCKED": ("unblocked", "users"),
+}
+
+
+def group_message(group, actor_ids, count) -> str:
+    if group.count == 1:
+        return activity_message(group.verb, group.actor_id, group.target_user_id)
+
+    did, objects = GROUP_WORDING.get(group.verb, (None, None))
+    if did is None:
+        return f"Activity: {group.verb}" + (f" ({count} times)" if count is not None else "")
+
+    if group.actor_id is not None:
+        return f"User {group.actor_id} {did} {group.count} {objects}"
+
+    target = f"posts by User {group.target_user_id}" if objects == "posts" else f"User {group.target_user_id}"
+    total = f" ({count} in total)" if count is not None else ""
+    users = "User" if len(actor_ids) == 1 else "Users"
+    return f"{users} {', '.join(map(str, actor_ids))} {did} {target}{total}"
+
+
+def format_group(group, actor_ids=None, object_ids=None, count=None) -> dict:
+    """
+    A grouped feed entry. For a group with activity hidden from the reader,
+    pass the visible `actor_ids` / `object_ids` and no `count` (the total
+    would give the hidden activity away); otherwise the group's own are used.
+    """
+    if actor_ids is None:
+        actor_ids, object_ids, count = group.sample_actor_ids, group.sample_object_ids, group.count
+    return {
+        "id": group.id,
+        "verb": group.verb,
+        "count": count,
+        "actor_id": group.actor_id,
+        "target_user_id": group.target_user_id,
+        "actor_ids": actor_ids,
+        "object_ids": object_ids,
+        "first_activity_id": group.first_activity_id,
+        "last_activity_id": group.last_activity_id,
+        "started_at": group.started_at,
+        "timestamp": group.updated_at,
+        "message": group_message(group, actor_ids, count),
+    }
+
+
 @router.get("/")
-def get_activity_feed(db: Session = Depends(get_db),
-                      current_user=Depends(get_current_user)):
+async def get_activity_feed(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            cursor: Optional[str] = None,
+                            if_none_match: Optional[str] = Header(None),
+                            db: DbSession = Depends(get_db),
+                            current_user=Depends(get_current_user)):
     """
-    Returns the activity feed for the user.
+    Returns one page of the activity feed for the user, newest first.
     It hides activity from users who blocked the current user.
+    Pass `next_cursor` back as `cursor` to fetch the following page.
+    Send the `ETag` back as `If-None-Match` to get a 304 while nothing changed.
+    """
+    etag, body = await run_db(db, _get_activity_feed, current_user.id, limit, cursor, if_none_match)
+    if body is None:
+        return not_modified(etag)
+
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": LISTING_CACHE_CONTROL},
+    )
+
+
+def _get_activity_feed(db: Session, user_id: int, limit: int, cursor: Optional[str],
+                       if_none_match: Optional[str] = None):
+    """
+    Returns (etag, JSON body); the body is None when `if_none_match` is still
+    current. Pages are rendered once per blocker set and write version, then
+    served from the shared page cache.
+    """
+    version, blockers = listing_version(db, ACTIVITIES, user_id)
+    etag = format_etag(ACTIVITIES, version, blockers)
+    if etag_matches(if_none_match, etag):
+        return etag, None
+
+    # Keyed on the blocker ids themselves: pages differ by blocker set, and a
+    # digest collision would hand one caller another's page
+    cache_key = (blockers, cursor, limit)
+    body = feed_page_cache.get(version, cache_key)
+    if body is not None:
+        return etag, body
+
+    # Blockers are filtered in SQL, walking the (created_at, id) index
+    query = (
+        select(Activity)
+        .where(Activity.actor_id.not_in(blockers_of(user_id)))
+        .order_by(Activity.created_at.desc(), Activity.id.desc())
+    )
+
+    if cursor:
+        created_at, last_id = decode_timestamp_cursor(cursor)
+        query = query.where(
+            before_keyset(Activity.created_at, Activity.id, created_at, last_id)
+        )
+
+    # Fetch one extra row to know whether another page exists
+    activities = db.scalars(query.limit(limit + 1)).all()
+    has_more = len(activities) > limit
+    activities = activities[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = activities[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    body = _render({
+        "items": [format_activity(act) for act in activities],
+        "next_cursor": next_cursor,
+    })
+    feed_page_cache.put(version, cache_key, body)
+    return etag, body
+
+
+def _render(page: dict) -> bytes:
+    # Same encoding as FastAPI's default JSONResponse
+    return json.dumps(jsonable_encoder(page), ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+@router.get("/home")
+async def get_home_timeline(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            cursor: Optional[str] = None,
+                            db: DbSession = Depends(get_db),
+                            current_user=Depends(get_current_user)):
+    """
+    Returns one page of the user's personalised timeline: their own activity
+    and that of the users they follow, newest first.
+    """
+
+    before_id = None
+    if cursor:
+        (before_id,) = decode_cursor(cursor, 1)
+        if not isinstance(before_id, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    return await run_db(db, _get_home_timeline, current_user.id, limit, before_id)
+
+
+def _get_home_timeline(db: Session, user_id: int, limit: int, before_id: Optional[int]):
+
+    activities = db.scalars(
+        home_timeline_query(user_id, limit + 1, before_id)
+    ).all()
+    has_more = len(activities) > limit
+    activities = activities[:limit]
+
+    next_cursor = encode_cursor(activities[-1].id) if has_more else None
+
+    return {
+        "items": [format_activity(act) for act in activities],
+        "next_cursor": next_cursor,
+    }
+
+
+@router.get("/grouped")
+async def get_grouped_feed(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                           cursor: Optional[str] = None,
+                           db: DbSession = Depends(get_db),
+                           current_user=Depends(get_current_user)):
+    """
+    The activity feed with repetitive activities collapsed: one entry per run
+    of the same action by one user (or aimed at one user), with a count and
+    sample actor / object ids. Entries move to the top as their group grows.
     """
 
-    # Find all users who have blocked the current user
-    blocked_by = db.query(Block).filter(
-        Block.blocked_user_id == current_user.id
+    before_id = None
+    if cursor:
+        (before_id,) = decode_cursor(cursor, 1)
+        if not isinstance(before_id, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    return await run_db(db, _get_grouped_feed, current_user.id, limit, before_id)
+
+
+def _get_grouped_feed(db: Session, user_id: int, limit: int, before_id: Optional[int]):
+
+    blockers = blockers_of(user_id)
+    if not isinstance(blockers, list):
+        blockers = db.scalars(blockers).all()
+
+    groups = db.scalars(grouped_feed_query(blockers, limit + 1, before_id)).all()
+    has_more = len(groups) > limit
+    groups = groups[:limit]
+
+    items = []
+    for group in groups:
+        members = None
+        if group.actor_id is None and blockers:
+            members = visible_members(db, group, blockers)
+        if members is None:
+            items.append(format_group(group))
+        elif members[0]:
+            items.append(format_group(group, *members))
+
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(groups[-1].last_activity_id) if has_more else None,
+    }
+
+
+# -------------------------------
+# Live feed (Server-Sent Events)
+# -------------------------------
+
+@router.get("/stream")
+async def stream_activity_feed(request: Request,
+                               last_event_id: Optional[str] = Query(None),
+                               last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+                               db: DbSession = Depends(get_db),
+                               current_user=Depends(get_current_user)):
+    """
+    Pushes new activities as Server-Sent Events instead of polling `GET /feed/`.
+    The same block filtering applies. On reconnect, send the last seen id
+    (`Last-Event-ID` header or `last_event_id`) to receive what was missed.
+    A `gap` event means some activities were skipped: re-read them from `GET /feed/`.
+    """
+    resume_from = last_event_id_header or last_event_id
+    if resume_from is not None:
+        if not resume_from.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID.")
+        resume_from = int(resume_from)
+
+    # Subscribe before reading the backlog so nothing falls between the two
+    subscription = broker.subscribe(current_user.id)
+    try:
+        missed, truncated = [], False
+        if resume_from is not None:
+            missed, truncated = await run_db(db, _get_missed_activities, current_user.id, resume_from)
+    except Exception:
+        broker.unsubscribe(subscription)
+        raise
+
+    return StreamingResponse(
+        _stream_events(request, subscription, missed, truncated),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _get_missed_activities(db: Session, user_id: int, after_id: int):
+    """
+    The newest FEED_STREAM_REPLAY_LIMIT activities after `after_id`, oldest
+    first, and whether older ones had to be left out.
+    """
+    activities = db.scalars(
+        select(Activity)
+        .where(
+            Activity.id > after_id,
+            Activity.actor_id.not_in(blockers_of(user_id)),
+        )
+        .order_by(Activity.id.desc())
+        .limit(FEED_STREAM_REPLAY_LIMIT + 1)
     ).all()
 
-    blocked_user_ids = [record.blocker_id for record in blocked_by]
-
-    # Get all activity EXCEPT from blocked users
-    activities = db.query(Activity).filter(
-        Activity.actor_id.not_in(blocked_user_ids)
-    ).order_by(Activity.created_at.desc()).all()
-
-    formatted = []
-
-    for act in activities:
-
-        entry = {
-            "id": act.id,
-            "timestamp": act.created_at,
-        }
-
-        # Convert activity to readable message
-        if act.verb == "POST_CREATED":
-            entry["message"] = f"User {act.actor_id} made a post"
-        elif act.verb == "POST_DELETED":
-            entry["message"] = f"User {act.actor_id} deleted a post"
-        elif act.verb == "FOLLOWED":
-            entry["message"] = f"User {act.actor_id} followed User {act.target_user_id}"
-        elif act.verb == "UNFOLLOWED":
-            entry["message"] = f"User {act.actor_id} unfollowed User {act.target_user_id}"
-        elif act.verb == "BLOCKED":
-            entry["message"] = f"User {act.actor_id} blocked User {act.target_user_id}"
-        elif act.verb == "UNBLOCKED":
-            entry["message"] = f"User {act.actor_id} unblocked User {act.target_user_id}"
-        else:
-            entry["message"] = f"Activity: {act.verb}"
-
-        formatted.append(entry)
-
-    return formatted
+    truncated = len(activities) > FEED_STREAM_REPLAY_LIMIT
+    return activities[:FEED_STREAM_REPLAY_LIMIT][::-1], truncated
+
+
+def _blockers_among(user_id: int, actor_ids) -> set:
+    """
+    Which of `actor_ids` have blocked `user_id`, read from the blocks table
+    (the response outlives the request's session).
+    """
+    with SessionLocal() as db:
+        return set(db.scalars(
+            select(Block.blocker_id)
+            .where(Block.blocked_user_id == user_id, Block.blocker_id.in_(actor_ids))
+        ))
+
+
+def _sse(event: str, data: dict, event_id: int = None) -> str:
+    message = f"id: {event_id}\n" if event_id is not None else ""
+    return message + f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+async def _stream_events(request: Request, subscription, missed, truncated: bool):
+    try:
+        if truncated:
+            yield _sse("gap", {"reason": "backlog too long"})
+
+        replayed = set()
+        for act in missed:
+            replayed.add(act.id)
+            yield _sse("activity", format_activity(act), act.id)
+
+        while not await request.is_disconnected():
+            if not await subscription.wait(FEED_STREAM_HEARTBEAT):
+                yield ": keep-alive\n\n"
+                continue
+
+            events, dropped = subscription.drain()
+            if dropped:
+                yield _sse("gap", {"reason": "client too slow", "missed": dropped})
+
+            # Hide activity from users who blocked the subscriber, as GET /feed/ does
+            actor_ids = {act.actor_id for act in events}
+            if social_graph.ready:
+                hidden = {actor_id for actor_id in actor_ids
+                          if social_graph.is_blocked(actor_id, subscription.user_id)}
+            else:
+                hidden = await run_in_threadpool(_blockers_among, subscription.user_id, actor_ids)
+
+            for act in events:
+                if act.id in replayed or act.actor_id in hidden:
+                    continue
+                yield _sse("activity", format_activity(act), act.id)
+    finally:
+        broker.unsubscribe(subscription)
@@ -1,42 +1,57 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import delete, literal, select
 from sqlalchemy.orm import Session
 
+from app.database import dialect_insert, on_commit
 from app.models import Follow, User
+from app.principal_cache import Principal
 from app.auth_utils import get_current_user, get_db
+from app.dependencies import DbSession, run_write
 from app.activity_logger import log_activity
+from app.counters import adjust_follow_counts
+from app.social_graph import social_graph
 
 router = APIRouter(prefix="/follow", tags=["Follow System"])
 
 
 @router.post("/{user_id}", status_code=status.HTTP_201_CREATED)
-def follow_user(user_id: int,
-                db: Session = Depends(get_db),
-                current_user: User = Depends(get_current_user)):
+async def follow_user(user_id: int,
+                      db: DbSession = Depends(get_db),
+                      current_user: Principal = Depends(get_current_user)):
     """
     Follow another user unless:
     - Already following
     - Trying to follow self
     """
+    return await run_write(db, _follow_user, user_id, current_user)
+
+
+def _follow_user(db: Session, user_id: int, current_user: Principal):
 
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="You cannot follow yourself.")
 
-    target_user = db.query(User).filter(User.id == user_id).first()
-    if not target_user:
-        raise HTTPException(status_code=404, detail="User does not exist.")
+    if social_graph.is_following(current_user.id, user_id):
+        raise HTTPException(status_code=400, detail="Already following this user.")
 
-    existing = db.query(Follow).filter(
-        Follow.follower_id == current_user.id,
-        Follow.following_id == user_id
+    # One statement: insert if the target exists; the unique pair index
+    # turns a repeat follow into a no-op instead of a duplicate row.
+    inserted = db.execute(
+        dialect_insert(db, Follow)
+        .from_select(
+            ["follower_id", "following_id"],
+            select(literal(current_user.id), User.id).where(User.id == user_id, User.is_active.is_not(False)),
+        )
+        .on_conflict_do_nothing(index_elements=["follower_id", "following_id"])
+        .returning(Follow.id)
     ).first()
 
-    if existing:
+    if not inserted:
+        if not db.query(User.id).filter(User.id == user_id, User.is_active.is_not(False)).first():
+            raise HTTPException(status_code=404, detail="User does not exist.")
         raise HTTPException(status_code=400, detail="Already following this user.")
 
-    follow = Follow(follower_id=current_user.id, following_id=user_id)
-    db.add(follow)
-    db.commit()
-    db.refresh(follow)
+    adjust_follow_counts(db, current_user.id, user_id, +1)
 
     log_activity(
         db=db,
@@ -46,25 +61,31 @@ def follow_user(user_id: int,
         object_id=user_id,
         target_user_id=user_id
     )
+    on_commit(db, social_graph.add_follow, current_user.id, user_id)
+    db.commit()
 
     return {"message": f"You are now following user {user_id}"}
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_200_OK)
-def unfollow_user(user_id: int,
-                  db: Session = Depends(get_db),
-                  current_user: User = Depends(get_current_user)):
+async def unfollow_user(user_id: int,
+                        db: DbSession = Depends(get_db),
+                        current_user: Principal = Depends(get_current_user)):
+    return await run_write(db, _unfollow_user, user_id, current_user)
 
-    follow = db.query(Follow).filter(
-        Follow.follower_id == current_user.id,
-        Follow.following_id == user_id
+
+def _unfollow_user(db: Session, user_id: int, current_user: Principal):
+
+    removed = db.execute(
+        delete(Follow)
+        .where(Follow.follower_id == current_user.id, Follow.following_id == user_id)
+        .returning(Follow.id)
     ).first()
 
-    if not follow:
+    if not removed:
         raise HTTPException(status_code=400, detail="You are not following this user.")
 
-    db.delete(follow)
-    db.commit()
+    adjust_follow_counts(db, current_user.id, user_id, -1)
 
     log_activity(
         db=db,
@@ -74,5 +95,7 @@ def unfollow_user(user_id: int,
         object_id=user_id,
         target_user_id=user_id
     )
+    on_commit(db, social_graph.remove_follow, current_user.id, user_id)
+    db.commit()
 
     return {"message": f"You unfollowed user {user_id}"}
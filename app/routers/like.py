@@ -1,18 +1,72 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import delete, exists, literal, select
 from sqlalchemy.orm import Session
 
-from app.models import Like, Post, Block, User
+from app.database import dialect_insert
+from app.models import Like, Post, Block
+from app.principal_cache import Principal
 from app.auth_utils import get_current_user, get_db
+from app.dependencies import DbSession, run_write
 from app.activity_logger import log_activity
+from app.counters import adjust_like_count
+from app.social_graph import social_graph
+from app.trending import record_like, record_unlike
+from app.write_versions import POSTS, bump_version
 
 router = APIRouter(prefix="/like", tags=["Likes"])
 
 
 @router.post("/{post_id}", status_code=status.HTTP_201_CREATED)
-def like_post(post_id: int,
-              db: Session = Depends(get_db),
-              current_user: User = Depends(get_current_user)):
+async def like_post(post_id: int,
+                    db: DbSession = Depends(get_db),
+                    current_user: Principal = Depends(get_current_user)):
+    return await run_write(db, _like_post, post_id, current_user)
+
+
+def _like_post(db: Session, post_id: int, current_user: Principal):
+
+    # One statement: insert only if the post exists, isn't ours and its author
+    # hasn't blocked us; the unique (user_id, post_id) index absorbs double-likes.
+    likeable = select(literal(current_user.id), Post.id).where(
+        Post.id == post_id,
+        Post.user_id != current_user.id,
+        ~exists().where(
+            Block.blocker_id == Post.user_id,
+            Block.blocked_user_id == current_user.id
+        )
+    )
+    inserted = db.execute(
+        dialect_insert(db, Like)
+        .from_select(["user_id", "post_id"], likeable)
+        .on_conflict_do_nothing(index_elements=["user_id", "post_id"])
+        .returning(Like.id, Like.created_at)
+    ).first()
+
+    if not inserted:
+        _raise_like_refused(db, post_id, current_user)
+
+    author_id = adjust_like_count(db, post_id, +1)
+
+    # Log activity
+    log_activity(
+        db=db,
+        actor_id=current_user.id,
+        verb="LIKED",
+        object_type="post",
+        object_id=post_id,
+        target_user_id=author_id
+    )
+    bump_version(db, POSTS)   # like_count is part of GET /posts/
+    record_like(db, post_id, author_id, inserted.id, inserted.created_at)
+    db.commit()
 
+    return {"message": f"You liked post {post_id}"}
+
+
+def _raise_like_refused(db: Session, post_id: int, current_user: Principal):
+    """
+    Slow path, only after the insert did nothing: work out why.
+    """
     post = db.query(Post).filter(Post.id == post_id).first()
 
     if not post:
@@ -22,56 +76,39 @@ def like_post(post_id: int,
     if post.user_id == current_user.id:
         raise HTTPException(status_code=400, detail="You can’t like your own post.")
 
-    # Check if user is blocked by the post owner
-    blocked = db.query(Block).filter(
-        Block.blocker_id == post.user_id,
-        Block.blocked_user_id == current_user.id
-    ).first()
+    if social_graph.ready:
+        blocked = social_graph.is_blocked(post.user_id, current_user.id)
+    else:
+        blocked = db.query(Block).filter(
+            Block.blocker_id == post.user_id,
+            Block.blocked_user_id == current_user.id
+        ).first()
 
     if blocked:
         raise HTTPException(status_code=403, detail="You are blocked by this user.")
 
-    # Check if already liked
-    existing = db.query(Like).filter(
-        Like.user_id == current_user.id,
-        Like.post_id == post_id
-    ).first()
-
-    if existing:
-        raise HTTPException(status_code=400, detail="Post already liked.")
+    raise HTTPException(status_code=400, detail="Post already liked.")
 
-    like = Like(user_id=current_user.id, post_id=post_id)
-    db.add(like)
-    db.commit()
 
-    # Log activity
-    log_activity(
-        db=db,
-        actor_id=current_user.id,
-        verb="LIKED",
-        object_type="post",
-        object_id=post_id,
-        target_user_id=post.user_id
-    )
-
-    return {"message": f"You liked post {post_id}"}
+@router.delete("/{post_id}", status_code=status.HTTP_200_OK)
+async def unlike_post(post_id: int,
+                      db: DbSession = Depends(get_db),
+                      current_user: Principal = Depends(get_current_user)):
+    return await run_write(db, _unlike_post, post_id, current_user)
 
 
-@router.delete("/{post_id}", status_code=status.HTTP_200_OK)
-def unlike_post(post_id: int,
-                db: Session = Depends(get_db),
-                current_user: User = Depends(get_current_user)):
+def _unlike_post(db: Session, post_id: int, current_user: Principal):
 
-    like = db.query(Like).filter(
-        Like.user_id == current_user.id,
-        Like.post_id == post_id
+    removed = db.execute(
+        delete(Like)
+        .where(Like.user_id == current_user.id, Like.post_id == post_id)
+        .returning(Like.id, Like.created_at)
     ).first()
 
-    if not like:
+    if not removed:
         raise HTTPException(status_code=400, detail="You have not liked this post.")
 
-    db.delete(like)
-    db.commit()
+    adjust_like_count(db, post_id, -1)
 
     log_activity(
         db=db,
@@ -80,5 +117,8 @@ def unlike_post(post_id: int,
         object_type="post",
         object_id=post_id
     )
+    bump_version(db, POSTS)
+    record_unlike(db, post_id, removed.created_at)
+    db.commit()
 
     return {"message": f"You unliked post {post_id}"}
@@ -1,33 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.models import Post, User
+from app.models import Post
 from app.schemas import UserOut
+from app.principal_cache import Principal
 from app.auth_utils import get_current_user, get_db, require_admin
+from app.database import on_commit
+from app.dependencies import DbSession, run_db, run_write
 from app.activity_logger import log_activity
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    before_keyset,
+    decode_cursor,
+    decode_timestamp_cursor,
+    encode_cursor,
+)
+from app import search
+from app.timeline import blockers_of
+from app.trending import hotness, trending
+from app.write_versions import LISTING_CACHE_CONTROL, POSTS, bump_version, etag_matches, listing_etag, not_modified
 
 
 router = APIRouter(prefix="/posts", tags=["Posts"])
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def create_post(content: str, 
-                db: Session = Depends(get_db),
-                current_user: User = Depends(get_current_user)):
+async def create_post(content: str,
+                      db: DbSession = Depends(get_db),
+                      current_user: Principal = Depends(get_current_user)):
     """
     Create a new post. Only authenticated users can post.
     """
     if not content.strip():
         raise HTTPException(status_code=400, detail="Post content cannot be empty.")
 
+    return await run_write(db, _create_post, content, current_user)
+
+
+def _create_post(db: Session, content: str, current_user: Principal):
+
     post = Post(
         user_id=current_user.id,
         content=content
     )
 
     db.add(post)
-    db.commit()
-    db.refresh(post)
+    db.flush()  # assigns post.id
 
     # Log activity
     log_activity(
@@ -37,38 +59,208 @@ def create_post(content: str,
         object_type="post",
         object_id=post.id
     )
+    bump_version(db, POSTS)
+    db.commit()
 
     return {"id": post.id, "content": post.content, "created_by": current_user.name}
 
 
+# Fields a client may request through `fields=`, mapped to their columns
+POST_FIELDS = {
+    "id": Post.id,
+    "content": Post.content,
+    "author_id": Post.user_id,
+    "created_at": Post.created_at,
+    "like_count": Post.like_count,
+}
+
+
 @router.get("/", status_code=status.HTTP_200_OK)
-def get_all_posts(db: Session = Depends(get_db),
-                  current_user: User = Depends(get_current_user)):
+async def get_all_posts(response: Response,
+                        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        cursor: Optional[str] = None,
+                        author_id: Optional[int] = None,
+                        fields: Optional[str] = None,
+                        if_none_match: Optional[str] = Header(None),
+                        db: DbSession = Depends(get_db),
+                        current_user: Principal = Depends(get_current_user)):
+    """
+    Returns one page of posts, newest first. Requires authentication.
+    - `author_id` limits the page to one author
+    - `fields` is a comma-separated subset of: id, content, author_id, created_at, like_count
+    Posts from users who blocked the caller are hidden.
+    Send the `ETag` back as `If-None-Match` to get a 304 while nothing changed.
+    """
+    if fields:
+        selected = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = set(selected) - POST_FIELDS.keys()
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    else:
+        selected = list(POST_FIELDS)
+
+    keyset = decode_timestamp_cursor(cursor) if cursor else None
+
+    etag, page = await run_db(db, _get_all_posts, current_user.id, limit, keyset, author_id, selected, if_none_match)
+    if page is None:
+        return not_modified(etag)
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = LISTING_CACHE_CONTROL
+    return page
+
+
+def _get_all_posts(db: Session, user_id: int, limit: int, keyset, author_id, selected,
+                   if_none_match: Optional[str] = None):
     """
-    Returns list of all posts. Requires authentication.
+    Returns (etag, page); page is None when `if_none_match` is still current.
     """
-    posts = db.query(Post).all()
+    etag = listing_etag(db, POSTS, user_id)
+    if etag_matches(if_none_match, etag):
+        return etag, None
+
+    # Core select of just the requested columns (plus the sort key)
+    columns = {name: POST_FIELDS[name] for name in selected}
+    columns.setdefault("id", Post.id)
+    columns.setdefault("created_at", Post.created_at)
+
+    query = (
+        select(*[col.label(name) for name, col in columns.items()])
+        .where(Post.user_id.not_in(blockers_of(user_id)))
+        .order_by(Post.created_at.desc(), Post.id.desc())
+    )
+
+    if author_id is not None:
+        query = query.where(Post.user_id == author_id)
+
+    if keyset:
+        created_at, last_id = keyset
+        query = query.where(before_keyset(Post.created_at, Post.id, created_at, last_id))
 
-    return [
-        {
-            "id": post.id,
-            "content": post.content,
-            "author_id": post.user_id,
-            "created_at": post.created_at
-        }
-        for post in posts
-    ]
+    rows = db.execute(query.limit(limit + 1)).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    return etag, {
+        "items": [{name: row[name] for name in selected} for row in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+@router.get("/trending", status_code=status.HTTP_200_OK)
+async def trending_posts(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                         db: DbSession = Depends(get_db),
+                         current_user: Principal = Depends(get_current_user)):
+    """
+    The hottest posts right now. Every like counts, but for less as it ages
+    (its weight halves every TRENDING_HALF_LIFE seconds); `hotness` is the
+    total, in fresh likes. Posts from users who blocked the caller are hidden.
+    """
+    return await run_db(db, _get_trending_posts, current_user.id, limit)
+
+
+def _get_trending_posts(db: Session, user_id: int, limit: int):
+
+    blockers = blockers_of(user_id)
+    if trending.ready and not isinstance(blockers, list):
+        blockers = db.scalars(blockers).all()
+
+    # Ranked posts whose rows are gone (deleted along with their author) leave
+    # the ranking; rank again so the page still fills up to `limit`
+    while True:
+        ranked = _rank_trending(db, limit, blockers)
+        rows = db.execute(
+            select(*[col.label(name) for name, col in POST_FIELDS.items()])
+            .where(Post.id.in_([post_id for post_id, _ in ranked]))
+        ).mappings().all()
+        by_id = {row["id"]: row for row in rows}
+
+        missing = [post_id for post_id, _ in ranked if post_id not in by_id]
+        if not missing:
+            break
+        for post_id in missing:
+            trending.remove_post(post_id)
+
+    return {"items": [{**by_id[post_id], "hotness": round(hotness(score), 3)} for post_id, score in ranked]}
+
+
+def _rank_trending(db: Session, limit: int, blockers) -> list:
+    if trending.ready:
+        return trending.top(limit, blockers)
+
+    # Ranking not in memory (not loaded yet, or several workers): the column, through its index
+    return db.execute(
+        select(Post.id, Post.trending_score)
+        .where(Post.trending_score.is_not(None), Post.user_id.not_in(blockers))
+        .order_by(Post.trending_score.desc())
+        .limit(limit)
+    ).all()
+
+
+@router.get("/search", status_code=status.HTTP_200_OK)
+async def search_posts(q: str = Query(..., min_length=1, max_length=200),
+                       limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       cursor: Optional[str] = None,
+                       db: DbSession = Depends(get_db),
+                       current_user: Principal = Depends(get_current_user)):
+    """
+    Full-text search over post content, best matches first (BM25).
+    - All words must match; end a word with `*` for a prefix search (`hel*`)
+    - `snippet` is HTML: the post text escaped, matches in <mark> tags
+    Posts from users who blocked the caller are hidden.
+    """
+    if not search.search_available:
+        raise HTTPException(status_code=501, detail="Search is not available on this database.")
+
+    match = search.to_match_query(q)
+    if not match:
+        raise HTTPException(status_code=400, detail="Search query has no searchable words.")
+
+    after = None
+    if cursor:
+        score, last_id = decode_cursor(cursor, 2)
+        if not isinstance(score, (int, float)) or not isinstance(last_id, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+        after = (score, last_id)
+
+    return await run_db(db, _search_posts, current_user.id, match, limit, after)
+
+
+def _search_posts(db: Session, user_id: int, match: str, limit: int, after):
+
+    rows = db.execute(
+        search.search_query(match, blockers_of(user_id), limit + 1, after)
+    ).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1]["score"], rows[-1]["id"])
+
+    return {
+        "items": [{**row, "snippet": search.render_snippet(row["snippet"])} for row in rows],
+        "next_cursor": next_cursor,
+    }
 
 
 @router.delete("/{post_id}", status_code=status.HTTP_200_OK)
-def delete_post(post_id: int,
-                db: Session = Depends(get_db),
-                current_user: User = Depends(get_current_user)):
+async def delete_post(post_id: int,
+                      db: DbSession = Depends(get_db),
+                      current_user: Principal = Depends(get_current_user)):
     """
     Delete a post.
     - Users can delete their own posts
     - Admin and Owner can delete any post
     """
+    return await run_write(db, _delete_post, post_id, current_user)
+
+
+def _delete_post(db: Session, post_id: int, current_user: Principal):
 
     post = db.query(Post).filter(Post.id == post_id).first()
 
@@ -84,7 +276,6 @@ def delete_post(post_id: int,
         post.deleted_by = current_user.role
 
     db.delete(post)
-    db.commit()
 
     # Log activity
     log_activity(
@@ -94,5 +285,8 @@ def delete_post(post_id: int,
         object_type="post",
         object_id=post.id
     )
+    bump_version(db, POSTS)
+    on_commit(db, trending.remove_post, post.id)
+    db.commit()
 
     return {"message": "Post deleted"}
@@ -0,0 +1,97 @@
+from fastapi import APIRouter, Depends, Query, status
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, aliased
+
+from app.models import Follow
+from app.principal_cache import Principal
+from app.auth_utils import get_current_user, get_db
+from app.dependencies import DbSession, run_db
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.social_graph import social_graph
+
+router = APIRouter(prefix="/users", tags=["Social Graph"])
+
+
+# These endpoints are answered from the in-memory social graph and never
+# touch the database, except while it is not loaded (several worker
+# processes): then the follows table's two covering indexes serve them.
+
+def _page(user_ids, user_id: int, limit: int, offset: int) -> dict:
+    return {
+        "user_id": user_id,
+        "total": len(user_ids),
+        "items": list(user_ids[offset:offset + limit]),
+    }
+
+
+def _page_from_db(db: Session, query, user_id: int, limit: int, offset: int) -> dict:
+    """
+    `_page` for the one-column select of user ids `query(user_id)`,
+    sorted and sliced by the database.
+    """
+    ids = query(user_id).subquery()
+    user_ids = ids.c[0]
+    return {
+        "user_id": user_id,
+        "total": db.scalar(select(func.count()).select_from(ids)),
+        "items": db.scalars(select(user_ids).order_by(user_ids).limit(limit).offset(offset)).all(),
+    }
+
+
+def _followers_query(user_id: int):
+    return select(Follow.follower_id).where(Follow.following_id == user_id)
+
+
+def _following_query(user_id: int):
+    return select(Follow.following_id).where(Follow.follower_id == user_id)
+
+
+def _mutuals_query(user_id: int):
+    back = aliased(Follow)
+    return (
+        select(Follow.following_id)
+        .join(back, (back.follower_id == Follow.following_id) & (back.following_id == user_id))
+        .where(Follow.follower_id == user_id)
+    )
+
+
+async def _listing(db: DbSession, from_graph, query, user_id: int, limit: int, offset: int) -> dict:
+    if social_graph.ready:
+        return _page(from_graph(user_id), user_id, limit, offset)
+    return await run_db(db, _page_from_db, query, user_id, limit, offset)
+
+
+@router.get("/{user_id}/followers", status_code=status.HTTP_200_OK)
+async def list_followers(user_id: int,
+                         limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                         offset: int = Query(0, ge=0),
+                         db: DbSession = Depends(get_db),
+                         current_user: Principal = Depends(get_current_user)):
+    """
+    Ids of the users following `user_id`, ascending.
+    """
+    return await _listing(db, social_graph.followers, _followers_query, user_id, limit, offset)
+
+
+@router.get("/{user_id}/following", status_code=status.HTTP_200_OK)
+async def list_following(user_id: int,
+                         limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                         offset: int = Query(0, ge=0),
+                         db: DbSession = Depends(get_db),
+                         current_user: Principal = Depends(get_current_user)):
+    """
+    Ids of the users `user_id` follows, ascending.
+    """
+    return await _listing(db, social_graph.following, _following_query, user_id, limit, offset)
+
+
+@router.get("/{user_id}/mutuals", status_code=status.HTTP_200_OK)
+async def list_mutuals(user_id: int,
+                       limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       offset: int = Query(0, ge=0),
+                       db: DbSession = Depends(get_db),
+                       current_user: Principal = Depends(get_current_user)):
+    """
+    Ids of the users who follow `user_id` and are followed back, ascending.
+    """
+    return await _listing(db, social_graph.mutuals, _mutuals_query, user_id, limit, offset)
@@ -0,0 +1,172 @@
+import html
+import logging
+import re
+
+from sqlalchemy import and_, column, func, inspect, literal_column, or_, select, table
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Full-text search over posts (SQLite FTS5)
+# -------------------------------
+# posts_fts is an external-content FTS5 index over posts.content: it stores
+# only the inverted index, and triggers on `posts` keep it in sync for every
+# write path (create_post, delete_post, user deletion jobs, bulk deletes).
+
+FTS_TABLE = "posts_fts"
+
+# Queries are reduced to at most this many terms
+MAX_QUERY_TERMS = 8
+
+SEARCH_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        content,
+        content='posts',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF content ON posts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+]
+
+# Set by ensure_search_index(); search answers 501 while False
+search_available = False
+
+
+def ensure_search_index(engine) -> bool:
+    """
+    Creates the FTS table and its triggers if missing, indexing existing posts
+    when the table is new. Returns whether search is available
+    (SQLite built with FTS5); other backends are not supported.
+    """
+    global search_available
+
+    if engine.dialect.name != "sqlite":
+        search_available = False
+        return False
+
+    with engine.begin() as conn:
+        created = not inspect(conn).has_table(FTS_TABLE)
+        try:
+            for ddl in SEARCH_DDL:
+                conn.exec_driver_sql(ddl)
+        except Exception:
+            logger.warning("SQLite FTS5 is not available; GET /posts/search is disabled", exc_info=True)
+            search_available = False
+            return False
+
+        if created:
+            rebuild_search_index(conn)
+
+    search_available = True
+    return True
+
+
+def rebuild_search_index(conn):
+    """
+    Re-reads every post into the index (after restores or manual edits to posts).
+    """
+    conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+# ---- query building ----
+
+TERM = re.compile(r"\w+\*?", re.UNICODE)
+
+
+def to_match_query(text: str) -> str:
+    """
+    Turns user input into a safe FTS5 MATCH expression: every word becomes a
+    quoted term (so FTS operators in the input are inert), a trailing `*`
+    makes it a prefix query, and all terms must match.
+    Returns "" if nothing searchable is left.
+    """
+    terms = []
+    for token in TERM.findall(text)[:MAX_QUERY_TERMS]:
+        word, prefix = token.rstrip("*"), token.endswith("*")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+# snippet() wraps matches in these control characters, which post text does
+# not contain; the snippet is HTML-escaped before they become <mark> tags
+MATCH_START, MATCH_END = "\x02", "\x03"
+
+
+def render_snippet(raw: str) -> str:
+    """
+    The snippet as HTML: post text escaped, matches in <mark> tags.
+    """
+    if raw is None:
+        return None
+    return html.escape(raw).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+
+
+fts = table(FTS_TABLE, column("rowid"))
+fts_ref = literal_column(FTS_TABLE)
+
+
+def search_query(match: str, blockers, limit: int, after=None):
+    """
+    One page of posts matching `match`, best BM25 score first (lower is
+    better), ties broken by id. `after` is the (score, id) of the last row
+    of the previous page. Posts by `blockers` are excluded.
+    """
+    score = func.bm25(fts_ref)
+
+    query = (
+        select(
+            Post.id.label("id"),
+            Post.user_id.label("author_id"),
+            Post.created_at.label("created_at"),
+            Post.like_count.label("like_count"),
+            func.snippet(fts_ref, 0, MATCH_START, MATCH_END, "…", 16).label("snippet"),
+            score.label("score"),
+        )
+        .select_from(fts.join(Post, Post.id == fts.c.rowid))
+        .where(
+            fts_ref.op("MATCH")(match),
+            Post.user_id.not_in(blockers),
+        )
+        .order_by(score, Post.id)
+        .limit(limit)
+    )
+
+    if after is not None:
+        last_score, last_id = after
+        query = query.where(or_(score > last_score, and_(score == last_score, Post.id > last_id)))
+
+    return query
+
+
+if __name__ == "__main__":
+    # python -m app.search  ->  (re)build the posts search index from the posts table
+    from .database import engine, init_db
+
+    init_db()
+    if not ensure_search_index(engine):
+        raise SystemExit("Full-text search is not available on this database.")
+    with engine.begin() as conn:
+        rebuild_search_index(conn)
+    print("Search index rebuilt.")
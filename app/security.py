@@ -1,7 +1,21 @@
+import asyncio
+import hashlib
+import multiprocessing
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import jwt
 
+from .config import (
+    ARGON2_MEMORY_COST,
+    ARGON2_PARALLELISM,
+    ARGON2_TIME_COST,
+    HASH_POOL_SIZE,
+    HASH_QUEUE_LIMIT,
+)
+
 # -------------------------------
 # Security Configuration
 # -------------------------------
@@ -10,7 +24,8 @@ from jose import jwt
 # Store it in environment variables (.env file).
 SECRET_KEY = "super_secret_key_change_in_production"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
+ACCESS_TOKEN_EXPIRE_MINUTES = 15       # short-lived; renewed via refresh tokens
+REFRESH_TOKEN_EXPIRE_DAYS = 30
 
 # -------------------------------
 # Password Hashing (Using Argon2)
@@ -18,7 +33,10 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
 pwd_context = CryptContext(
     schemes=["argon2"],
-    deprecated="auto"
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
 )
 
 
@@ -36,6 +54,67 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """
+    Verifies a password and, if the stored hash was made with outdated Argon2
+    parameters, also returns a fresh hash to store: (is_valid, new_hash or None).
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+# -------------------------------
+# Hashing Process Pool
+# -------------------------------
+
+class HashingOverloaded(Exception):
+    """
+    Raised when too many hashes are already queued; callers should answer 503.
+    """
+
+
+class HashingPool:
+    """
+    Runs Argon2 in worker processes so login spikes cannot starve the event
+    loop or the threadpool. At most `queue_limit` calls may be in flight;
+    further calls are rejected immediately instead of queueing.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.in_flight = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # "spawn" avoids forking a process that already runs threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def run(self, fn, *args):
+        # Only touched from the event loop thread, so a plain counter is enough
+        if self.in_flight >= self.queue_limit:
+            raise HashingOverloaded()
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool(HASH_POOL_SIZE, HASH_QUEUE_LIMIT)
+
+
 # -------------------------------
 # JWT Token Generation
 # -------------------------------
@@ -49,3 +128,22 @@ def create_access_token(data: dict) -> str:
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode["exp"] = expire
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+# -------------------------------
+# Refresh Tokens
+# -------------------------------
+
+def create_refresh_token() -> str:
+    """
+    Creates an opaque, random refresh token. Only its hash is ever stored.
+    """
+    return secrets.token_urlsafe(32)
+
+
+def hash_refresh_token(token: str) -> str:
+    """
+    Refresh tokens carry 256 bits of randomness, so a fast hash is enough
+    (unlike passwords, they cannot be brute-forced from the digest).
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
@@ -0,0 +1,192 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .models import Block, Follow
+
+
+# -------------------------------
+# In-memory follow / block adjacency index
+# -------------------------------
+# Every user's neighbours are kept as a sorted array of 64-bit ints:
+# ~8 bytes per edge end, O(log n) membership, and merge-style intersections.
+# The database stays the source of truth; the routers update this index
+# after each commit, and it is rebuilt from the tables at startup. With
+# several worker processes it is never warmed (no process sees every
+# write) and callers use the tables instead.
+
+def _sorted_array(values) -> array:
+    return array("q", sorted(set(values)))
+
+
+def _add(index: dict, key: int, value: int):
+    arr = index.get(key)
+    if arr is None:
+        index[key] = array("q", [value])
+        return
+    i = bisect_left(arr, value)
+    if i == len(arr) or arr[i] != value:
+        arr.insert(i, value)
+
+
+def _remove(index: dict, key: int, value: int):
+    arr = index.get(key)
+    if arr is None:
+        return
+    i = bisect_left(arr, value)
+    if i < len(arr) and arr[i] == value:
+        del arr[i]
+        if not arr:
+            del index[key]
+
+
+def _contains(arr, value: int) -> bool:
+    if arr is None:
+        return False
+    i = bisect_left(arr, value)
+    return i < len(arr) and arr[i] == value
+
+
+def _intersect(a, b) -> list:
+    result, i, j = [], 0, 0
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]:
+            result.append(a[i])
+            i += 1
+            j += 1
+        elif a[i] < b[j]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+class SocialGraph:
+
+    def __init__(self):
+        self.ready = False
+        self._lock = threading.RLock()
+        self._following = {}    # user -> users they follow
+        self._followers = {}    # user -> users following them
+        self._blocking = {}     # user -> users they blocked
+        self._blocked_by = {}   # user -> users who blocked them
+
+    # ---- loading ----
+
+    def warm(self, db: Session, batch_size: int = 10000):
+        """
+        Rebuilds the whole index from the follows and blocks tables.
+        """
+        following, followers = defaultdict(list), defaultdict(list)
+        blocking, blocked_by = defaultdict(list), defaultdict(list)
+
+        rows = db.execute(
+            select(Follow.follower_id, Follow.following_id).execution_options(yield_per=batch_size)
+        )
+        for follower_id, following_id in rows:
+            following[follower_id].append(following_id)
+            followers[following_id].append(follower_id)
+
+        rows = db.execute(
+            select(Block.blocker_id, Block.blocked_user_id).execution_options(yield_per=batch_size)
+        )
+        for blocker_id, blocked_id in rows:
+            blocking[blocker_id].append(blocked_id)
+            blocked_by[blocked_id].append(blocker_id)
+
+        with self._lock:
+            self._following = {k: _sorted_array(v) for k, v in following.items()}
+            self._followers = {k: _sorted_array(v) for k, v in followers.items()}
+            self._blocking = {k: _sorted_array(v) for k, v in blocking.items()}
+            self._blocked_by = {k: _sorted_array(v) for k, v in blocked_by.items()}
+            self.ready = True
+
+    # ---- updates (call after the matching commit; ignored until warm) ----
+
+    def add_follow(self, follower_id: int, following_id: int):
+        if not self.ready:
+            return
+        with self._lock:
+            _add(self._following, follower_id, following_id)
+            _add(self._followers, following_id, follower_id)
+
+    def remove_follow(self, follower_id: int, following_id: int):
+        if not self.ready:
+            return
+        with self._lock:
+            _remove(self._following, follower_id, following_id)
+            _remove(self._followers, following_id, follower_id)
+
+    def add_block(self, blocker_id: int, blocked_id: int):
+        if not self.ready:
+            return
+        with self._lock:
+            _add(self._blocking, blocker_id, blocked_id)
+            _add(self._blocked_by, blocked_id, blocker_id)
+
+    def remove_block(self, blocker_id: int, blocked_id: int):
+        if not self.ready:
+            return
+        with self._lock:
+            _remove(self._blocking, blocker_id, blocked_id)
+            _remove(self._blocked_by, blocked_id, blocker_id)
+
+    def remove_user(self, user_id: int):
+        """
+        Drops every edge touching a deleted user.
+        """
+        if not self.ready:
+            return
+        with self._lock:
+            for other in list(self._following.get(user_id, ())):
+                self.remove_follow(user_id, other)
+            for other in list(self._followers.get(user_id, ())):
+                self.remove_follow(other, user_id)
+            for other in list(self._blocking.get(user_id, ())):
+                self.remove_block(user_id, other)
+            for other in list(self._blocked_by.get(user_id, ())):
+                self.remove_block(other, user_id)
+
+    # ---- queries ----
+
+    def followers(self, user_id: int) -> array:
+        with self._lock:
+            return array("q", self._followers.get(user_id, ()))
+
+    def following(self, user_id: int) -> array:
+        with self._lock:
+            return array("q", self._following.get(user_id, ()))
+
+    def mutuals(self, user_id: int) -> list:
+        """
+        Users that `user_id` follows and who follow back.
+        """
+        with self._lock:
+            return _intersect(self._following.get(user_id, ()), self._followers.get(user_id, ()))
+
+    def blockers_of(self, user_id: int) -> list:
+        with self._lock:
+            return list(self._blocked_by.get(user_id, ()))
+
+    def is_following(self, follower_id: int, following_id: int) -> bool:
+        with self._lock:
+            return _contains(self._following.get(follower_id), following_id)
+
+    def is_blocked(self, blocker_id: int, blocked_id: int) -> bool:
+        with self._lock:
+            return _contains(self._blocking.get(blocker_id), blocked_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "follow_edges": sum(len(v) for v in self._following.values()),
+                "block_edges": sum(len(v) for v in self._blocking.values()),
+            }
+
+
+social_graph = SocialGraph()
@@ -0,0 +1,162 @@
+from sqlalchemy import delete, insert, literal, select, union_all
+from sqlalchemy.orm import Session, aliased
+
+from .models import Activity, Block, Follow, TimelineEntry, User
+from .social_graph import social_graph
+
+
+# -------------------------------
+# Home Timeline Configuration
+# -------------------------------
+
+# Authors with at least this many followers are not fanned out on write;
+# their followers pull those activities at read time instead.
+FANOUT_FOLLOWER_LIMIT = 5000
+
+# Each inbox keeps roughly this many of its newest entries.
+TIMELINE_MAX_ENTRIES = 800
+
+# Inboxes are trimmed on every Nth activity so the cost is amortised. An
+# inbox whose deliveries miss those activities is trimmed by the periodic
+# retention pass instead.
+TIMELINE_TRIM_INTERVAL = 50
+
+
+def blockers_of(user_id: int):
+    """
+    Users who have blocked `user_id`; their content is hidden from them.
+    Read from the in-memory graph once it is warm, otherwise a subquery.
+    """
+    if social_graph.ready:
+        return social_graph.blockers_of(user_id)
+    return select(Block.blocker_id).where(Block.blocked_user_id == user_id)
+
+
+def fan_out(db: Session, activity: Activity):
+    """
+    Copies a freshly inserted activity into the inboxes of the actor's followers
+    (and the actor's own). Followers on either side of a block are skipped.
+    High-fanout authors only write to their own inbox; followers pull the rest.
+    """
+    actor_id = activity.actor_id
+
+    follower_count = db.scalar(select(User.follower_count).where(User.id == actor_id)) or 0
+
+    if follower_count >= FANOUT_FOLLOWER_LIMIT:
+        recipients = select(literal(actor_id))
+    else:
+        recipients = union_all(
+            select(literal(actor_id)),
+            select(Follow.follower_id).where(
+                Follow.following_id == actor_id,
+                Follow.follower_id.not_in(
+                    select(Block.blocked_user_id).where(Block.blocker_id == actor_id)
+                ),
+                Follow.follower_id.not_in(
+                    select(Block.blocker_id).where(Block.blocked_user_id == actor_id)
+                ),
+            ),
+        )
+
+    recipients = recipients.subquery()
+    recipient_id = recipients.c[0]
+
+    db.execute(
+        insert(TimelineEntry).from_select(
+            ["user_id", "activity_id", "actor_id"],
+            select(recipient_id, literal(activity.id), literal(actor_id)),
+        )
+    )
+
+    if activity.id % TIMELINE_TRIM_INTERVAL == 0:
+        trim_inboxes(db, select(recipient_id))
+
+
+def trim_inboxes(db: Session, user_ids):
+    """
+    Drops everything older than the newest TIMELINE_MAX_ENTRIES per inbox.
+    """
+    newer = aliased(TimelineEntry)
+    cutoff = (
+        select(newer.activity_id)
+        .where(newer.user_id == TimelineEntry.user_id)
+        .order_by(newer.activity_id.desc())
+        .offset(TIMELINE_MAX_ENTRIES - 1)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    db.execute(
+        delete(TimelineEntry).where(
+            TimelineEntry.user_id.in_(user_ids),
+            TimelineEntry.activity_id < cutoff,
+        )
+    )
+
+
+def inbox_overflow(user_id):
+    """
+    The newest activity id in `user_id`'s inbox (a value or a correlated
+    column) beyond the TIMELINE_MAX_ENTRIES it keeps; NULL within the cap.
+    """
+    return (
+        select(TimelineEntry.activity_id)
+        .where(TimelineEntry.user_id == user_id)
+        .order_by(TimelineEntry.activity_id.desc())
+        .offset(TIMELINE_MAX_ENTRIES)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def home_timeline_query(user_id: int, limit: int, before_id: int = None):
+    """
+    Builds the query for one page of a user's home timeline, newest first.
+    Merges the pushed inbox with activities pulled from high-fanout authors
+    the user follows; both sides are bounded by the page size.
+    """
+    blockers = blockers_of(user_id)
+
+    pushed = (
+        select(TimelineEntry.activity_id.label("activity_id"))
+        .where(
+            TimelineEntry.user_id == user_id,
+            TimelineEntry.actor_id.not_in(blockers),
+        )
+        .order_by(TimelineEntry.activity_id.desc())
+        .limit(limit)
+    )
+
+    pulled_authors = (
+        select(Follow.following_id)
+        .join(User, User.id == Follow.following_id)
+        .where(
+            Follow.follower_id == user_id,
+            User.follower_count >= FANOUT_FOLLOWER_LIMIT,
+        )
+    )
+    pulled = (
+        select(Activity.id.label("activity_id"))
+        .where(
+            Activity.actor_id.in_(pulled_authors),
+            Activity.actor_id.not_in(blockers),
+        )
+        .order_by(Activity.id.desc())
+        .limit(limit)
+    )
+
+    if before_id is not None:
+        pushed = pushed.where(TimelineEntry.activity_id < before_id)
+        pulled = pulled.where(Activity.id < before_id)
+
+    candidates = union_all(
+        select(pushed.subquery().c.activity_id),
+        select(pulled.subquery().c.activity_id),
+    )
+
+    return (
+        select(Activity)
+        .where(Activity.id.in_(candidates))
+        .order_by(Activity.id.desc())
+        .limit(limit)
+    )
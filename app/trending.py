@@ -0,0 +1,369 @@
+import logging
+import math
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from .config import MULTI_PROCESS, TRENDING_CHECKPOINT_INTERVAL, TRENDING_HALF_LIFE, TRENDING_MIN_HOTNESS
+from .database import SessionLocal, dialect_insert, on_commit
+from .models import Like, Post, WriteVersion
+from .write_versions import current_version
+from .writer import write_turn
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Trending posts
+# -------------------------------
+# A post's hotness is the sum over its likes of 2^(-age / half-life): a fresh
+# like counts 1, a like one half-life old counts 0.5. It is kept as
+#     score = ln(sum of e^(λ * (liked_at - EPOCH)))
+# which never has to be decayed: time shrinks every post's hotness by the
+# same factor, so the order only changes when likes come and go, and
+# hotness = e^(score - λ * (now - EPOCH)). Log space keeps the numbers small
+# however far `now` gets from EPOCH.
+#
+# The ranking lives in memory, updated after each like / unlike / delete
+# commits, and is checkpointed to posts.trending_score every
+# TRENDING_CHECKPOINT_INTERVAL seconds along with the id of the newest like
+# it includes. At startup the checkpoint is loaded and newer likes are
+# replayed (the first start replays every like, backfilling the column).
+# Posts that cool below TRENDING_MIN_HOTNESS leave memory at each checkpoint;
+# a later like or unlike starts from the score checkpointed for them, read in
+# its own transaction (or by the next checkpoint if the post left meanwhile).
+#
+# With several worker processes no one process sees every like, so the
+# ranking is not kept in memory: each like / unlike updates the column in
+# its own transaction, and GET /posts/trending reads it through
+# ix_posts_trending_score.
+
+EPOCH = datetime(2024, 1, 1)
+DECAY = math.log(2) / TRENDING_HALF_LIFE    # λ, per second
+
+# write_versions row holding the id of the newest like in the checkpoint
+CHECKPOINT = "trending_checkpoint"
+
+
+def log_weight(at: datetime) -> float:
+    return DECAY * (at - EPOCH).total_seconds()
+
+
+def hotness(score: float, now: datetime = None) -> float:
+    return math.exp(score - log_weight(now or datetime.utcnow()))
+
+
+def _log_add(score, weight):
+    if score is None:
+        return weight
+    high, low = max(score, weight), min(score, weight)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _log_sub(score, weight):
+    """
+    ln(e^score - e^weight), or None once nothing is left.
+    """
+    if score is None or weight >= score - 1e-9:
+        return None
+    return score + math.log1p(-math.exp(weight - score))
+
+
+# A stored score the caller did not read (None is a read score: nothing yet)
+UNREAD = object()
+
+
+def _floor(now: datetime) -> float:
+    return log_weight(now) + math.log(TRENDING_MIN_HOTNESS)
+
+
+class TrendingIndex:
+
+    def __init__(self, interval: float = TRENDING_CHECKPOINT_INTERVAL):
+        self.ready = False
+        self.interval = interval
+        self.checkpoints = 0
+        self._lock = threading.Lock()
+        self._scores = {}      # post id -> (score, author id)
+        self._ranking = []     # sorted (-score, post id): hottest first
+        self._dirty = {}       # post id -> score (None: cleared) since the last checkpoint
+        self._flushing = {}    # the dirty scores a running checkpoint is writing
+        self._deferred = []    # (post id, change, author id) awaiting a column read at the checkpoint
+        self._watermark = 0    # newest like id applied
+        self._stopping = threading.Event()
+        self._thread = None
+
+    # ---- loading ----
+
+    def warm(self, db: Session, batch_size: int = 10000):
+        """
+        Loads the last checkpoint (posts still above the hotness floor) and
+        replays the likes written after it.
+        """
+        now = datetime.utcnow()
+        scores = {}
+
+        rows = db.execute(
+            select(Post.id, Post.user_id, Post.trending_score)
+            .where(Post.trending_score >= _floor(now))
+            .execution_options(yield_per=batch_size)
+        )
+        for post_id, author_id, score in rows:
+            scores[post_id] = [score, author_id]
+
+        watermark = current_version(db, CHECKPOINT)
+        replayed = set()
+        likes = db.execute(
+            select(Like.id, Like.post_id, Like.created_at, Post.user_id)
+            .join(Post, Post.id == Like.post_id)
+            .where(Like.id > watermark)
+            .order_by(Like.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for like_id, post_id, liked_at, author_id in likes:
+            entry = scores.setdefault(post_id, [None, author_id])
+            entry[0] = _log_add(entry[0], log_weight(liked_at or now))
+            replayed.add(post_id)
+            watermark = like_id
+
+        floor = _floor(now)
+        with self._lock:
+            self._scores = {
+                post_id: (score, author_id) for post_id, (score, author_id) in scores.items() if score >= floor
+            }
+            self._ranking = sorted((-score, post_id) for post_id, (score, _) in self._scores.items())
+            self._dirty = {post_id: scores[post_id][0] for post_id in replayed}
+            self._watermark = watermark
+            self.ready = True
+
+    # ---- updates (call after the matching commit; ignored until warm) ----
+
+    def _set(self, post_id: int, author_id, score):
+        # Caller holds the lock
+        if not self.ready:
+            return
+        previous = self._scores.pop(post_id, None)
+        if previous is not None:
+            del self._ranking[bisect_left(self._ranking, (-previous[0], post_id))]
+        if score is not None:
+            self._scores[post_id] = (score, author_id)
+            insort(self._ranking, (-score, post_id))
+        self._dirty[post_id] = score
+
+    def holds(self, post_id: int) -> bool:
+        """
+        Whether an update to the post can be applied without its stored
+        score: it is in memory or pending a checkpoint (or nothing is loaded).
+        """
+        with self._lock:
+            return not self.ready or post_id in self._scores or post_id in self._dirty or post_id in self._flushing
+
+    def _update(self, post_id: int, change, stored=UNREAD, author_id=None):
+        """
+        Applies `change` to the post's score. A post that is not in memory
+        starts from `stored`, its checkpointed score, not from nothing; if that
+        was not read (the post left memory since), the next checkpoint reads it.
+        `author_id` None keeps the post out of memory (only a like can make it
+        hot again). Never touches the database: it runs from commit hooks.
+        """
+        with self._lock:
+            if not self.ready:
+                return
+            entry = self._scores.get(post_id)
+            if entry is not None:
+                self._set(post_id, entry[1], change(entry[0]))
+                return
+
+            pending = self._dirty if post_id in self._dirty else self._flushing
+            if post_id in pending:
+                stored = pending[post_id]
+            elif stored is UNREAD:
+                self._deferred.append((post_id, change, author_id))
+                return
+
+            if author_id is None:
+                self._dirty[post_id] = change(stored)
+            else:
+                self._set(post_id, author_id, change(stored))
+
+    def add_like(self, post_id: int, author_id: int, like_id: int, liked_at: datetime, stored=UNREAD):
+        weight = log_weight(liked_at)
+        self._update(post_id, lambda score: _log_add(score, weight), stored, author_id)
+        with self._lock:
+            self._watermark = max(self._watermark, like_id)
+
+    def remove_like(self, post_id: int, liked_at: datetime, stored=UNREAD):
+        """
+        Takes back exactly what the like added when it was made.
+        """
+        weight = log_weight(liked_at)
+        self._update(post_id, lambda score: _log_sub(score, weight), stored)
+
+    def remove_post(self, post_id: int):
+        with self._lock:
+            self._set(post_id, None, None)
+
+    # ---- queries ----
+
+    def top(self, limit: int, blockers=()) -> list:
+        """
+        (post id, score) for the `limit` hottest posts not written by `blockers`.
+        Walks the ranking from the top, so the cost depends on `limit` and
+        the blocked authors skipped, not on how many posts there are.
+        """
+        blocked = set(blockers)
+        result = []
+        with self._lock:
+            for negative, post_id in self._ranking:
+                if self._scores[post_id][1] in blocked:
+                    continue
+                result.append((post_id, -negative))
+                if len(result) == limit:
+                    break
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "posts": len(self._scores),
+                "dirty": len(self._dirty),
+                "deferred": len(self._deferred),
+                "watermark": self._watermark,
+                "checkpoints": self.checkpoints,
+                "half_life": TRENDING_HALF_LIFE,
+            }
+
+    # ---- checkpoints ----
+
+    def checkpoint(self, session_factory=SessionLocal) -> int:
+        """
+        Writes the scores changed since the last checkpoint in one write
+        turn, then drops posts below the hotness floor from memory. Returns
+        the rows written.
+        """
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+        if deferred:
+            try:
+                with session_factory() as db:
+                    stored = dict(db.execute(
+                        select(Post.id, Post.trending_score)
+                        .where(Post.id.in_({post_id for post_id, _, _ in deferred}))
+                    ).all())
+            except Exception:
+                with self._lock:
+                    self._deferred[:0] = deferred
+                raise
+            for post_id, change, author_id in deferred:
+                self._update(post_id, change, stored.get(post_id), author_id)
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self._flushing = dirty
+            watermark = self._watermark
+
+        try:
+            with session_factory() as db, write_turn():
+                if dirty:
+                    db.execute(
+                        update(Post.__table__)
+                        .where(Post.__table__.c.id == bindparam("post_id"))
+                        .values(trending_score=bindparam("score")),
+                        [{"post_id": post_id, "score": score} for post_id, score in dirty.items()],
+                    )
+                db.execute(
+                    dialect_insert(db, WriteVersion)
+                    .values(name=CHECKPOINT, version=watermark)
+                    .on_conflict_do_update(index_elements=["name"], set_={"version": watermark})
+                )
+                db.commit()
+        except Exception:
+            # Changes made meanwhile are newer: keep those
+            with self._lock:
+                self._dirty = {**dirty, **self._dirty}
+                self._flushing = {}
+            raise
+
+        floor = _floor(datetime.utcnow())
+        with self._lock:
+            cut = bisect_right(self._ranking, (-floor, math.inf))
+            for _, post_id in self._ranking[cut:]:
+                del self._scores[post_id]
+            del self._ranking[cut:]
+            self._flushing = {}
+            self.checkpoints += 1
+        return len(dirty)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="trending-checkpoint", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Writes a last checkpoint.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        self.checkpoint()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.checkpoint()
+            except Exception:
+                logger.exception("Trending checkpoint failed")
+
+
+trending = TrendingIndex()
+
+
+# -------------------------------
+# Recording likes (called by the like router, before its commit)
+# -------------------------------
+
+def _rescore(db: Session, post_id: int, change):
+    # Runs after the like row was written, so this transaction already holds
+    # the write lock and nobody can update the score in between
+    score = db.scalar(select(Post.trending_score).where(Post.id == post_id))
+    db.execute(update(Post).where(Post.id == post_id).values(trending_score=change(score)))
+
+
+def _stored_score(db: Session, post_id: int):
+    # Read in the caller's transaction, so the commit hook needs no query
+    if trending.holds(post_id):
+        return UNREAD
+    return db.scalar(select(Post.trending_score).where(Post.id == post_id))
+
+
+def record_like(db: Session, post_id: int, author_id: int, like_id: int, liked_at: datetime):
+    if not MULTI_PROCESS:
+        on_commit(db, trending.add_like, post_id, author_id, like_id, liked_at, _stored_score(db, post_id))
+        return
+
+    _rescore(db, post_id, lambda score: _log_add(score, log_weight(liked_at)))
+    # Like ids only grow, and this one is in the column from now on
+    db.execute(
+        dialect_insert(db, WriteVersion)
+        .values(name=CHECKPOINT, version=like_id)
+        .on_conflict_do_update(index_elements=["name"], set_={"version": like_id})
+    )
+
+
+def record_unlike(db: Session, post_id: int, liked_at: datetime):
+    if not MULTI_PROCESS:
+        on_commit(db, trending.remove_like, post_id, liked_at, _stored_score(db, post_id))
+        return
+
+    _rescore(db, post_id, lambda score: _log_sub(score, log_weight(liked_at)))
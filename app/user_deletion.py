@@ -0,0 +1,252 @@
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from .activity_logger import log_activity
+from .config import DELETION_CHUNK_SIZE, DELETION_PAUSE, MULTI_PROCESS
+from .database import SessionLocal
+from .models import (
+    Activity, ActivityGroup, Block, DeletionJob, Follow, Like, Post, RefreshToken, TimelineEntry, User,
+)
+from .principal_cache import mark_principal_changed
+from .social_graph import social_graph
+from .trending import record_unlike
+from .write_versions import ACTIVITIES, POSTS, bump_version
+from .writer import write_turn
+
+logger = logging.getLogger(__name__)
+
+# With several worker processes jobs are queued by processes other than the
+# one running the worker, whose notify() never arrives: it polls instead
+POLL_INTERVAL = 5.0
+
+
+# -------------------------------
+# Deletion steps
+# -------------------------------
+# Each step removes one kind of dependent row, optionally returning columns
+# used to fix other users' counters. Steps are idempotent ("delete rows that
+# still match"), so a resumed job simply re-runs its current step.
+
+def _drop_likes(db: Session, likes):
+    # (user, post) is unique, so each post lost exactly one like
+    db.execute(
+        update(Post)
+        .where(Post.id.in_([post_id for post_id, _ in likes]))
+        .values(like_count=Post.like_count - 1)
+    )
+    # ...and the trending score it added
+    for post_id, liked_at in likes:
+        record_unlike(db, post_id, liked_at)
+
+
+def _drop_follower_counts(db: Session, rows):
+    user_ids = [user_id for (user_id,) in rows]
+    db.execute(update(User).where(User.id.in_(user_ids)).values(follower_count=User.follower_count - 1))
+
+
+def _drop_following_counts(db: Session, rows):
+    user_ids = [user_id for (user_id,) in rows]
+    db.execute(update(User).where(User.id.in_(user_ids)).values(following_count=User.following_count - 1))
+
+
+# (step name, model, condition for user_id, returned columns, counter fix)
+STEPS = [
+    ("likes", Like, lambda uid: Like.user_id == uid, (Like.post_id, Like.created_at), _drop_likes),
+    ("likes_on_posts", Like,
+     lambda uid: Like.post_id.in_(select(Post.id).where(Post.user_id == uid)), None, None),
+    ("following", Follow, lambda uid: Follow.follower_id == uid, (Follow.following_id,), _drop_follower_counts),
+    ("followers", Follow, lambda uid: Follow.following_id == uid, (Follow.follower_id,), _drop_following_counts),
+    ("blocks", Block, lambda uid: Block.blocker_id == uid, None, None),
+    ("blocked_by", Block, lambda uid: Block.blocked_user_id == uid, None, None),
+    ("timeline", TimelineEntry, lambda uid: TimelineEntry.user_id == uid, None, None),
+    ("timeline_fanout", TimelineEntry, lambda uid: TimelineEntry.actor_id == uid, None, None),
+    ("timeline_targeted", TimelineEntry,
+     lambda uid: TimelineEntry.activity_id.in_(select(Activity.id).where(Activity.target_user_id == uid)),
+     None, None),
+    ("activities", Activity, lambda uid: Activity.actor_id == uid, None, None),
+    ("targeted_activities", Activity, lambda uid: Activity.target_user_id == uid, None, None),
+    ("activity_groups", ActivityGroup, lambda uid: ActivityGroup.actor_id == uid, None, None),
+    ("targeted_activity_groups", ActivityGroup, lambda uid: ActivityGroup.target_user_id == uid, None, None),
+    ("posts", Post, lambda uid: Post.user_id == uid, None, None),
+    ("refresh_tokens", RefreshToken, lambda uid: RefreshToken.user_id == uid, None, None),
+]
+
+STEP_NAMES = [name for name, *_ in STEPS]
+
+
+# Steps whose rows GET /posts/ or GET /feed/ return: their ETags must change
+STEP_VERSIONS = {"likes": POSTS, "activities": ACTIVITIES, "targeted_activities": ACTIVITIES, "posts": POSTS}
+
+
+def _delete_chunk(db: Session, step, user_id: int, limit: int = None) -> int:
+    """
+    Deletes up to `limit` rows for one step (all of them if limit is None)
+    and applies its counter fix. Returns the number of rows deleted.
+    """
+    name, model, condition, returned, fix_counts = step
+
+    ids = select(model.id).where(condition(user_id))
+    if limit is not None:
+        ids = ids.limit(limit)
+
+    statement = delete(model).where(model.id.in_(ids))
+    if returned is not None:
+        rows = db.execute(statement.returning(*returned)).all()
+        if rows:
+            fix_counts(db, rows)
+        deleted = len(rows)
+    else:
+        deleted = db.execute(statement).rowcount
+
+    if deleted and name in STEP_VERSIONS:
+        bump_version(db, STEP_VERSIONS[name])
+    return deleted
+
+
+def _finish(db: Session, job: DeletionJob):
+    """
+    Last transaction: sweeps up rows created while the job ran (e.g. a like on
+    a post that was not deleted yet), then removes the user itself.
+    """
+    swept = sum(_delete_chunk(db, step, job.user_id) for step in STEPS)
+    db.execute(delete(User).where(User.id == job.user_id))
+
+    log_activity(
+        db=db,
+        actor_id=job.requested_by,
+        verb="USER_DELETED",
+        object_type="user",
+        object_id=job.user_id
+    )
+
+    job.rows_deleted += swept + 1
+    job.status = "done"
+    job.step = None
+    job.finished_at = datetime.utcnow()
+    mark_principal_changed(db, job.user_id)
+    db.commit()
+
+    social_graph.remove_user(job.user_id)
+
+
+def run_job(job_id: int, chunk_size: int = DELETION_CHUNK_SIZE, pause: float = DELETION_PAUSE,
+            stopping: threading.Event = None, session_factory=SessionLocal):
+    """
+    Runs (or resumes) one deletion job to completion. Every chunk commits
+    together with the job's progress in its own write turn, then waits
+    `pause` seconds so other writers get the lock between batches. Setting
+    `stopping` leaves the job "running" after the current chunk, to be
+    resumed later.
+    """
+    stopping = stopping or threading.Event()
+
+    with session_factory() as db:
+        job = db.get(DeletionJob, job_id)
+        if job is None or job.status == "done":
+            return
+
+        job.status = "running"
+        start = STEP_NAMES.index(job.step) if job.step in STEP_NAMES else 0
+
+        try:
+            for step in STEPS[start:]:
+                with write_turn():
+                    job.step = step[0]
+                    db.commit()
+
+                while True:
+                    with write_turn():
+                        deleted = _delete_chunk(db, step, job.user_id, chunk_size)
+                        job.rows_deleted += deleted
+                        db.commit()
+
+                    if deleted < chunk_size:
+                        break
+                    if stopping.wait(pause):
+                        return
+
+            with write_turn():
+                _finish(db, job)
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Deletion job %d failed at step %s", job.id, job.step)
+            job.status = "failed"
+            job.error = str(exc)
+            with write_turn():
+                db.commit()
+
+
+# -------------------------------
+# Background runner
+# -------------------------------
+
+class DeletionWorker:
+    """
+    Background thread that runs deletion jobs one at a time, oldest first.
+    On start it picks up jobs left pending or running by a previous process.
+    Between jobs it sleeps until notified, or for at most `poll_interval`.
+    """
+
+    def __init__(self, poll_interval: float = None):
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._wakeup = False
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def notify(self):
+        """
+        Call after committing a new job.
+        """
+        with self._cond:
+            self._wakeup = True
+            self._cond.notify()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="deletion-worker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops after the current chunk; the job resumes on the next start.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self.notify()
+        self._thread.join()
+        self._thread = None
+
+    def _next_job(self):
+        with SessionLocal() as db:
+            return db.scalar(
+                select(DeletionJob.id)
+                .where(DeletionJob.status.in_(["pending", "running"]))
+                .order_by(DeletionJob.id)
+                .limit(1)
+            )
+
+    def _run(self):
+        while not self._stopping.is_set():
+            job_id = self._next_job()
+
+            if job_id is not None:
+                run_job(job_id, stopping=self._stopping)
+                continue
+
+            with self._cond:
+                if not self._wakeup:
+                    self._cond.wait(self.poll_interval)
+                self._wakeup = False
+
+
+deletion_worker = DeletionWorker(POLL_INTERVAL if MULTI_PROCESS else None)
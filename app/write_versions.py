@@ -0,0 +1,89 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .database import dialect_insert
+from .models import WriteVersion
+from .timeline import blockers_of
+
+
+# -------------------------------
+# Write versions and conditional GETs
+# -------------------------------
+# "activities" changes with every logged activity, "posts" with every post
+# created or deleted and every like count change. Both only ever go up,
+# and are stored (not kept in memory) so all workers agree on them.
+# A listing's ETag is its version plus a digest of the caller's blockers,
+# since blocks decide which rows each caller sees. Answering a matching
+# If-None-Match costs one primary-key read, not the listing query.
+# "principals" changes with every role or status change; workers poll it to
+# invalidate their principal caches.
+
+ACTIVITIES = "activities"
+POSTS = "posts"
+PRINCIPALS = "principals"
+
+# Per-user responses: browsers may keep them but must revalidate each time
+LISTING_CACHE_CONTROL = "private, no-cache"
+
+
+def bump_version(db: Session, name: str):
+    """
+    Increments `name` in the caller's transaction.
+    """
+    db.execute(
+        dialect_insert(db, WriteVersion)
+        .values(name=name, version=1)
+        .on_conflict_do_update(index_elements=["name"], set_={"version": WriteVersion.version + 1})
+    )
+
+
+def current_version(db: Session, name: str) -> int:
+    return db.scalar(select(WriteVersion.version).where(WriteVersion.name == name)) or 0
+
+
+def listing_version(db: Session, name: str, user_id: int):
+    """
+    (version of `name`, sorted tuple of the blockers hidden from `user_id`).
+    Read it before the listing itself: a write in between then only costs
+    an extra refetch.
+    """
+    blockers = blockers_of(user_id)
+    if not isinstance(blockers, list):
+        blockers = db.scalars(blockers).all()
+    return current_version(db, name), tuple(sorted(blockers))
+
+
+def format_etag(name: str, version: int, blockers: tuple) -> str:
+    # A short digest keeps the header small. A collision can at worst keep a
+    # client on its own stale copy; server-side caches key on `blockers`.
+    digest = hashlib.blake2b(",".join(map(str, blockers)).encode(), digest_size=6).hexdigest()
+    return f'W/"{name}-{version}-{digest}"'
+
+
+def listing_etag(db: Session, name: str, user_id: int) -> str:
+    """
+    Weak ETag for a listing of `name` as seen by `user_id`.
+    """
+    return format_etag(name, *listing_version(db, name, user_id))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison (RFC 9110): W/ prefixes are ignored, "*" matches anything.
+    """
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": LISTING_CACHE_CONTROL})
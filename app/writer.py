@@ -0,0 +1,197 @@
+import asyncio
+import contextvars
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+try:
+    import fcntl
+except ImportError:    # not POSIX: the lock only serialises threads of one process
+    fcntl = None
+
+from .config import SINGLE_WRITER, WRITE_BATCH_SIZE, WRITE_LOCK_PATH
+from .database import DATABASE_URL, IS_SQLITE, SessionLocal
+
+
+# -------------------------------
+# Single writer across worker processes
+# -------------------------------
+# SQLite lets one connection write at a time. When several processes try,
+# the losers' busy handler sleeps and retries, and gives up with "database
+# is locked" after SQLITE_BUSY_TIMEOUT ms - under load, exactly when it
+# hurts. With SINGLE_WRITER on, router writes are queued to one writer
+# thread per process, and the writer threads take turns through an
+# exclusive flock() on WRITE_LOCK_PATH. Waiting for a turn blocks in the
+# kernel, with no timeout to run out and no retry loop.
+# Reads never take the lock: WAL readers do not block the writer.
+#
+# A turn batches lock acquisitions, not commits: every job still commits its
+# own transaction. Jobs commit themselves, may fail after writing (and must
+# then roll back alone), and attach after-commit hooks (in-memory indexes,
+# /feed/stream events, cache invalidation) that may only run once their rows
+# are durable. One transaction per turn would need a savepoint per job, which
+# the pysqlite driver does not handle without extra transaction plumbing.
+# With WAL and synchronous=NORMAL a commit does not fsync, so the lock
+# round trip (flock plus waiting behind other workers) is the cost worth sharing.
+
+def _default_lock_path() -> str:
+    if IS_SQLITE and DATABASE_URL.database not in (None, "", ":memory:"):
+        return os.path.abspath(DATABASE_URL.database) + ".lock"
+    return os.path.join(tempfile.gettempdir(), "inkle-write.lock")
+
+
+LOCK_PATH = WRITE_LOCK_PATH or _default_lock_path()
+
+
+class FileLock:
+    """
+    Exclusive lock shared by every process that opens the same path, and by
+    the threads of each of them. Not reentrant.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.Lock()
+        self._fd = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._local.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            self._local.release()
+            return False
+        except BaseException:
+            os.close(fd)
+            self._local.release()
+            raise
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fd, self._fd = self._fd, None
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._local.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class SingleWriter:
+    """
+    Runs `fn(session, *args, **kwargs)` jobs on one background thread, each
+    in a fresh session that the job commits itself, inside a copy of the
+    caller's contextvars (so per-request query accounting sees the writes).
+    Jobs already queued when the thread gets its turn at the lock - up to
+    `batch_size` - run in the same turn, so a burst of writes pays for the
+    lock once. Each job still commits on its own (see above).
+    """
+
+    def __init__(self, lock: FileLock, batch_size: int):
+        self.lock = lock
+        self.batch_size = batch_size
+        self.batches = 0
+        self.writes = 0
+        self.lock_wait = 0.0
+        self._jobs = queue.SimpleQueue()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    async def run(self, fn, *args, **kwargs):
+        if self._thread is None:
+            self.start()
+        future = Future()
+        self._jobs.put((fn, args, kwargs, contextvars.copy_context(), future))
+        return await asyncio.wrap_future(future)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="single-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Runs the jobs already queued, then stops.
+        """
+        with self._start_lock:
+            if self._thread is None:
+                return
+            self._jobs.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": SINGLE_WRITER,
+            "lock_path": self.lock.path,
+            "batch_size": self.batch_size,
+            "batches": self.batches,
+            "writes": self.writes,
+            "lock_wait_seconds": round(self.lock_wait, 3),
+            "queued": self._jobs.qsize(),
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._jobs.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [job for job in batch if job is not None]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            with self.lock:
+                self.lock_wait += time.perf_counter() - started
+                for fn, args, kwargs, context, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with SessionLocal() as db:
+                            result = context.run(fn, db, *args, **kwargs)
+                    except Exception as exc:
+                        future.set_exception(exc)
+                    else:
+                        future.set_result(result)
+            self.batches += 1
+            self.writes += len(batch)
+
+
+write_lock = FileLock(LOCK_PATH)
+writer = SingleWriter(write_lock, WRITE_BATCH_SIZE)
+
+# Held for the life of the one process that runs background maintenance
+# (user deletions, retention); the others try once at startup and skip it.
+maintenance_lock = FileLock(LOCK_PATH + ".maintenance")
+
+
+def write_turn():
+    """
+    Context manager for writes made outside the writer thread (e.g. the
+    buffered activity writer): takes the write lock in single-writer mode.
+    """
+    return write_lock if SINGLE_WRITER else nullcontext()
@@ -0,0 +1,221 @@
+"""
+Synthetic data generator: bulk-loads a fresh SQLite database at a chosen scale.
+
+  - users, one owner (id 1) and one admin (id 2); every password is "benchpass"
+  - a power-law follow graph: a few users have most of the followers
+  - posts and likes skewed the same way, a sprinkling of blocks
+  - activities mixing posts, likes and follows, newest last
+  - home timelines fanned out for the most recent activities, and feed groups
+
+    python -m benchmarks.generate --scale small  --out bench.db   # ~10k activities
+    python -m benchmarks.generate --scale large  --out bench.db   # ~10M activities
+    python -m benchmarks.generate --users 5000 --activities 200000 --out bench.db
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.counters import reconcile_counters
+from app.database import Base
+from app.feed_groups import rebuild_groups
+from app.models import Activity, Block, Follow, Like, Post, User
+from app.search import ensure_search_index
+from app.security import hash_password
+from app.timeline import FANOUT_FOLLOWER_LIMIT, TIMELINE_MAX_ENTRIES
+
+BENCH_PASSWORD = "benchpass"
+
+SCALES = {
+    #         users   activities  posts/user  follows/user  likes/user
+    "small":  (1000,      10_000,       5,          20,          10),
+    "medium": (20000,  1_000_000,      10,          50,          30),
+    "large":  (100000, 10_000_000,     20,          80,          50),
+}
+
+BATCH = 50_000
+
+
+class PowerLaw:
+    """
+    Draws ids 1..n with probability ~ 1 / rank**alpha (a shuffled rank order,
+    so popular ids are spread over the id space).
+    """
+
+    def __init__(self, n: int, alpha: float, rng: random.Random):
+        self.ids = list(range(1, n + 1))
+        rng.shuffle(self.ids)
+        self.cumulative = list(itertools.accumulate(1 / (rank ** alpha) for rank in range(1, n + 1)))
+        self.rng = rng
+
+    def draw(self) -> int:
+        point = self.rng.random() * self.cumulative[-1]
+        return self.ids[bisect_left(self.cumulative, point)]
+
+
+def _insert(conn, table, rows):
+    """
+    Inserts an iterable of dicts in BATCH-sized executemany calls.
+    """
+    total = 0
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, BATCH)):
+        conn.execute(table.insert(), batch)
+        total += len(batch)
+    return total
+
+
+def generate(path: str, users: int, activities: int, posts_per_user: int,
+             follows_per_user: int, likes_per_user: int, fanout_recent: int, seed: int):
+    if os.path.exists(path):
+        raise SystemExit(f"{path} already exists; pick a new file")
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    now = datetime.utcnow().replace(microsecond=0)
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
+
+    popularity = PowerLaw(users, 1.1, rng)
+    password_hash = hash_password(BENCH_PASSWORD)
+    total_posts = users * posts_per_user
+
+    with engine.begin() as conn:
+        # Bulk load: durability does not matter for a scratch database
+        conn.exec_driver_sql("PRAGMA journal_mode=OFF")
+        conn.exec_driver_sql("PRAGMA synchronous=OFF")
+
+        _insert(conn, User.__table__, (
+            {"id": i, "name": f"user{i}", "email": f"user{i}@example.com", "password_hash": password_hash,
+             "role": "owner" if i == 1 else "admin" if i == 2 else "user", "is_active": True}
+            for i in range(1, users + 1)
+        ))
+
+        def posts():
+            for n in range(total_posts):
+                yield {"user_id": popularity.draw(), "content": f"post {n} about {rng.choice(TOPICS)} and {rng.choice(TOPICS)}",
+                       "created_at": now - timedelta(seconds=total_posts - n)}
+        _insert(conn, Post.__table__, posts())
+
+        follows = set()
+        for follower in range(1, users + 1):
+            for _ in range(max(1, int(rng.paretovariate(1.5) * follows_per_user / 3))):
+                followee = popularity.draw()
+                if followee != follower:
+                    follows.add((follower, followee))
+        _insert(conn, Follow.__table__, ({"follower_id": a, "following_id": b} for a, b in follows))
+
+        blocks = {(rng.randint(1, users), rng.randint(1, users)) for _ in range(users // 20)}
+        _insert(conn, Block.__table__, (
+            {"blocker_id": a, "blocked_user_id": b} for a, b in blocks if a != b
+        ))
+
+        liked = {(rng.randint(1, users), rng.randint(1, total_posts)) for _ in range(users * likes_per_user)}
+        _insert(conn, Like.__table__, ({"user_id": u, "post_id": p} for u, p in liked))
+
+        def activity_rows():
+            follow_list = list(follows)
+            for n in range(activities):
+                actor = popularity.draw()
+                kind = rng.random()
+                if kind < 0.5:
+                    row = {"verb": "POST_CREATED", "object_type": "post", "object_id": rng.randint(1, total_posts)}
+                elif kind < 0.85:
+                    row = {"verb": "LIKED", "object_type": "post", "object_id": rng.randint(1, total_posts),
+                           "target_user_id": popularity.draw()}
+                else:
+                    a, b = rng.choice(follow_list)
+                    actor, row = a, {"verb": "FOLLOWED", "object_type": "user", "object_id": b, "target_user_id": b}
+                row.setdefault("target_user_id", None)
+                row.update(actor_id=actor, created_at=now - timedelta(seconds=activities - n))
+                yield row
+        _insert(conn, Activity.__table__, activity_rows())
+
+    with Session(engine) as db:
+        reconcile_counters(db)
+        rebuild_groups(db)
+
+    with engine.begin() as conn:
+        # Same rules as fan_out(): the newest activities go to the actor's inbox
+        # and its unblocked followers' (not for high-fanout authors, who are
+        # pulled at read time), keeping the newest TIMELINE_MAX_ENTRIES per inbox
+        newest = f"""
+            (SELECT a.id, a.actor_id, u.follower_count < {FANOUT_FOLLOWER_LIMIT} AS fan_out
+             FROM activities a JOIN users u ON u.id = a.actor_id
+             WHERE a.id > {max(0, activities - fanout_recent)})
+        """
+        conn.exec_driver_sql(f"""
+            INSERT INTO timeline_entries (user_id, activity_id, actor_id)
+            SELECT user_id, activity_id, actor_id FROM (
+                SELECT user_id, activity_id, actor_id,
+                       ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY activity_id DESC) AS n
+                FROM (
+                    SELECT f.follower_id AS user_id, a.id AS activity_id, a.actor_id FROM {newest} a
+                    JOIN follows f ON f.following_id = a.actor_id
+                    WHERE a.fan_out AND NOT EXISTS (
+                        SELECT 1 FROM blocks b
+                        WHERE (b.blocker_id = a.actor_id AND b.blocked_user_id = f.follower_id)
+                           OR (b.blocker_id = f.follower_id AND b.blocked_user_id = a.actor_id)
+                    )
+                    UNION ALL
+                    SELECT a.actor_id, a.id, a.actor_id FROM {newest} a
+                )
+            ) WHERE n <= {TIMELINE_MAX_ENTRIES}
+            ORDER BY user_id, activity_id
+        """)
+
+    with engine.connect() as conn:
+        conn.exec_driver_sql("ANALYZE")
+        counts = {
+            table: conn.exec_driver_sql(f"SELECT COUNT(*) FROM {table}").scalar()
+            for table in ("users", "posts", "follows", "blocks", "likes", "activities", "timeline_entries",
+                          "activity_groups")
+        }
+    engine.dispose()
+
+    print(f"Wrote {path} in {time.perf_counter() - started:.1f}s")
+    for table, count in counts.items():
+        print(f"  {table:<17} {count:>12,}")
+
+
+TOPICS = ["python", "sqlite", "coffee", "music", "travel", "football", "books", "cats",
+          "cooking", "photography", "gaming", "design", "startups", "running", "movies"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="new database file to create")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--activities", type=int)
+    parser.add_argument("--posts-per-user", type=int)
+    parser.add_argument("--follows-per-user", type=int)
+    parser.add_argument("--likes-per-user", type=int)
+    parser.add_argument("--fanout-recent", type=int, default=50_000,
+                        help="newest activities copied into home timelines")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    users, activities, posts, follows, likes = SCALES[args.scale]
+    generate(
+        args.out,
+        users=args.users or users,
+        activities=args.activities or activities,
+        posts_per_user=args.posts_per_user or posts,
+        follows_per_user=args.follows_per_user or follows,
+        likes_per_user=args.likes_per_user or likes,
+        fanout_recent=args.fanout_recent,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+In-process load harness: drives every router through the ASGI app (no
+network, no server) against a generated database, and reports p50 / p99
+latency and throughput per endpoint.
+
+    python -m benchmarks.generate --scale small --out bench.db
+    python -m benchmarks.harness --db bench.db --save baseline.json
+    # ... change something ...
+    python -m benchmarks.harness --db bench.db --compare baseline.json
+
+Runs on a copy of the database (writes are not kept) unless --in-place.
+With --compare, exits 1 when any endpoint's p99 or throughput is worse than
+the baseline by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+# Same as benchmarks.generate.BENCH_PASSWORD; not imported from there because
+# that pulls in app.database before DATABASE_URL points at the benchmark copy
+BENCH_PASSWORD = "benchpass"
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(fraction * len(sorted_values) + 0.5))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Dataset:
+    """
+    What the harness needs to know about the generated data up front, so
+    write scenarios only ever pick pairs that should succeed.
+    """
+
+    def __init__(self, path: str, pool_size: int, rng: random.Random):
+        conn = sqlite3.connect(path)
+        try:
+            self.user_count = conn.execute("SELECT MAX(id) FROM users").fetchone()[0]
+            self.max_like_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM likes").fetchone()[0]
+            regular = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'user' AND is_active")]
+            self.pool = rng.sample(regular, min(pool_size, len(regular)))
+            self.admin_email = conn.execute(
+                "SELECT email FROM users WHERE role IN ('admin', 'owner') ORDER BY id LIMIT 1"
+            ).fetchone()[0]
+            self.emails = dict(conn.execute(
+                f"SELECT id, email FROM users WHERE id IN ({','.join(map(str, self.pool))})"
+            ))
+
+            self.follows = set(conn.execute("SELECT follower_id, following_id FROM follows"))
+            self.blocks = set(conn.execute("SELECT blocker_id, blocked_user_id FROM blocks"))
+            self.likes = set(conn.execute("SELECT user_id, post_id FROM likes"))
+            self.posts = conn.execute("SELECT id, user_id FROM posts ORDER BY RANDOM() LIMIT 20000").fetchall()
+        finally:
+            conn.close()
+
+    def blocked_either_way(self, a: int, b: int) -> bool:
+        return (a, b) in self.blocks or (b, a) in self.blocks
+
+    def fresh_pairs(self, n: int, taken, candidates, rng: random.Random):
+        """
+        Up to n distinct (pool user, candidate) pairs not in `taken` and not
+        across a block. Candidates are user ids or (post id, author id).
+        """
+        pairs, attempts = set(), 0
+        while len(pairs) < n and attempts < n * 50:
+            attempts += 1
+            me = rng.choice(self.pool)
+            target = rng.choice(candidates)
+            target_id, owner = target if isinstance(target, tuple) else (target, target)
+            if owner == me or (me, target_id) in taken or (me, target_id) in pairs:
+                continue
+            if self.blocked_either_way(me, owner):
+                continue
+            pairs.add((me, target_id))
+        return list(pairs)
+
+
+class Harness:
+
+    def __init__(self, client, data: Dataset, requests: int, concurrency: int, rng: random.Random):
+        self.client = client
+        self.data = data
+        self.requests = requests
+        self.concurrency = concurrency
+        self.rng = rng
+        self.tokens = {}
+        self.admin_token = None
+        self.results = {}
+
+    def auth(self, user_id: int = None) -> dict:
+        token = self.admin_token if user_id is None else self.tokens[user_id]
+        return {"Authorization": f"Bearer {token}"}
+
+    async def login(self, email: str):
+        response = await self.client.post("/auth/login", data={"username": email, "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        return response.json()
+
+    async def setup(self):
+        for user_id, email in self.data.emails.items():
+            self.tokens[user_id] = (await self.login(email))["access_token"]
+        self.admin_token = (await self.login(self.data.admin_email))["access_token"]
+
+    async def phase(self, name: str, calls, expected=(200, 201, 202)):
+        """
+        Runs `calls` (zero-argument callables returning a request coroutine)
+        with `concurrency` in flight; records latency per request.
+        Returns the responses in call order.
+        """
+        latencies, errors = [], 0
+        responses = [None] * len(calls)
+        queue = list(enumerate(calls))
+        queue.reverse()
+
+        async def worker():
+            nonlocal errors
+            while queue:
+                index, call = queue.pop()
+                start = time.perf_counter()
+                response = await call()
+                latencies.append(time.perf_counter() - start)
+                if response.status_code not in expected:
+                    errors += 1
+                responses[index] = response
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        self.results[name] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            "rps": round(len(latencies) / wall, 1) if wall else 0.0,
+        }
+        print(self.format_row(name, self.results[name]), flush=True)
+        return responses
+
+    @staticmethod
+    def format_row(name: str, row: dict) -> str:
+        return (f"  {name:<28} {row['requests']:>6} {row['errors']:>6} "
+                f"{row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['rps']:>9.1f}")
+
+    def each(self, make):
+        """
+        `requests` calls of `make(pool user id)`.
+        """
+        users = [self.rng.choice(self.data.pool) for _ in range(self.requests)]
+        return [lambda me=me: make(me) for me in users]
+
+    async def revalidate(self, name: str, path: str):
+        """
+        Polls `path` with the ETag each user last saw; nothing changes in
+        between, so every answer should be a 304.
+        """
+        etags = {me: (await self.client.get(path, headers=self.auth(me))).headers["etag"] for me in self.data.pool}
+        await self.phase(name, self.each(
+            lambda me: self.client.get(path, headers={**self.auth(me), "If-None-Match": etags[me]})
+        ), expected=(304,))
+
+    async def run(self):
+        client, data, rng, n = self.client, self.data, self.rng, self.requests
+        get, post, delete = client.get, client.post, client.delete
+        print(f"  {'endpoint':<28} {'reqs':>6} {'errors':>6} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+
+        # ---- auth ----
+        # Argon2 dominates these, so they use a tenth of the requests
+        auth_n = max(1, n // 10)
+        await self.phase("auth.login", [
+            lambda me=me: post("/auth/login", data={"username": data.emails[me], "password": BENCH_PASSWORD})
+            for me in (rng.choice(data.pool) for _ in range(auth_n))
+        ])
+        run_id = uuid.uuid4().hex[:8]
+        signups = await self.phase("auth.signup", [
+            lambda i=i: post("/auth/signup", json={
+                "name": f"bench {i}", "email": f"bench-{run_id}-{i}@example.com", "password": BENCH_PASSWORD,
+            })
+            for i in range(auth_n)
+        ])
+        refresh_tokens = [(await self.login(data.emails[me]))["refresh_token"] for me in data.pool[:auth_n]]
+        await self.phase("auth.refresh", [
+            lambda token=token: post("/auth/refresh", json={"refresh_token": token}) for token in refresh_tokens
+        ])
+
+        # ---- reads ----
+        await self.phase("posts.list", self.each(lambda me: get("/posts/", headers=self.auth(me))))
+        await self.revalidate("posts.list_not_modified", "/posts/")
+        await self.phase("posts.list_by_author", self.each(lambda me: get(
+            "/posts/", params={"author_id": rng.randint(1, data.user_count)}, headers=self.auth(me))))
+        await self.phase("posts.search", self.each(lambda me: get(
+            "/posts/search", params={"q": rng.choice(SEARCH_TERMS)}, headers=self.auth(me))))
+        await self.phase("posts.trending", self.each(lambda me: get("/posts/trending", headers=self.auth(me))))
+        await self.phase("feed.activity", self.each(lambda me: get("/feed/", headers=self.auth(me))))
+        await self.revalidate("feed.activity_not_modified", "/feed/")
+        await self.phase("feed.home", self.each(lambda me: get("/feed/home", headers=self.auth(me))))
+        await self.phase("feed.grouped", self.each(lambda me: get("/feed/grouped", headers=self.auth(me))))
+        await self.phase("users.followers", self.each(lambda me: get(
+            f"/users/{rng.randint(1, data.user_count)}/followers", headers=self.auth(me))))
+
+        # ---- writes (each followed by its undo, so the data stays comparable) ----
+        authors = [rng.choice(data.pool) for _ in range(n)]
+        created = await self.phase("posts.create", [
+            lambda me=me: post("/posts/", params={"content": f"benchmark post about {rng.choice(SEARCH_TERMS)}"},
+                               headers=self.auth(me))
+            for me in authors
+        ])
+
+        follows = data.fresh_pairs(n, data.follows, range(1, data.user_count + 1), rng)
+        await self.phase("follow", [lambda a=a, b=b: post(f"/follow/{b}", headers=self.auth(a)) for a, b in follows])
+        await self.phase("unfollow", [lambda a=a, b=b: delete(f"/follow/{b}", headers=self.auth(a)) for a, b in follows])
+
+        likes = data.fresh_pairs(n, data.likes, data.posts, rng)
+        await self.phase("like", [lambda a=a, p=p: post(f"/like/{p}", headers=self.auth(a)) for a, p in likes])
+        await self.phase("unlike", [lambda a=a, p=p: delete(f"/like/{p}", headers=self.auth(a)) for a, p in likes])
+
+        blocks = data.fresh_pairs(n, data.blocks, range(1, data.user_count + 1), rng)
+        await self.phase("block", [lambda a=a, b=b: post(f"/block/{b}", headers=self.auth(a)) for a, b in blocks])
+        await self.phase("unblock", [lambda a=a, b=b: delete(f"/block/{b}", headers=self.auth(a)) for a, b in blocks])
+
+        await self.phase("posts.delete", [
+            lambda me=me, post_id=r.json()["id"]: delete(f"/posts/{post_id}", headers=self.auth(me))
+            for me, r in zip(authors, created) if r.status_code == 201
+        ])
+
+        # ---- admin ----
+        await self.phase("admin.social_graph", [lambda: get("/admin/social-graph", headers=self.auth())] * n)
+        await self.phase("admin.export_likes", [
+            lambda: get("/admin/export/likes", params={"after_id": max(0, data.max_like_id - 1000)},
+                        headers=self.auth())
+        ] * max(1, n // 10))
+        new_users = [r.json()["id"] for r in signups if r.status_code == 201]
+        await self.phase("admin.delete_user", [
+            lambda user_id=user_id: delete(f"/admin/user/{user_id}", headers=self.auth()) for user_id in new_users
+        ])
+
+SEARCH_TERMS = ["python", "sqlite", "coffee", "music", "travel", "foot*", "books cats", "cook*", "design"]
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Prints p99 / throughput against the baseline; returns False on a regression.
+    """
+    ok = True
+    print(f"\n  {'endpoint':<28} {'p99 base':>9} {'p99 now':>9} {'Δ':>7}   {'req/s base':>10} {'req/s now':>10} {'Δ':>7}")
+    for name, now in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"  {name:<28} (not in baseline)")
+            continue
+        p99_change = (now["p99_ms"] - base["p99_ms"]) / base["p99_ms"] if base["p99_ms"] else 0.0
+        rps_change = (now["rps"] - base["rps"]) / base["rps"] if base["rps"] else 0.0
+        regressed = p99_change > tolerance or rps_change < -tolerance
+        ok = ok and not regressed
+        print(f"  {name:<28} {base['p99_ms']:>9.2f} {now['p99_ms']:>9.2f} {p99_change:>+7.0%}   "
+              f"{base['rps']:>10.1f} {now['rps']:>10.1f} {rps_change:>+7.0%}" + ("   REGRESSION" if regressed else ""))
+    return ok
+
+
+async def _main(args):
+    import httpx
+
+    # The app reads DATABASE_URL at import time
+    import main as app_main
+
+    rng = random.Random(args.seed)
+    data = Dataset(args.database_path, args.users, rng)
+    transport = httpx.ASGITransport(app=app_main.app)
+
+    async with app_main.app.router.lifespan_context(app_main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            harness = Harness(client, data, args.requests, args.concurrency, rng)
+            await harness.setup()
+            await harness.run()
+    return harness.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="database made by benchmarks.generate")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=50, help="distinct logged-in users")
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--in-place", action="store_true", help="run against --db itself, not a copy")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f"{args.db} does not exist; create it with python -m benchmarks.generate")
+
+    scratch = None
+    if args.in_place:
+        args.database_path = args.db
+    else:
+        scratch = tempfile.mkdtemp(prefix="bench-")
+        args.database_path = os.path.join(scratch, "bench.db")
+        shutil.copyfile(args.db, args.database_path)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.database_path}"
+
+    try:
+        results = asyncio.run(_main(args))
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "database": os.path.abspath(args.db),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "db_mode": os.getenv("DB_MODE", "async"),
+            "python": platform.python_version(),
+            "recorded_at": datetime.utcnow().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Multi-process scaling: starts real uvicorn servers with 1, 2, 4 ... worker
+processes on one copy of a generated database, drives them from separate
+client processes over HTTP, and reports read throughput and latency per
+worker count. With --write-ratio, a share of the requests are like / unlike
+toggles. Errors are 5xx answers (e.g. "database is locked") and dropped
+connections.
+
+    python -m benchmarks.generate --scale small --out bench.db
+    python -m benchmarks.scaling --db bench.db
+    python -m benchmarks.scaling --db bench.db --workers 1,2,4,8 --duration 20 --write-ratio 0.1
+    python -m benchmarks.scaling --db bench.db --url http://127.0.0.1:8000   # an already running server
+
+Clients share the machine with the servers: give them enough --clients to
+saturate the server, and read the speedup against the CPU count printed in
+the header. Workers beyond the free CPUs cannot add throughput.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import BENCH_PASSWORD, SEARCH_TERMS, Dataset, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READS = [
+    lambda rng, data: ("/posts/", None),
+    lambda rng, data: ("/posts/trending", None),
+    lambda rng, data: ("/posts/search", {"q": rng.choice(SEARCH_TERMS)}),
+    lambda rng, data: ("/feed/", None),
+    lambda rng, data: ("/feed/home", None),
+    lambda rng, data: (f"/users/{rng.randint(1, data['user_count'])}/followers", None),
+]
+
+
+# -------------------------------
+# Servers
+# -------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_path: str, workers: int, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{database_path}",
+        "WEB_CONCURRENCY": str(workers),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+
+
+def stop_server(server: subprocess.Popen):
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def wait_until_up(url: str, server: subprocess.Popen = None, timeout: float = 60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise SystemExit(f"server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"{url}/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout:.0f}s")
+
+
+def login(url: str, emails: dict) -> dict:
+    import httpx
+
+    tokens = {}
+    with httpx.Client(base_url=url, timeout=None) as client:
+        for user_id, email in emails.items():
+            response = client.post("/auth/login", data={"username": email, "password": BENCH_PASSWORD})
+            response.raise_for_status()
+            tokens[user_id] = response.json()["access_token"]
+    return tokens
+
+
+# -------------------------------
+# Clients
+# -------------------------------
+
+async def _drive(url: str, job: dict) -> list:
+    """
+    Keeps `concurrency` requests in flight until `ends_at`; returns
+    (started at, seconds, status (0: no response), "read" / "write") per request.
+    """
+    import httpx
+
+    rng = random.Random(job["seed"])
+    headers = {user_id: {"Authorization": f"Bearer {token}"} for user_id, token in job["tokens"].items()}
+    users = list(headers)
+    toggles = list(job["likes"])    # [user id, post id, liked]
+    samples = []
+
+    async def worker(client):
+        while time.time() < job["ends_at"]:
+            started = time.time()
+            try:
+                if toggles and rng.random() < job["write_ratio"]:
+                    kind = "write"
+                    toggle = rng.choice(toggles)
+                    me, post_id, liked = toggle
+                    send = client.delete if liked else client.post
+                    response = await send(f"/like/{post_id}", headers=headers[me])
+                    if response.status_code < 400:
+                        toggle[2] = not liked
+                else:
+                    kind = "read"
+                    path, params = rng.choice(READS)(rng, job)
+                    response = await client.get(path, params=params, headers=headers[rng.choice(users)])
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0    # connection dropped or timed out
+            samples.append((started, time.time() - started, status, kind))
+
+    limits = httpx.Limits(max_connections=job["concurrency"], max_keepalive_connections=job["concurrency"])
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(job["concurrency"])))
+    return samples
+
+
+def _client_process(args):
+    url, job = args
+    return asyncio.run(_drive(url, job))
+
+
+def measure(url: str, data: Dataset, tokens: dict, likes: list, args) -> dict:
+    started_at = time.time() + 1.0    # lets every client process get going
+    measured_from = started_at + args.warmup
+    ends_at = measured_from + args.duration
+
+    jobs = []
+    for i in range(args.clients):
+        jobs.append((url, {
+            "seed": args.seed + i,
+            "tokens": tokens,
+            "likes": [[me, post_id, False] for me, post_id in likes[i::args.clients]],
+            "user_count": data.user_count,
+            "write_ratio": args.write_ratio,
+            "concurrency": args.concurrency,
+            "ends_at": ends_at,
+        }))
+    with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+        samples = [sample for part in pool.map(_client_process, jobs) for sample in part]
+
+    # So the next run starts from the same data
+    _undo_likes(url, tokens, likes)
+
+    samples = [s for s in samples if measured_from <= s[0] < ends_at]
+    row = {}
+    for kind in ("read", "write"):
+        latencies = sorted(s[1] for s in samples if s[3] == kind)
+        row[f"{kind}s"] = len(latencies)
+        row[f"{kind}_rps"] = round(len(latencies) / args.duration, 1)
+        row[f"{kind}_p50_ms"] = round(percentile(latencies, 0.50) * 1000, 2)
+        row[f"{kind}_p99_ms"] = round(percentile(latencies, 0.99) * 1000, 2)
+        row[f"{kind}_errors"] = sum(1 for s in samples if s[3] == kind and (s[2] >= 500 or s[2] == 0))
+    return row
+
+
+def _undo_likes(url: str, tokens: dict, pairs):
+    # Clients do not report which toggles ended liked: unlike them all
+    import httpx
+
+    with httpx.Client(base_url=url, timeout=None) as client:
+        for me, post_id in pairs:
+            client.delete(f"/like/{post_id}", headers={"Authorization": f"Bearer {tokens[me]}"})
+
+
+# -------------------------------
+# Report
+# -------------------------------
+
+def format_row(workers, row: dict, base_rps: float) -> str:
+    speedup = row["read_rps"] / base_rps if base_rps else 0.0
+    line = (f"  {str(workers):>7} {row['read_rps']:>9.1f} {speedup:>7.2f}x "
+            f"{row['read_p50_ms']:>9.2f} {row['read_p99_ms']:>9.2f} {row['read_errors']:>6}")
+    if row["writes"]:
+        line += (f" {row['write_rps']:>9.1f} {row['write_p50_ms']:>9.2f} "
+                 f"{row['write_p99_ms']:>9.2f} {row['write_errors']:>8}")
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="database made by benchmarks.generate")
+    parser.add_argument("--workers", default=f"1,2,4,{os.cpu_count()}",
+                        help="comma-separated worker process counts to try")
+    parser.add_argument("--url", help="benchmark this running server (on --db) instead of starting ones")
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per worker count")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of load before measuring")
+    parser.add_argument("--clients", type=int, default=max(2, os.cpu_count() or 1), help="client processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight per client process")
+    parser.add_argument("--users", type=int, default=20, help="distinct logged-in users")
+    parser.add_argument("--write-ratio", type=float, default=0.0, help="share of requests that like / unlike")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f"{args.db} does not exist; create it with python -m benchmarks.generate")
+
+    rng = random.Random(args.seed)
+    data = Dataset(args.db, args.users, rng)
+    likes = data.fresh_pairs(args.clients * args.concurrency * 4, data.likes, data.posts, rng) if args.write_ratio else []
+    counts = sorted({int(n) for n in args.workers.split(",")}) if not args.url else ["external"]
+
+    print(f"  {os.cpu_count()} CPUs, {args.clients} client processes x {args.concurrency} in flight, "
+          f"{args.duration:.0f}s per run, write ratio {args.write_ratio:.0%}")
+    header = f"  {'workers':>7} {'read/s':>9} {'speedup':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>6}"
+    if args.write_ratio:
+        header += f" {'write/s':>9} {'w p50 ms':>9} {'w p99 ms':>9} {'w errors':>8}"
+    print(header, flush=True)
+
+    scratch = None
+    if not args.url:
+        scratch = tempfile.mkdtemp(prefix="bench-")
+        database_path = os.path.join(scratch, "bench.db")
+        shutil.copyfile(args.db, database_path)
+
+    base_rps = None
+    try:
+        for workers in counts:
+            server = None
+            url = args.url
+            if url is None:
+                url = f"http://127.0.0.1:{_free_port()}"
+                server = start_server(database_path, workers, int(url.rsplit(":", 1)[1]))
+            try:
+                wait_until_up(url, server)
+                tokens = login(url, data.emails)
+                row = measure(url, data, tokens, likes, args)
+            finally:
+                if server is not None:
+                    stop_server(server)
+            base_rps = base_rps or row["read_rps"]
+            print(format_row(workers, row, base_rps), flush=True)
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
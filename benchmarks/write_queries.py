@@ -0,0 +1,170 @@
+"""
+Statement-count benchmark for the like / follow / block write paths.
+
+Runs the same workload twice against a scratch SQLite database:
+  - "check-then-insert": the previous flow (SELECT target, SELECT existing,
+    SELECT block, then INSERT), reproduced below for comparison
+  - "upsert": the current router code (INSERT ... ON CONFLICT DO NOTHING RETURNING)
+
+and prints SQL statements and wall time per action.
+
+    python -m benchmarks.write_queries --users 200 --actions 2000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import Block, Follow, Like, Post, User
+from app.activity_logger import log_activity
+from app.counters import adjust_follow_counts, adjust_like_count
+from app.principal_cache import Principal
+from app.routers.block import _block_user
+from app.routers.follow import _follow_user
+from app.routers.like import _like_post
+
+
+# -------------------------------
+# Previous check-then-insert flows (baseline)
+# -------------------------------
+
+def legacy_like(db, post_id, me):
+    post = db.query(Post).filter(Post.id == post_id).first()
+    if not post:
+        raise HTTPException(status_code=404)
+    if post.user_id == me.id:
+        raise HTTPException(status_code=400)
+    if db.query(Block).filter(Block.blocker_id == post.user_id, Block.blocked_user_id == me.id).first():
+        raise HTTPException(status_code=403)
+    if db.query(Like).filter(Like.user_id == me.id, Like.post_id == post_id).first():
+        raise HTTPException(status_code=400)
+    db.add(Like(user_id=me.id, post_id=post_id))
+    adjust_like_count(db, post_id, +1)
+    log_activity(db=db, actor_id=me.id, verb="LIKED", object_type="post",
+                 object_id=post_id, target_user_id=post.user_id)
+    db.commit()
+
+
+def legacy_follow(db, user_id, me):
+    if user_id == me.id:
+        raise HTTPException(status_code=400)
+    if not db.query(User).filter(User.id == user_id).first():
+        raise HTTPException(status_code=404)
+    if db.query(Follow).filter(Follow.follower_id == me.id, Follow.following_id == user_id).first():
+        raise HTTPException(status_code=400)
+    db.add(Follow(follower_id=me.id, following_id=user_id))
+    adjust_follow_counts(db, me.id, user_id, +1)
+    log_activity(db=db, actor_id=me.id, verb="FOLLOWED", object_type="user",
+                 object_id=user_id, target_user_id=user_id)
+    db.commit()
+
+
+def legacy_block(db, user_id, me):
+    if user_id == me.id:
+        raise HTTPException(status_code=400)
+    if not db.query(User).filter(User.id == user_id).first():
+        raise HTTPException(status_code=404)
+    if db.query(Block).filter(Block.blocker_id == me.id, Block.blocked_user_id == user_id).first():
+        raise HTTPException(status_code=400)
+    follow = db.query(Follow).filter(Follow.follower_id == user_id, Follow.following_id == me.id).first()
+    if follow:
+        db.delete(follow)
+        adjust_follow_counts(db, user_id, me.id, -1)
+    db.add(Block(blocker_id=me.id, blocked_user_id=user_id))
+    log_activity(db=db, actor_id=me.id, verb="BLOCKED", object_type="user",
+                 object_id=user_id, target_user_id=user_id)
+    db.commit()
+
+
+FLOWS = {
+    "check-then-insert": {"like": legacy_like, "follow": legacy_follow, "block": legacy_block},
+    "upsert": {"like": _like_post, "follow": _follow_user, "block": _block_user},
+}
+
+
+# -------------------------------
+# Harness
+# -------------------------------
+
+def make_database(path, users, posts_per_user):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "name": f"user{i}", "email": f"user{i}@bench.local", "password_hash": "x"}
+            for i in range(1, users + 1)
+        ])
+        conn.execute(Post.__table__.insert(), [
+            {"user_id": i, "content": f"post {n} by {i}"}
+            for i in range(1, users + 1) for n in range(posts_per_user)
+        ])
+
+    return engine
+
+
+def run_flow(flow, users, posts_per_user, actions, seed):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_database(os.path.join(tmp, "bench.db"), users, posts_per_user)
+        Session = sessionmaker(bind=engine, autoflush=False)
+
+        statements = {"count": 0}
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def count(*_):
+            statements["count"] += 1
+
+        rng = random.Random(seed)
+        principals = [Principal(i, f"user{i}", "user", True) for i in range(1, users + 1)]
+        total_posts = users * posts_per_user
+        results = {}
+
+        for action, fn in FLOWS[flow].items():
+            statements["count"] = 0
+            refused = 0
+            start = time.perf_counter()
+
+            for _ in range(actions):
+                me = rng.choice(principals)
+                target = rng.randint(1, total_posts if action == "like" else users)
+                with Session() as db:
+                    try:
+                        fn(db, target, me)
+                    except HTTPException:
+                        refused += 1
+
+            elapsed = time.perf_counter() - start
+            results[action] = {
+                "statements_per_action": round(statements["count"] / actions, 2),
+                "ms_per_action": round(elapsed * 1000 / actions, 3),
+                "refused": refused,
+            }
+
+        engine.dispose()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--posts-per-user", type=int, default=5)
+    parser.add_argument("--actions", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'flow':<18} {'action':<7} {'stmts/action':>13} {'ms/action':>10} {'refused':>8}")
+    for flow in FLOWS:
+        results = run_flow(flow, args.users, args.posts_per_user, args.actions, args.seed)
+        for action, row in results.items():
+            print(f"{flow:<18} {action:<7} {row['statements_per_action']:>13} "
+                  f"{row['ms_per_action']:>10} {row['refused']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,25 @@
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
-
-from app.database import Base, engine
+from fastapi.responses import PlainTextResponse
+
+from app.activity_logger import activity_writer
+from app.config import METRICS_TOKEN, MULTI_PROCESS
+from app.metrics import MetricsMiddleware, registry
+from app.counters import COUNTER_COLUMNS, reconcile_counters
+from app.database import SessionLocal, engine, init_db, storage_profile
+from app.feed_stream import activity_poller
+from app.principal_cache import principal_cache
+from app.search import ensure_search_index
+from app.security import hashing_pool
+from app.social_graph import social_graph
+from app.trending import trending
+from app.retention import retention_worker
+from app.user_deletion import deletion_worker
+from app.writer import maintenance_lock, write_lock, writer
 from app.routers.auth import router as auth_router
 from app.routers.posts import router as posts_router
 from app.routers.follow import router as follow_router
@@ -10,6 +27,7 @@ from app.routers.block import router as block_router
 from app.routers.feed import router as feed_router
 from app.routers.admin import router as admin_router
 from app.routers.like import router as like_router
+from app.routers.users import router as users_router
 
 
 # ---- REMOVE OAuth2 Form ----
@@ -17,13 +35,62 @@ oauth2_scheme = None   # disables password login popup UI in Swagger
 
 
 # ---- INIT DB ----
-Base.metadata.create_all(bind=engine)
+# Worker processes start together: one at a time through the write lock
+with write_lock:
+    added_columns = init_db()
+
+    # Counter columns added to an existing database start at 0: backfill them
+    if COUNTER_COLUMNS.intersection(added_columns):
+        with SessionLocal() as session:
+            reconcile_counters(session)
+
+    # Full-text index over posts, kept in sync by triggers (built on first run)
+    ensure_search_index(engine)
+
+# Logged through uvicorn's logger so it shows up with the server's own startup lines
+logging.getLogger("uvicorn.error").info(
+    "Storage profile: %s",
+    ", ".join(f"{key}={value}" for key, value in storage_profile().items()),
+)
+
+
+# ---- BACKGROUND WORKERS ----
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # With several worker processes none of them sees every write: the
+    # in-memory indexes stay unloaded and their SQL paths answer instead
+    if not MULTI_PROCESS:
+        with SessionLocal() as session:
+            social_graph.warm(session)
+            trending.warm(session)
+        trending.start()
+    else:
+        activity_poller.start()     # /feed/stream sees every worker's activities
+        principal_cache.start()     # clears on other workers' role / status changes
+    activity_writer.start()
+    # Background maintenance runs in the first process to get here
+    maintainer = maintenance_lock.acquire(blocking=False)
+    if maintainer:
+        deletion_worker.start()   # resumes unfinished user deletions
+        retention_worker.start()
+    yield
+    writer.stop()             # runs writes still queued
+    trending.stop()           # writes a last checkpoint
+    activity_poller.stop()
+    principal_cache.stop()
+    if maintainer:
+        retention_worker.stop()
+        deletion_worker.stop()
+        maintenance_lock.release()
+    activity_writer.stop()   # writes any buffered activities
+    hashing_pool.shutdown()
 
 
 app = FastAPI(
     title="Inkle Backend Assignment",
     description="Backend for Social Feed with Login, Posts, Likes, Follow, Block & Admin roles.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 
@@ -37,6 +104,10 @@ app.add_middleware(
 )
 
 
+# ---- METRICS (latency, status codes, DB time per request; Server-Timing) ----
+app.add_middleware(MetricsMiddleware)
+
+
 # ---- ROUTERS ----
 app.include_router(auth_router)
 app.include_router(posts_router)
@@ -45,6 +116,7 @@ app.include_router(block_router)
 app.include_router(feed_router)
 app.include_router(admin_router)
 app.include_router(like_router)
+app.include_router(users_router)
 
 
 # ---- CUSTOM SWAGGER AUTH (REAL BEARER INPUT) ----
@@ -80,9 +152,17 @@ def custom_openapi():
 app.openapi = custom_openapi
 
 
+# ---- PROMETHEUS SCRAPE ----
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 # ---- ROOT CHECK ----
 @app.get("/")
-def home():
+async def home():
     return {
         "message": "Backend Running 🚀",
         "status": "OK",
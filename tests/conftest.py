@@ -0,0 +1,59 @@
+import os
+import tempfile
+import uuid
+
+# The app reads its settings at import time: point it at a scratch database
+# (and one worker, unbuffered activities) before anything imports it
+_scratch = tempfile.mkdtemp(prefix="inkle-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'test.db')}"
+os.environ["WEB_CONCURRENCY"] = "1"
+os.environ["ACTIVITY_BUFFERED"] = "0"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Each module gets its own startup, so in-memory indexes are warm
+    from main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db():
+    with SessionLocal() as session:
+        yield session
+
+
+def _signup(client, name: str) -> dict:
+    """
+    Creates a user with a unique email and logs them in. Returns their id,
+    bearer headers and refresh token.
+    """
+    email = f"{name}-{uuid.uuid4().hex[:8]}@example.com"
+    password = "password123"
+
+    created = client.post("/auth/signup", json={"name": name, "email": email, "password": password})
+    assert created.status_code == 201, created.text
+
+    tokens = client.post("/auth/login", data={"username": email, "password": password})
+    assert tokens.status_code == 200, tokens.text
+    tokens = tokens.json()
+
+    return {
+        "id": created.json()["id"],
+        "email": email,
+        "password": password,
+        "headers": {"Authorization": f"Bearer {tokens['access_token']}"},
+        "refresh_token": tokens["refresh_token"],
+    }
+
+
+@pytest.fixture(scope="module")
+def make_user(client):
+    return lambda name="user": _signup(client, name)
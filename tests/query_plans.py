@@ -0,0 +1,289 @@
+"""
+Query plan check for every statement the routers issue.
+
+Seeds a scratch SQLite database, runs each router code path against it while
+recording the SQL it sends, then runs EXPLAIN QUERY PLAN on every statement.
+Any `SCAN <table>` fails the check -- including a full walk of an index --
+unless it is one of the reviewed keyset walks below, so a dropped or
+mismatched index shows up before it reaches production.
+
+    python -m pytest tests/test_query_plans.py   # runs with the test suite
+    python -m tests.query_plans                  # exit status 1 on any table scan
+    python -m tests.query_plans --verbose        # print every plan
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session as OrmSession, sessionmaker
+
+from app.database import Base
+from app.feed_groups import rebuild_groups
+from app.models import Activity, Block, Follow, Like, Post, RefreshToken, TimelineEntry, User
+from app.principal_cache import Principal
+from app.search import ensure_search_index
+from app.security import hash_refresh_token
+from app.trending import TrendingIndex
+
+
+# Tables a scenario may read in full, by design. reconcile_counters visits
+# every post and user once; its per-row counts must still use an index.
+ALLOWED_SCANS = {
+    "reconcile_counters": {"posts", "users"},
+}
+
+# Keyset pages walk these indexes newest-first and stop after LIMIT rows
+ORDERED_WALKS = {
+    ("activities", "ix_activities_created_at_id"),
+    ("posts", "ix_posts_created_at_id"),
+    ("activity_groups", "ix_activity_groups_last_activity_id"),
+    ("posts", "ix_posts_trending_score"),
+}
+
+SCAN = re.compile(r"\bSCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?")
+
+
+# -------------------------------
+# Seed data
+# -------------------------------
+
+def seed(engine, users=300, posts_per_user=4, follows_per_user=15, seed=13):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    user_ids = range(1, users + 1)
+
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "name": f"user{i}", "email": f"user{i}@example.com", "password_hash": "x"}
+            for i in user_ids
+        ])
+        conn.execute(Post.__table__.insert(), [
+            {"user_id": i, "content": f"post {n} by {i}", "created_at": now - timedelta(minutes=rng.randint(0, 10000))}
+            for i in user_ids for n in range(posts_per_user)
+        ])
+
+        pairs = {(i, rng.choice(user_ids)) for i in user_ids for _ in range(follows_per_user)}
+        pairs = [(a, b) for a, b in pairs if a != b]
+        conn.execute(Follow.__table__.insert(), [{"follower_id": a, "following_id": b} for a, b in pairs])
+        conn.execute(Block.__table__.insert(), [
+            {"blocker_id": a, "blocked_user_id": b} for a, b in rng.sample(pairs, len(pairs) // 20)
+        ])
+        conn.execute(Like.__table__.insert(), [
+            {"user_id": i, "post_id": p}
+            for i, p in {(rng.choice(user_ids), rng.randint(1, users * posts_per_user)) for _ in range(users * 10)}
+        ])
+        conn.execute(Activity.__table__.insert(), [
+            {"actor_id": rng.choice(user_ids), "verb": "POST_CREATED", "object_type": "post",
+             "object_id": n, "target_user_id": None, "created_at": now - timedelta(seconds=n)}
+            if n % 3 else
+            {"actor_id": rng.choice(user_ids), "verb": "LIKED", "object_type": "post",
+             "object_id": n, "target_user_id": rng.choice(user_ids), "created_at": now - timedelta(seconds=n)}
+            for n in range(1, users * 10)
+        ])
+        conn.execute(TimelineEntry.__table__.insert(), [
+            {"user_id": rng.choice(user_ids), "activity_id": n, "actor_id": rng.choice(user_ids)}
+            for n in range(1, users * 10)
+        ])
+        conn.execute(RefreshToken.__table__.insert(), [
+            {"user_id": i, "token_hash": hash_refresh_token(f"token-{i}"), "family_id": f"family-{i}",
+             "expires_at": now + timedelta(days=1)}
+            for i in user_ids
+        ])
+
+    with OrmSession(engine) as db:
+        rebuild_groups(db)
+        # Backfills posts.trending_score from the likes
+        scores = TrendingIndex()
+        scores.warm(db)
+        scores.checkpoint(lambda: OrmSession(engine))
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+
+
+# -------------------------------
+# Router code paths
+# -------------------------------
+
+def scenarios():
+    """
+    (name, fn(db)) pairs covering every router helper that touches the database.
+    Imported lazily so the routers pick up the scratch session only.
+    """
+    from app.auth_utils import _load_principal
+    from app.counters import reconcile_counters
+    from app.routers.admin import _delete_user, _promote_to_admin
+    from app.routers.auth import _create_user, _get_user_by_email, _logout, _rotate_refresh_token, _start_session
+    from app.routers.block import _block_user, _unblock_user
+    from app.routers.feed import _get_activity_feed, _get_grouped_feed, _get_home_timeline
+    from app.routers.follow import _follow_user, _unfollow_user
+    from app.routers.like import _like_post, _unlike_post
+    from app.routers.posts import (
+        POST_FIELDS, _create_post, _delete_post, _get_all_posts, _get_trending_posts, _search_posts,
+    )
+    from app.routers.users import _followers_query, _following_query, _mutuals_query, _page_from_db
+    from app.retention import archive_activities, compact_pairs, prune_refresh_tokens, trim_oversized_inboxes
+    from app.schemas import UserCreate
+    from app.user_deletion import run_job
+
+    def delete_user(db):
+        job = _delete_user(db, 12, admin)
+        run_job(job["job_id"], chunk_size=50, pause=0,
+                session_factory=lambda: OrmSession(bind=db.get_bind(), autoflush=False))
+
+    def archive(db):
+        with tempfile.TemporaryDirectory() as archive_dir:
+            archive_activities(db, 0, archive_dir, batch_size=500, pause=0)
+
+    me = Principal(1, "user1", "user", True)
+    admin = Principal(2, "user2", "admin", True)
+    keyset = (datetime.utcnow() - timedelta(days=1), 10 ** 6)
+
+    return [
+        ("load_principal", lambda db: _load_principal(db, 1)),
+        ("signup", lambda db: _create_user(db, UserCreate(name="n", email="new@example.com", password="pw"), "x")),
+        ("login_lookup", lambda db: _get_user_by_email(db, "user3@example.com")),
+        ("login_session", lambda db: _start_session(db, 3, "rehashed")),
+        ("refresh", lambda db: _rotate_refresh_token(db, "token-4")),
+        ("logout", lambda db: _logout(db, "token-5")),
+        ("create_post", lambda db: _create_post(db, "hello", me)),
+        ("list_posts", lambda db: _get_all_posts(db, 1, 20, None, None, list(POST_FIELDS))),
+        ("list_posts_next_page", lambda db: _get_all_posts(db, 1, 20, keyset, None, list(POST_FIELDS))),
+        ("list_posts_by_author", lambda db: _get_all_posts(db, 1, 20, keyset, 7, list(POST_FIELDS))),
+        ("search_posts", lambda db: _search_posts(db, 1, '"post"', 20, None)),
+        ("search_posts_next_page", lambda db: _search_posts(db, 1, '"by"*', 20, (-0.5, 100))),
+        ("trending_posts", lambda db: _get_trending_posts(db, 1, 20)),
+        ("delete_post", lambda db: _delete_post(db, 1, me)),
+        ("like", lambda db: _like_post(db, 40, me)),
+        ("like_refused", lambda db: _like_post(db, 40, me)),
+        ("unlike", lambda db: _unlike_post(db, 40, me)),
+        ("follow", lambda db: _follow_user(db, 250, me)),
+        ("follow_refused", lambda db: _follow_user(db, 250, me)),
+        ("unfollow", lambda db: _unfollow_user(db, 250, me)),
+        ("block", lambda db: _block_user(db, 251, me)),
+        ("unblock", lambda db: _unblock_user(db, 251, me)),
+        ("followers", lambda db: _page_from_db(db, _followers_query, 3, 20, 20)),
+        ("following", lambda db: _page_from_db(db, _following_query, 3, 20, 0)),
+        ("mutuals", lambda db: _page_from_db(db, _mutuals_query, 3, 20, 0)),
+        ("activity_feed", lambda db: _get_activity_feed(db, 1, 20, None)),
+        ("home_timeline", lambda db: _get_home_timeline(db, 1, 20, None)),
+        ("home_timeline_next_page", lambda db: _get_home_timeline(db, 1, 20, 1000)),
+        ("grouped_feed", lambda db: _get_grouped_feed(db, 1, 20, None)),
+        ("grouped_feed_next_page", lambda db: _get_grouped_feed(db, 1, 20, 1000)),
+        ("promote", lambda db: _promote_to_admin(db, 9)),
+        ("delete_user", delete_user),
+        ("reconcile_counters", lambda db: reconcile_counters(db)),
+        ("retention_compact", lambda db: compact_pairs(db, batch_size=100, pause=0)),
+        ("retention_inboxes", lambda db: trim_oversized_inboxes(db, batch_size=100, pause=0)),
+        ("retention_refresh_tokens", lambda db: prune_refresh_tokens(db, batch_size=100, pause=0)),
+        ("retention_archive", archive),   # last: archives every activity
+    ]
+
+
+# -------------------------------
+# Plan check
+# -------------------------------
+
+@contextmanager
+def recording(engine):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            parameters = parameters[0]
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def table_scans(plan_rows, allowed=()) -> list:
+    """
+    Plan lines that walk a whole table or index. Scans of subqueries and
+    constant rows, the ORDERED_WALKS and `allowed` tables are fine.
+    """
+    tables = Base.metadata.tables
+    return [
+        detail for *_, detail in plan_rows
+        if (m := SCAN.search(detail))
+        and m.group(1) in tables
+        and m.group(1) not in allowed
+        and m.groups() not in ORDERED_WALKS
+    ]
+
+
+def check(verbose: bool = False) -> list:
+    """
+    Returns (scenario, statement, offending plan lines) for every failure.
+    """
+    # The check runs the SQL paths; warm in-memory indexes would replace some of them
+    from app.social_graph import social_graph
+    from app.trending import trending
+    social_graph.ready = False
+    trending.ready = False
+
+    failures = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'plans.db')}")
+        Base.metadata.create_all(bind=engine)
+        ensure_search_index(engine)
+        seed(engine)
+        Session = sessionmaker(bind=engine, autoflush=False)
+
+        for name, fn in scenarios():
+            with Session() as db, recording(engine) as statements:
+                try:
+                    fn(db)
+                except HTTPException:
+                    pass    # refusals still issue (and must plan) their queries
+
+            with engine.connect() as conn:
+                for statement, parameters in statements:
+                    if not statement.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+                        continue
+                    plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+                    scans = table_scans(plan, ALLOWED_SCANS.get(name, ()))
+
+                    if verbose or scans:
+                        print(f"-- {name}")
+                        print("   " + " ".join(statement.split()))
+                        for *_, detail in plan:
+                            print(f"     {detail}")
+
+                    if scans:
+                        failures.append((name, statement, scans))
+
+        engine.dispose()
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="print every statement and its plan")
+    args = parser.parse_args()
+
+    failures = check(args.verbose)
+
+    if failures:
+        print(f"\n{len(failures)} statement(s) scan a whole table:")
+        for name, _, scans in failures:
+            print(f"  {name}: {'; '.join(scans)}")
+        sys.exit(1)
+
+    print("All router queries use indexes.")
+
+
+if __name__ == "__main__":
+    main()
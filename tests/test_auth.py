@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+from app.models import RefreshToken, User
+from app.security import hash_refresh_token
+
+
+def _refresh(client, token: str):
+    return client.post("/auth/refresh", json={"refresh_token": token})
+
+
+def test_refresh_rotates_the_token(client, make_user):
+    user = make_user()
+
+    response = _refresh(client, user["refresh_token"])
+    assert response.status_code == 200
+    rotated = response.json()["refresh_token"]
+    assert rotated != user["refresh_token"]
+
+    assert _refresh(client, rotated).status_code == 200
+
+
+def test_reusing_a_rotated_token_revokes_the_family(client, db, make_user):
+    user = make_user()
+    rotated = _refresh(client, user["refresh_token"]).json()["refresh_token"]
+
+    reused = _refresh(client, user["refresh_token"])
+    assert reused.status_code == 401
+    assert reused.json()["detail"] == "Refresh token has been revoked"
+
+    # The token issued by the legitimate rotation goes with it
+    assert _refresh(client, rotated).status_code == 401
+    family = db.query(RefreshToken).filter(RefreshToken.user_id == user["id"]).all()
+    assert family and all(record.revoked_at is not None for record in family)
+
+
+def test_expired_refresh_token_is_refused(client, db, make_user):
+    user = make_user()
+    db.query(RefreshToken).filter(
+        RefreshToken.token_hash == hash_refresh_token(user["refresh_token"])
+    ).update({RefreshToken.expires_at: datetime.utcnow() - timedelta(minutes=1)})
+    db.commit()
+
+    response = _refresh(client, user["refresh_token"])
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Refresh token has expired"
+
+
+def test_deactivated_user_gets_no_new_tokens(client, db, make_user):
+    user = make_user()
+    db.query(User).filter(User.id == user["id"]).update({User.is_active: False})
+    db.commit()
+
+    response = _refresh(client, user["refresh_token"])
+    assert response.status_code == 401
+
+    login = client.post("/auth/login", data={"username": user["email"], "password": user["password"]})
+    assert login.status_code == 403
+    assert login.json()["detail"] == "Account is deactivated"
+
+
+def test_logout_revokes_the_refresh_token(client, make_user):
+    user = make_user()
+
+    assert client.post("/auth/logout", json={"refresh_token": user["refresh_token"]}).status_code == 200
+    assert _refresh(client, user["refresh_token"]).status_code == 401
@@ -0,0 +1,134 @@
+from sqlalchemy import text
+
+from app.database import init_db
+from app.models import Follow, Like, Post, User
+
+
+def _create_post(client, author) -> int:
+    response = client.post("/posts/", params={"content": "hello"}, headers=author["headers"])
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def _like_count(db, post_id: int) -> int:
+    db.expire_all()
+    return db.get(Post, post_id).like_count
+
+
+def _follow_counts(db, user_id: int):
+    db.expire_all()
+    user = db.get(User, user_id)
+    return user.follower_count, user.following_count
+
+
+# -------------------------------
+# Likes
+# -------------------------------
+
+def test_double_like_is_refused_and_counted_once(client, db, make_user):
+    author, fan = make_user("author"), make_user("fan")
+    post_id = _create_post(client, author)
+
+    assert client.post(f"/like/{post_id}", headers=fan["headers"]).status_code == 201
+
+    again = client.post(f"/like/{post_id}", headers=fan["headers"])
+    assert again.status_code == 400
+    assert again.json()["detail"] == "Post already liked."
+    assert _like_count(db, post_id) == 1
+    assert db.query(Like).filter(Like.post_id == post_id).count() == 1
+
+
+def test_like_refusals_are_diagnosed(client, make_user):
+    author, fan = make_user("author"), make_user("fan")
+    post_id = _create_post(client, author)
+
+    assert client.post("/like/999999", headers=fan["headers"]).status_code == 404
+    assert client.post(f"/like/{post_id}", headers=author["headers"]).status_code == 400
+
+
+def test_like_of_a_blocking_author_is_forbidden(client, db, make_user):
+    author, fan = make_user("author"), make_user("fan")
+    post_id = _create_post(client, author)
+
+    assert client.post(f"/block/{fan['id']}", headers=author["headers"]).status_code == 201
+
+    response = client.post(f"/like/{post_id}", headers=fan["headers"])
+    assert response.status_code == 403
+    assert _like_count(db, post_id) == 0
+
+
+def test_unlike_without_a_like_is_refused(client, db, make_user):
+    author, fan = make_user("author"), make_user("fan")
+    post_id = _create_post(client, author)
+
+    response = client.delete(f"/like/{post_id}", headers=fan["headers"])
+    assert response.status_code == 400
+    assert response.json()["detail"] == "You have not liked this post."
+
+    assert client.post(f"/like/{post_id}", headers=fan["headers"]).status_code == 201
+    assert client.delete(f"/like/{post_id}", headers=fan["headers"]).status_code == 200
+    assert client.delete(f"/like/{post_id}", headers=fan["headers"]).status_code == 400
+    assert _like_count(db, post_id) == 0
+
+
+# -------------------------------
+# Follows and blocks
+# -------------------------------
+
+def test_follow_and_unfollow_keep_counters(client, db, make_user):
+    alice, bob = make_user("alice"), make_user("bob")
+
+    assert client.post(f"/follow/{bob['id']}", headers=alice["headers"]).status_code == 201
+    again = client.post(f"/follow/{bob['id']}", headers=alice["headers"])
+    assert again.status_code == 400
+    assert _follow_counts(db, alice["id"]) == (0, 1)
+    assert _follow_counts(db, bob["id"]) == (1, 0)
+
+    assert client.delete(f"/follow/{bob['id']}", headers=alice["headers"]).status_code == 200
+    assert client.delete(f"/follow/{bob['id']}", headers=alice["headers"]).status_code == 400
+    assert _follow_counts(db, alice["id"]) == (0, 0)
+    assert _follow_counts(db, bob["id"]) == (0, 0)
+
+
+def test_follow_refusals_are_diagnosed(client, make_user):
+    alice = make_user("alice")
+
+    assert client.post(f"/follow/{alice['id']}", headers=alice["headers"]).status_code == 400
+    assert client.post("/follow/999999", headers=alice["headers"]).status_code == 404
+
+
+def test_block_is_idempotent_and_drops_the_blocked_users_follow(client, db, make_user):
+    alice, bob = make_user("alice"), make_user("bob")
+    assert client.post(f"/follow/{alice['id']}", headers=bob["headers"]).status_code == 201
+
+    assert client.post(f"/block/{bob['id']}", headers=alice["headers"]).status_code == 201
+    again = client.post(f"/block/{bob['id']}", headers=alice["headers"])
+    assert again.status_code == 400
+    assert again.json()["detail"] == "User already blocked."
+
+    assert db.query(Follow).filter(Follow.follower_id == bob["id"]).count() == 0
+    assert _follow_counts(db, alice["id"]) == (0, 0)
+    assert _follow_counts(db, bob["id"]) == (0, 0)
+
+
+# -------------------------------
+# Upgrading a database with duplicates
+# -------------------------------
+
+def test_init_db_drops_duplicate_likes_and_reconciles_counts(client, db, make_user):
+    author, fan = make_user("author"), make_user("fan")
+    post_id = _create_post(client, author)
+    assert client.post(f"/like/{post_id}", headers=fan["headers"]).status_code == 201
+
+    # A database from before the unique index, holding a double-like
+    db.execute(text("DROP INDEX uq_likes_user_id_post_id"))
+    db.execute(text("INSERT INTO likes (user_id, post_id) VALUES (:user_id, :post_id)"),
+               {"user_id": fan["id"], "post_id": post_id})
+    db.execute(text("UPDATE posts SET like_count = 2 WHERE id = :post_id"), {"post_id": post_id})
+    db.commit()
+
+    init_db()
+
+    assert db.query(Like).filter(Like.post_id == post_id).count() == 1
+    assert _like_count(db, post_id) == 1
+    assert client.post(f"/like/{post_id}", headers=fan["headers"]).status_code == 400
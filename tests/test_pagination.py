@@ -0,0 +1,111 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app.models import Activity, Post
+from app.pagination import decode_timestamp_cursor, encode_cursor
+from app.write_versions import ACTIVITIES, POSTS, bump_version
+
+# Newer than anything else in the database, so these rows lead every listing.
+# Timestamp keeps whole seconds only: every row below shares one created_at.
+SECOND = datetime(2099, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture(scope="module")
+def reader(make_user):
+    return make_user("reader")
+
+
+def _pages(client, user, path: str, limit: int, **params) -> list:
+    """
+    Every page of `path`, following next_cursor; returns the pages' items.
+    """
+    pages, cursor = [], None
+    while True:
+        response = client.get(path, params={**params, "limit": limit, **({"cursor": cursor} if cursor else {})},
+                              headers=user["headers"])
+        assert response.status_code == 200, response.text
+        page = response.json()
+        pages.append(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def _malformed(cursor_values) -> str:
+    raw = json.dumps(cursor_values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    assert decode_timestamp_cursor(encode_cursor(SECOND, 42)) == (SECOND, 42)
+
+
+def test_posts_sharing_one_second_page_without_gaps_or_repeats(client, db, make_user):
+    author = make_user("author")
+    posts = [Post(user_id=author["id"], content=f"post {n}", created_at=SECOND) for n in range(7)]
+    db.add_all(posts)
+    bump_version(db, POSTS)
+    db.commit()
+
+    pages = _pages(client, author, "/posts/", 3, author_id=author["id"])
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    seen = [item["id"] for page in pages for item in page]
+    assert seen == sorted((post.id for post in posts), reverse=True)
+
+
+def test_feed_activities_sharing_one_second_page_without_gaps_or_repeats(client, db, make_user):
+    actor = make_user("actor")
+    activities = [
+        Activity(actor_id=actor["id"], verb="POST_CREATED", object_type="post", object_id=n, created_at=SECOND)
+        for n in range(5)
+    ]
+    db.add_all(activities)
+    bump_version(db, ACTIVITIES)
+    db.commit()
+
+    pages = _pages(client, actor, "/feed/", 2)
+
+    seen = [item["id"] for page in pages for item in page]
+    assert len(seen) == len(set(seen))
+    assert seen[:5] == sorted((act.id for act in activities), reverse=True)
+
+
+def test_search_results_with_equal_scores_page_by_id(client, db, make_user):
+    author = make_user("author")
+    word = f"w{uuid.uuid4().hex[:10]}"
+    posts = [Post(user_id=author["id"], content=f"{word} again", created_at=SECOND) for _ in range(5)]
+    db.add_all(posts)
+    db.commit()
+
+    pages = _pages(client, author, "/posts/search", 2, q=word)
+
+    seen = [item["id"] for page in pages for item in page]
+    assert seen == sorted(post.id for post in posts)
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/posts/", {}),
+    ("/feed/", {}),
+    ("/feed/home", {}),
+    ("/feed/grouped", {}),
+    ("/posts/search", {"q": "post"}),
+])
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    "e30",                                   # {}: not a list
+    _malformed([]),                          # wrong size
+    _malformed(["yesterday", 1]),            # not a timestamp
+    _malformed(["2024-01-01T00:00:00", "x"]),
+    _malformed([None, None]),
+    _malformed(["x"]),
+])
+def test_malformed_cursor_is_a_bad_request(client, reader, path, params, cursor):
+    response = client.get(path, params={**params, "cursor": cursor}, headers=reader["headers"])
+
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid cursor."
@@ -0,0 +1,6 @@
+from tests.query_plans import check
+
+
+def test_router_queries_use_indexes():
+    # Each failure is (scenario, statement, plan lines that scan a whole table)
+    assert check() == []